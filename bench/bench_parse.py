@@ -0,0 +1,110 @@
+"""
+stream-json パースのベンチマーク
+記録したClaude CLIの出力（1行1イベント）を、旧実装（json.loads + イベントごとのjson.dumpsログ）と
+現在の実装（高速パス + 高速デコーダー + レベル判定付きログ）で処理し、1秒あたりの行数を比較する
+
+使い方:
+    python bench/bench_parse.py [記録ファイル] [--repeat N]
+記録ファイルを省略した場合は、トークンごとのテキストデルタ主体の合成ストリームを使う
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+from pathlib import Path
+
+# botディレクトリの親をsys.pathに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bot.claude.events import EventHandler
+from bot.claude.parser import JSON_BACKEND, decode, parse_text_delta
+
+
+def synthetic_stream(tokens: int = 20000) -> list:
+    """テキストデルタ主体の合成ストリームを作成（ツール呼び出しを200トークンごとに挟む）"""
+    lines = []
+    for i in range(tokens):
+        text = f"トークン{i} " if i % 3 else f"tok\"{i}\"\\n "
+        lines.append(json.dumps({
+            "type": "stream_event",
+            "event": {"type": "content_block_delta", "index": 0,
+                      "delta": {"type": "text_delta", "text": text}},
+            "session_id": "00000000-0000-0000-0000-000000000000",
+            "parent_tool_use_id": None,
+        }, ensure_ascii=False, separators=(",", ":")))
+        if i % 200 == 199:
+            lines.append(json.dumps({"type": "stream_event", "event": {
+                "type": "content_block_start", "index": 1,
+                "content_block": {"type": "tool_use", "name": "Bash", "id": f"t{i}"}}}))
+            lines.append(json.dumps({"type": "stream_event", "event": {
+                "type": "content_block_delta", "index": 1,
+                "delta": {"type": "input_json_delta", "partial_json": "{\"command\": \"ls\"}"}}}))
+            lines.append(json.dumps({"type": "stream_event", "event": {"type": "content_block_stop", "index": 1}}))
+    lines.append(json.dumps({"type": "result", "result": "done"}))
+    return lines
+
+
+def run_baseline(lines: list, sink: list):
+    """旧実装相当: 全行をjson.loadsし、生の行とイベント全体をINFOログ用に整形する"""
+    handler = EventHandler(sink.append, {}, [False])
+    for line in lines:
+        logging.info("RAW STDOUT: %s", line[:200])
+        evt = json.loads(line)
+        inner = evt.get("event", evt) if evt.get("type") == "stream_event" else evt
+        logging.info("Event type: %s, full event: %s", inner.get("type"), json.dumps(inner)[:300])
+        handler.handle_event(evt)
+
+
+def run_fast(lines: list, sink: list):
+    """現在の実装: ランナーと同じ処理順"""
+    handler = EventHandler(sink.append, {}, [False])
+    for line in lines:
+        logging.debug("RAW STDOUT: %.200s", line)
+        text = parse_text_delta(line)
+        if text is not None:
+            handler.handle_text_delta(text)
+            continue
+        handler.handle_event(decode(line))
+
+
+def measure(func, lines: list, repeat: int) -> tuple:
+    """最速の1回の所要時間と出力を返す"""
+    best = None
+    sink = []
+    for _ in range(repeat):
+        sink = []
+        started = time.perf_counter()
+        func(lines, sink)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, sink
+
+
+def main():
+    parser = argparse.ArgumentParser(description="stream-json パースのベンチマーク")
+    parser.add_argument("recording", nargs="?", help="記録したstream-json（1行1イベント）")
+    parser.add_argument("--repeat", type=int, default=5, help="繰り返し回数（最速値を採用）")
+    args = parser.parse_args()
+
+    if args.recording:
+        lines = [l.strip() for l in Path(args.recording).read_text(encoding="utf-8").splitlines() if l.strip()]
+    else:
+        lines = synthetic_stream()
+
+    # 本番と同じくINFOレベルで、出力先だけ捨てる
+    logging.basicConfig(level=logging.INFO, handlers=[logging.NullHandler()])
+
+    base_time, base_out = measure(run_baseline, lines, args.repeat)
+    fast_time, fast_out = measure(run_fast, lines, args.repeat)
+    if base_out != fast_out:
+        print("出力が一致しません", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"lines: {len(lines)}  decoder: {JSON_BACKEND}")
+    print(f"baseline: {len(lines) / base_time:12,.0f} lines/s")
+    print(f"fast:     {len(lines) / fast_time:12,.0f} lines/s  (x{base_time / fast_time:.1f})")
+
+
+if __name__ == "__main__":
+    main()
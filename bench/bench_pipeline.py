@@ -0,0 +1,161 @@
+"""
+ストリーミングパイプライン全体のベンチマーク
+記録を再生する偽のClaude CLI → EventHandler → 出力バッファ → 偽のSlackクライアント の経路を
+同時実行数を変えて動かし、イベント処理速度・最初の投稿までの時間・ジョブあたりのAPI呼び出し数・ピークメモリを測る
+
+使い方:
+    python bench/bench_pipeline.py [--recording 記録ファイル] [--jobs 1 10 100] [--speed 1] [--async]
+記録ファイルを省略した場合は合成記録を使う
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import threading
+import statistics
+import tracemalloc
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).parent
+
+# botディレクトリの親をsys.pathに追加
+sys.path.insert(0, str(BENCH_DIR.parent))
+
+# bot.config は読み込み時に環境変数を参照するため、先に偽のCLIとトークンを設定する
+os.environ["CLAUDE_BIN"] = str(BENCH_DIR / "fake_claude.py")
+os.environ.setdefault("SLACK_BOT_TOKEN", "xoxb-bench")
+os.environ.setdefault("SLACK_APP_TOKEN", "xapp-bench")
+
+from bench import recording
+from bench.fake_slack import FakeSlack, FakeRateLimitedWebClient, AsyncFakeRateLimitedWebClient
+from bot.utils.ratelimit import RateLimiter
+from bot.utils.buffer import OutputBuffer
+from bot.utils.async_buffer import AsyncOutputBuffer
+from bot.claude.runner import run_claude_streaming
+from bot.claude.async_runner import run_claude_streaming_async
+
+
+def run_sync_jobs(client, n: int) -> dict:
+    """n個のジョブをスレッドで同時に実行し、ジョブごとの開始時刻を返す"""
+    started = {}
+    active_processes, active_lock = {}, threading.Lock()
+
+    def job(i):
+        channel, thread_ts = f"C{i:04d}", f"{i}.000001"
+        started[thread_ts] = time.monotonic()
+        buffer = OutputBuffer(client, channel, thread_ts, True, time.time())
+        buffer.start_auto_flusher()
+        run_claude_streaming(
+            "bench", buffer.append_stdout, buffer.append_stderr,
+            thread_ts=thread_ts, message_stopped=buffer.message_stopped,
+            active_processes=active_processes, active_lock=active_lock,
+        )
+        buffer.stop_auto_flusher()
+        buffer.close()
+
+    threads = [threading.Thread(target=job, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return started
+
+
+def run_async_jobs(client, n: int) -> dict:
+    """n個のジョブを1つのイベントループで同時に実行し、ジョブごとの開始時刻を返す"""
+    started = {}
+
+    async def job(i):
+        channel, thread_ts = f"C{i:04d}", f"{i}.000001"
+        started[thread_ts] = time.monotonic()
+        buffer = AsyncOutputBuffer(client, channel, thread_ts, True, time.time())
+        buffer.start_auto_flusher()
+        await run_claude_streaming_async(
+            "bench", buffer.append_stdout, buffer.append_stderr,
+            thread_ts=thread_ts, message_stopped=buffer.message_stopped, active_processes={},
+        )
+        await buffer.stop_auto_flusher()
+        await buffer.flush()
+
+    async def main():
+        await asyncio.gather(*(job(i) for i in range(n)))
+
+    asyncio.run(main())
+    return started
+
+
+def bench(n: int, events_per_job: int, args) -> dict:
+    """同時実行数 n で1回計測"""
+    slack = FakeSlack(latency=args.latency, channel_limit=args.channel_limit, error_rate=args.error_rate)
+    rate_limiter = RateLimiter()
+    if args.use_async:
+        client = AsyncFakeRateLimitedWebClient(slack=slack, rate_limiter=rate_limiter)
+    else:
+        client = FakeRateLimitedWebClient(slack=slack, rate_limiter=rate_limiter)
+
+    tracemalloc.start()
+    t0 = time.monotonic()
+    started = (run_async_jobs if args.use_async else run_sync_jobs)(client, n)
+    wall = time.monotonic() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # 最初の投稿までの時間（ジョブ開始 → そのスレッドへの最初の chat.postMessage 完了）
+    first_post = {}
+    for at, method, call_args, status in slack.calls:
+        thread_ts = call_args.get("thread_ts")
+        if method == "chat.postMessage" and status == 200 and thread_ts in started and thread_ts not in first_post:
+            first_post[thread_ts] = at - started[thread_ts]
+    ttfp = sorted(first_post.values()) or [float("nan")]
+
+    return {
+        "jobs": n,
+        "wall": wall,
+        "events_per_sec": events_per_job * n / wall,
+        "ttfp_p50": statistics.median(ttfp),
+        "ttfp_p95": ttfp[min(len(ttfp) - 1, int(len(ttfp) * 0.95))],
+        "calls_per_job": len(slack.calls) / n,
+        "rate_limited": sum(1 for c in slack.calls if c[3] == 429),
+        "peak_mb": peak / 1024 / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ストリーミングパイプラインのベンチマーク")
+    parser.add_argument("--recording", help="再生する記録ファイル（省略時は合成記録）")
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 10, 100], help="同時実行数")
+    parser.add_argument("--speed", type=float, default=1.0, help="再生速度の倍率（0で待たずに出力）")
+    parser.add_argument("--latency", type=float, default=0.05, help="Slack APIの応答時間（秒）")
+    parser.add_argument("--channel-limit", type=float, default=1.0,
+                        help="chat.postMessage のチャンネルごとの上限（回/秒、0で無制限）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="ランダムに429を返す確率")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="asyncio版のランナー・バッファを使う")
+    parser.add_argument("--verbose", action="store_true", help="ボットのログを表示")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+
+    path = args.recording
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(prefix="claude-bench-"), "synthetic.jsonl")
+        recording.synthetic(path)
+    events_per_job = sum(1 for _, stream, _ in recording.load(path) if stream == "stdout")
+    os.environ["FAKE_CLAUDE_RECORDING"] = path
+    os.environ["FAKE_CLAUDE_SPEED"] = str(args.speed)
+
+    print(f"recording: {path} ({events_per_job} events/job)  mode: {'async' if args.use_async else 'threads'}")
+    print(f"{'jobs':>5} {'wall(s)':>8} {'events/s':>10} {'ttfp p50':>9} {'ttfp p95':>9} "
+          f"{'calls/job':>10} {'429s':>5} {'peak MB':>8}")
+    for n in args.jobs:
+        r = bench(n, events_per_job, args)
+        print(f"{r['jobs']:>5} {r['wall']:>8.2f} {r['events_per_sec']:>10,.0f} {r['ttfp_p50']:>9.3f} "
+              f"{r['ttfp_p95']:>9.3f} {r['calls_per_job']:>10.1f} {r['rate_limited']:>5} {r['peak_mb']:>8.1f}")
+    print(f"max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
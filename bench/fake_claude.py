@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+記録を再生する偽のClaude CLI（CLAUDE_BIN に指定して使う）
+引数は無視し、FAKE_CLAUDE_RECORDING の記録を stdout / stderr に書き出す
+
+環境変数:
+    FAKE_CLAUDE_RECORDING: 記録ファイルのパス（必須）
+    FAKE_CLAUDE_SPEED: 再生速度の倍率（1で記録どおり、0で待たずに出力。デフォルト: 1）
+    FAKE_CLAUDE_EXIT_CODE: 終了コード（デフォルト: 0）
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+# botディレクトリの親をsys.pathに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bench.recording import load
+
+
+def main():
+    records = load(os.environ["FAKE_CLAUDE_RECORDING"])
+    speed = float(os.environ.get("FAKE_CLAUDE_SPEED", "1"))
+    started = time.monotonic()
+    for t, stream, line in records:
+        if speed > 0:
+            delay = t / speed - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        out = sys.stderr if stream == "stderr" else sys.stdout
+        out.write(line + "\n")
+        out.flush()
+    sys.exit(int(os.environ.get("FAKE_CLAUDE_EXIT_CODE", "0")))
+
+
+if __name__ == "__main__":
+    main()
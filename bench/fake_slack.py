@@ -0,0 +1,145 @@
+"""
+ローカルで動くSlack WebClientの代役
+呼び出しを記録し、応答遅延と429（レート制限）を再現する
+"""
+import time
+import random
+import asyncio
+import itertools
+import threading
+
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.slack_response import SlackResponse
+from slack_sdk.web.async_client import AsyncWebClient
+from slack_sdk.web.async_slack_response import AsyncSlackResponse
+
+from bot.utils.ratelimit import RateLimitedWebClient, AsyncRateLimitedWebClient
+
+
+class FakeSlack:
+    """Slack側の振る舞い（遅延・429・呼び出し記録）。同期・非同期のクライアントで共有できる"""
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.5, channel_limit: float = 0.0,
+                 channel_burst: float = 3.0, error_rate: float = 0.0, retry_after: float = 1.0):
+        """
+        Args:
+            latency: 1回の呼び出しにかかる秒数
+            jitter: 遅延のばらつき（latency に対する割合）
+            channel_limit: chat.postMessage のチャンネルごとの上限（回/秒、0なら無制限）。超えると429を返す
+            channel_burst: 上限を超えて許容する短いバーストの回数
+            error_rate: ランダムに429を返す確率
+            retry_after: 429で返す Retry-After の秒数
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.channel_limit = channel_limit
+        self.channel_burst = channel_burst
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+
+        self.calls = []  # (monotonic時刻, メソッド, 引数, ステータス)
+        self._lock = threading.Lock()
+        self._ts = itertools.count(1)
+        self._allowance = {}  # channel -> (残り回数, 更新時刻)
+
+    def delay(self) -> float:
+        """今回の呼び出しの遅延秒数"""
+        return max(0.0, self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def handle(self, api_method: str, kwargs: dict) -> tuple:
+        """
+        呼び出しを記録して応答を作る
+
+        Returns:
+            (data, headers, status_code)
+        """
+        args = kwargs.get("json") or kwargs.get("params") or kwargs.get("data") or {}
+        now = time.monotonic()
+        with self._lock:
+            limited = random.random() < self.error_rate
+            if api_method == "chat.postMessage" and self.channel_limit > 0:
+                channel = args.get("channel")
+                allowance, updated = self._allowance.get(channel, (self.channel_burst, now))
+                allowance = min(self.channel_burst, allowance + (now - updated) * self.channel_limit)
+                if allowance < 1:
+                    limited = True
+                else:
+                    allowance -= 1
+                self._allowance[channel] = (allowance, now)
+            self.calls.append((now, api_method, dict(args), 429 if limited else 200))
+            ts = f"{int(time.time())}.{next(self._ts):06d}"
+
+        if limited:
+            return {"ok": False, "error": "ratelimited"}, {"Retry-After": str(self.retry_after)}, 429
+
+        data = {"ok": True}
+        if api_method == "chat.postMessage":
+            data.update(ts=ts, channel=args.get("channel"),
+                        message={"ts": ts, "text": args.get("text", ""), "bot_id": "BFAKE"})
+        elif api_method == "chat.update":
+            data.update(ts=args.get("ts"), channel=args.get("channel"))
+        elif api_method == "auth.test":
+            data.update(user_id="UFAKE", bot_id="BFAKE", team_id="TFAKE", team="fake", url="")
+        return data, {}, 200
+
+    def calls_for(self, method: str | None = None, channel: str | None = None) -> list:
+        """条件に合う呼び出し記録を取得"""
+        with self._lock:
+            return [
+                c for c in self.calls
+                if (method is None or c[1] == method) and (channel is None or c[2].get("channel") == channel)
+            ]
+
+
+class FakeWebClient(WebClient):
+    """ネットワークに出ずに FakeSlack の応答を返す WebClient"""
+
+    def __init__(self, slack: FakeSlack | None = None, **kwargs):
+        """
+        Args:
+            slack: 応答を作る FakeSlack（省略時はデフォルト設定で作成）
+            その他の引数は WebClient と同じ
+        """
+        kwargs.setdefault("token", "xoxb-fake")
+        super().__init__(**kwargs)
+        self.slack = slack or FakeSlack()
+
+    def api_call(self, api_method: str, **kwargs):
+        time.sleep(self.slack.delay())
+        data, headers, status_code = self.slack.handle(api_method, kwargs)
+        response = SlackResponse(
+            client=self, http_verb="POST", api_url=f"{self.base_url}{api_method}",
+            req_args={}, data=data, headers=headers, status_code=status_code,
+        )
+        if status_code != 200:
+            raise SlackApiError(data.get("error", "error"), response)
+        return response
+
+
+class AsyncFakeWebClient(AsyncWebClient):
+    """ネットワークに出ずに FakeSlack の応答を返す AsyncWebClient"""
+
+    def __init__(self, slack: FakeSlack | None = None, **kwargs):
+        kwargs.setdefault("token", "xoxb-fake")
+        super().__init__(**kwargs)
+        self.slack = slack or FakeSlack()
+
+    async def api_call(self, api_method: str, **kwargs):
+        await asyncio.sleep(self.slack.delay())
+        data, headers, status_code = self.slack.handle(api_method, kwargs)
+        response = AsyncSlackResponse(
+            client=self, http_verb="POST", api_url=f"{self.base_url}{api_method}",
+            req_args={}, data=data, headers=headers, status_code=status_code,
+        )
+        if status_code != 200:
+            raise SlackApiError(data.get("error", "error"), response)
+        return response
+
+
+class FakeRateLimitedWebClient(RateLimitedWebClient, FakeWebClient):
+    """本番と同じレート制限・再試行層を通して FakeWebClient を呼ぶクライアント"""
+
+
+class AsyncFakeRateLimitedWebClient(AsyncRateLimitedWebClient, AsyncFakeWebClient):
+    """本番と同じレート制限・再試行層を通して AsyncFakeWebClient を呼ぶクライアント"""
@@ -0,0 +1,59 @@
+"""
+Claude CLIの出力を記録するスクリプト
+ボットと同じ引数でClaude CLIを実行し、stream-jsonの出力を時刻つきで保存する
+
+使い方:
+    python bench/record.py -o bench/recordings/sample.jsonl "プロンプト"
+"""
+import sys
+import argparse
+import threading
+from pathlib import Path
+from subprocess import Popen, PIPE
+
+# botディレクトリの親をsys.pathに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bot.config import DEFAULT_CWD
+from bot.claude.runner import build_claude_args, build_claude_env
+from bench.recording import Recorder
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Claude CLIの出力を記録")
+    parser.add_argument("prompt", help="Claude CLIに渡すプロンプト")
+    parser.add_argument("-o", "--output", required=True, help="記録ファイルの保存先")
+    parser.add_argument("--cwd", default=DEFAULT_CWD, help="Claude CLIの作業ディレクトリ")
+    args = parser.parse_args()
+
+    proc = Popen(
+        build_claude_args(args.prompt),
+        cwd=args.cwd,
+        env=build_claude_env(),
+        stdout=PIPE,
+        stderr=PIPE,
+        text=True,
+        bufsize=1,
+    )
+    lock = threading.Lock()
+    with Recorder(args.output) as recorder:
+        def drain_stderr():
+            for line in proc.stderr:
+                with lock:
+                    recorder.write(line, "stderr")
+
+        t = threading.Thread(target=drain_stderr, daemon=True)
+        t.start()
+        lines = 0
+        for line in proc.stdout:
+            with lock:
+                recorder.write(line)
+            lines += 1
+        proc.wait()
+        t.join(timeout=5)
+
+    print(f"{lines} lines recorded to {args.output} (exit code {proc.returncode})")
+
+
+if __name__ == "__main__":
+    main()
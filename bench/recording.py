@@ -0,0 +1,87 @@
+"""
+Claude CLI出力の記録ファイル
+1行1レコードのJSONL形式: {"t": 開始からの秒数, "stream": "stdout" | "stderr", "line": 出力行}
+"""
+import json
+import time
+from pathlib import Path
+
+
+class Recorder:
+    """Claude CLIの出力行を時刻つきでファイルに書き出すクラス"""
+
+    def __init__(self, path):
+        """
+        Args:
+            path: 書き出し先のパス
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._started = time.monotonic()
+
+    def write(self, line: str, stream: str = "stdout"):
+        """1行を記録"""
+        record = {"t": round(time.monotonic() - self._started, 4), "stream": stream, "line": line.rstrip("\n")}
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load(path) -> list:
+    """
+    記録ファイルを読み込む
+
+    Args:
+        path: 記録ファイルのパス
+
+    Returns:
+        (秒数, ストリーム名, 行) のリスト
+    """
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for raw in f:
+            if raw.strip():
+                r = json.loads(raw)
+                records.append((float(r["t"]), r.get("stream", "stdout"), r["line"]))
+    return records
+
+
+def synthetic(path, tokens: int = 400, interval: float = 0.01, tool_every: int = 50):
+    """
+    テキストデルタ主体の合成記録を作成（実機の記録がないとき用）
+
+    Args:
+        path: 書き出し先のパス
+        tokens: テキストデルタの数
+        interval: トークン間隔（秒）
+        tool_every: 何トークンごとにツール呼び出しを挟むか
+    """
+    def event(evt):
+        return json.dumps({"type": "stream_event", "event": evt}, ensure_ascii=False, separators=(",", ":"))
+
+    t = 0.0
+    with open(path, "w", encoding="utf-8") as f:
+        def put(line, stream="stdout"):
+            f.write(json.dumps({"t": round(t, 4), "stream": stream, "line": line}, ensure_ascii=False) + "\n")
+
+        put("starting session", "stderr")
+        for i in range(tokens):
+            t += interval
+            put(event({"type": "content_block_delta", "index": 0,
+                       "delta": {"type": "text_delta", "text": f"token{i} "}}))
+            if i % tool_every == tool_every - 1:
+                put(event({"type": "content_block_start", "index": 1,
+                           "content_block": {"type": "tool_use", "name": "Bash", "id": f"toolu_{i}"}}))
+                put(event({"type": "content_block_delta", "index": 1,
+                           "delta": {"type": "input_json_delta", "partial_json": "{\"command\": \"ls\"}"}}))
+                put(event({"type": "content_block_stop", "index": 1}))
+        t += interval
+        put(json.dumps({"type": "result", "result": "synthetic final output"}))
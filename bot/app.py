@@ -2,13 +2,13 @@
 Slack Bot メインアプリケーション
 """
 import ssl
+import atexit
 import certifi
 import logging
 import threading
 
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
-from slack_sdk import WebClient
 
 import sys
 from pathlib import Path
@@ -16,30 +16,115 @@ from pathlib import Path
 # botディレクトリの親をsys.pathに追加
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from bot.config import SLACK_BOT_TOKEN, SLACK_APP_TOKEN, DEFAULT_CWD
+from bot.config import (
+    SLACK_BOT_TOKEN, SLACK_APP_TOKEN, DEFAULT_CWD,
+    ROUTES_FILE, JOB_STORE_PATH, NODE_ID, JOB_POLL_INTERVAL, NODE_TIMEOUT, NODE_ORPHAN_TIMEOUT,
+    HISTORY_DB_PATH, HISTORY_CACHE_MAX_THREADS, EVENT_DEDUPE_TTL, EVENT_DEDUPE_PATH,
+    RESULT_CACHE_TTL, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_WAIT_TIMEOUT, SCREENSHOT_CACHE_DIR, SCREENSHOT_CACHE_MAX_MB,
+    METRICS_HOST, METRICS_PORT,
+    CLAUDE_POOL_SIZE, CLAUDE_POOL_MAX_IDLE, SESSION_MAP_PATH,
+)
+from bot.utils.ratelimit import RateLimitedWebClient
+from bot.utils.history_store import HistoryStore
+from bot.utils.dedupe import EventDeduplicator
+from bot.utils.identity import BotIdentity
+from bot.utils.session import SessionMap
+from bot.utils import metrics
+from bot.claude.scheduler import JobScheduler
+from bot.claude.routes import load_router
+from bot.claude.result_cache import ResultCache
+from bot.claude.distributed import SharedJobStore, DistributedJobScheduler
+from bot.claude.pool import ClaudeProcessPool
+from bot.claude.process import stop_all
+from bot.screenshot.cache import ScreenshotCache
 from bot.handlers.message import create_mention_handler
 
 logging.basicConfig(level=logging.INFO)
 
-# Slack クライアント初期化
+# Slack クライアント初期化（全APIにレート制限と再試行をかける）
 ssl_ctx = ssl.create_default_context(cafile=certifi.where())
-client = WebClient(token=SLACK_BOT_TOKEN, ssl=ssl_ctx)
-app = App(client=client)
+client = RateLimitedWebClient(token=SLACK_BOT_TOKEN, ssl=ssl_ctx)
+# イベントは先にackしてからリスナーを実行する（リスナーの処理時間でSlackの再送を招かない）
+app = App(client=client, process_before_response=False)
 
 # グローバル状態管理
 active_processes: dict = {}
 active_lock = threading.RLock()
 stopped_threads: set = set()
+metrics.ACTIVE_PROCESSES.set_function(lambda: len(active_processes))
+# 終了時に実行中のClaude CLIとツールの子プロセスを残さない
+atexit.register(stop_all, active_processes)
+
+# 実行先（作業ディレクトリ）ごとのClaude実行ジョブのスケジューラー（同時実行数を制限）
+router = load_router(ROUTES_FILE)
+if JOB_STORE_PATH:
+    # 分散実行: キューを他のボットプロセスと共有し、空いているノードが実行する
+    job_store = SharedJobStore(JOB_STORE_PATH, NODE_ID, NODE_TIMEOUT, NODE_ORPHAN_TIMEOUT)
+    router.create_schedulers(
+        lambda max_workers, max_queue, name: DistributedJobScheduler(
+            job_store, name, max_workers, max_queue, name=name, poll_interval=JOB_POLL_INTERVAL
+        )
+    )
+    logging.info("Distributed mode: node=%s store=%s", NODE_ID, JOB_STORE_PATH)
+else:
+    router.create_schedulers(JobScheduler)
+
+# ボット情報（auth.test）は起動時に1回だけ取得し、以降はキャッシュを使う
+identity = BotIdentity(client)
+# トークンの失効・ローテーションで認証エラーになったら、次回アクセス時に取り直す
+client.on_auth_error = identity.invalidate
+
+# 会話履歴キャッシュ（差分同期で conversations.replies の取得量を減らす）
+history_store = HistoryStore(HISTORY_DB_PATH, HISTORY_CACHE_MAX_THREADS) if HISTORY_DB_PATH else None
+
+# 処理済みイベントの記録（Slackが再送したメンションでClaude CLIを重複して起動しない）
+dedupe = EventDeduplicator(EVENT_DEDUPE_TTL, EVENT_DEDUPE_PATH or None)
 
-# ハンドラー登録
-app.event("app_mention")(
-    create_mention_handler(client, active_processes, active_lock, stopped_threads)
+# 同じリポジトリの状態に対する同じ依頼の結果キャッシュ（任意）
+result_cache = (
+    ResultCache(RESULT_CACHE_TTL, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_WAIT_TIMEOUT) if RESULT_CACHE_TTL > 0 else None
 )
 
+# スクリーンショットのキャッシュ（内容の変わっていないファイルは撮影し直さない）
+screenshot_cache = (
+    ScreenshotCache(SCREENSHOT_CACHE_DIR, SCREENSHOT_CACHE_MAX_MB * 1024 * 1024, DEFAULT_CWD) if SCREENSHOT_CACHE_DIR else None
+)
+
+
+def main():
+    """プロセスプール・スケジューラー・メトリクスサーバーを起動してSocket Modeで接続（作業ディレクトリの確認後に呼ぶ）"""
+    # 起動済みClaude CLIのプール（起動時間を依頼の処理時間から外す）
+    pool = None
+    session_map = None
+    if CLAUDE_POOL_SIZE > 0:
+        pool = ClaudeProcessPool(CLAUDE_POOL_SIZE, CLAUDE_POOL_MAX_IDLE, DEFAULT_CWD)
+        session_map = SessionMap(SESSION_MAP_PATH or None)
+        metrics.POOL_IDLE.set_function(pool.idle_count)
+        atexit.register(pool.shutdown)
+
+    # ハンドラー登録
+    app.event("app_mention")(
+        create_mention_handler(
+            client, active_processes, active_lock, stopped_threads, router, identity, history_store,
+            pool, session_map, dedupe, result_cache, screenshot_cache,
+        )
+    )
+
+    for scheduler in router.schedulers:
+        scheduler.start()
+    identity.warmup()
+    metrics.start_metrics_server(METRICS_PORT, METRICS_HOST)
+
+    handler = SocketModeHandler(app, SLACK_APP_TOKEN, web_client=client)
+    handler.start()
+
+
 if __name__ == "__main__":
     # 作業ディレクトリの確認
     print(f"\n作業ディレクトリ: {DEFAULT_CWD}")
     print("このディレクトリでClaude CLIが実行されます。")
+    for route in router.routes:
+        print(f"  {route.name}: {route.cwd}（同時実行数 {route.max_concurrent}）")
     confirm = input("このディレクトリで実行しますか？ (y/n): ").strip().lower()
 
     if confirm != 'y':
@@ -49,5 +134,4 @@ if __name__ == "__main__":
 
     print("\nSlack Botを起動しています...\n")
 
-    handler = SocketModeHandler(app, SLACK_APP_TOKEN, web_client=client)
-    handler.start()
+    main()
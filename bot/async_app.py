@@ -0,0 +1,112 @@
+"""
+Slack Bot メインアプリケーション（asyncio版）
+1つのイベントループで全ジョブのClaude CLI入出力とSlack投稿を処理する
+"""
+import ssl
+import asyncio
+import certifi
+import logging
+
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+
+import sys
+from pathlib import Path
+
+# botディレクトリの親をsys.pathに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bot.config import (
+    SLACK_BOT_TOKEN, SLACK_APP_TOKEN, DEFAULT_CWD,
+    ROUTES_FILE,
+    HISTORY_DB_PATH, HISTORY_CACHE_MAX_THREADS, EVENT_DEDUPE_TTL, EVENT_DEDUPE_PATH,
+    RESULT_CACHE_TTL, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_WAIT_TIMEOUT, SCREENSHOT_CACHE_DIR, SCREENSHOT_CACHE_MAX_MB,
+    METRICS_HOST, METRICS_PORT,
+)
+from bot.utils.ratelimit import RateLimiter, RateLimitedWebClient, AsyncRateLimitedWebClient
+from bot.utils.history_store import HistoryStore
+from bot.utils.dedupe import EventDeduplicator
+from bot.utils.identity import BotIdentity
+from bot.utils import metrics
+from bot.claude.scheduler import AsyncJobScheduler
+from bot.claude.routes import load_router
+from bot.claude.result_cache import AsyncResultCache
+from bot.screenshot.cache import ScreenshotCache
+from bot.handlers.async_message import create_async_mention_handler
+
+logging.basicConfig(level=logging.INFO)
+
+# Slack クライアント初期化（同期・非同期で同じレートリミッターを共有）
+ssl_ctx = ssl.create_default_context(cafile=certifi.where())
+rate_limiter = RateLimiter()
+client = AsyncRateLimitedWebClient(token=SLACK_BOT_TOKEN, ssl=ssl_ctx, rate_limiter=rate_limiter)
+sync_client = RateLimitedWebClient(token=SLACK_BOT_TOKEN, ssl=ssl_ctx, rate_limiter=rate_limiter)
+# イベントは先にackしてからリスナーを実行する（リスナーの処理時間でSlackの再送を招かない）
+app = AsyncApp(client=client, process_before_response=False)
+
+# グローバル状態管理（イベントループ内でのみ操作するためロック不要）
+active_processes: dict = {}
+stopped_threads: set = set()
+metrics.ACTIVE_PROCESSES.set_function(lambda: len(active_processes))
+
+# 実行先（作業ディレクトリ）ごとのClaude実行ジョブのスケジューラー（同時実行数を制限）
+router = load_router(ROUTES_FILE)
+router.create_schedulers(AsyncJobScheduler)
+
+# ボット情報（auth.test）は起動時に1回だけ取得し、以降はキャッシュを使う
+identity = BotIdentity(sync_client)
+# トークンの失効・ローテーションで認証エラーになったら、次回アクセス時に取り直す
+client.on_auth_error = identity.invalidate
+sync_client.on_auth_error = identity.invalidate
+
+# 会話履歴キャッシュ（差分同期で conversations.replies の取得量を減らす）
+history_store = HistoryStore(HISTORY_DB_PATH, HISTORY_CACHE_MAX_THREADS) if HISTORY_DB_PATH else None
+
+# 処理済みイベントの記録（Slackが再送したメンションでClaude CLIを重複して起動しない）
+dedupe = EventDeduplicator(EVENT_DEDUPE_TTL, EVENT_DEDUPE_PATH or None)
+
+# 同じリポジトリの状態に対する同じ依頼の結果キャッシュ（任意）
+result_cache = (
+    AsyncResultCache(RESULT_CACHE_TTL, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_WAIT_TIMEOUT) if RESULT_CACHE_TTL > 0 else None
+)
+
+# スクリーンショットのキャッシュ（内容の変わっていないファイルは撮影し直さない）
+screenshot_cache = (
+    ScreenshotCache(SCREENSHOT_CACHE_DIR, SCREENSHOT_CACHE_MAX_MB * 1024 * 1024, DEFAULT_CWD) if SCREENSHOT_CACHE_DIR else None
+)
+
+# ハンドラー登録
+app.event("app_mention")(
+    create_async_mention_handler(
+        client, sync_client, active_processes, stopped_threads, router, identity, history_store, dedupe,
+        result_cache, screenshot_cache,
+    )
+)
+
+
+async def main():
+    """スケジューラーとメトリクスサーバーを起動してSocket Modeで接続（作業ディレクトリの確認後に呼ぶ）"""
+    for scheduler in router.schedulers:
+        scheduler.start()
+    await asyncio.to_thread(identity.warmup)
+    metrics.start_metrics_server(METRICS_PORT, METRICS_HOST)
+    handler = AsyncSocketModeHandler(app, SLACK_APP_TOKEN, web_client=client)
+    await handler.start_async()
+
+
+if __name__ == "__main__":
+    # 作業ディレクトリの確認
+    print(f"\n作業ディレクトリ: {DEFAULT_CWD}")
+    print("このディレクトリでClaude CLIが実行されます。")
+    for route in router.routes:
+        print(f"  {route.name}: {route.cwd}（同時実行数 {route.max_concurrent}）")
+    confirm = input("このディレクトリで実行しますか？ (y/n): ").strip().lower()
+
+    if confirm != 'y':
+        print("\n起動をキャンセルしました。")
+        print(f"作業ディレクトリを変更する場合は、config/.env ファイルの DEFAULT_CWD を編集してください。")
+        sys.exit(0)
+
+    print("\nSlack Bot（asyncio版）を起動しています...\n")
+
+    asyncio.run(main())
@@ -0,0 +1,195 @@
+"""
+Claude CLI実行モジュール（asyncio版）
+1つのイベントループで多数のジョブを駆動するため、stdout/stderrをコルーチンで読み取る
+"""
+import time
+import asyncio
+import logging
+
+from ..config import DEFAULT_CWD
+from .events import EventHandler
+from .parser import decode, parse_text_delta
+from .runner import StderrCapture, build_claude_args, build_claude_env
+from .limits import LIMITS, record_usage
+from .process import stop_process_tree, process_reaped
+from ..utils import metrics, tracing
+
+# stream-jsonの1行は大きなツール結果を含むことがあるため読み取り上限を広げる
+STREAM_LIMIT = 16 * 1024 * 1024
+
+
+async def run_claude_streaming_async(
+    prompt: str,
+    on_stdout: callable,
+    on_stderr: callable,
+    thread_ts: str | None = None,
+    current_tools: dict | None = None,
+    message_stopped: list | None = None,
+    active_processes: dict | None = None,
+    session_id: str | None = None,
+    resume: bool = False,
+    cwd: str | None = None,
+    extra_args: list | None = None,
+) -> int:
+    """
+    Claude CLIをストリーミングモードで実行（asyncio版）
+
+    Args:
+        prompt: プロンプト文字列
+        on_stdout: 標準出力を受け取るコールバック（同期関数）
+        on_stderr: 標準エラーを受け取るコールバック（同期関数）
+        thread_ts: SlackスレッドID
+        current_tools: ツール実行状態を保持する辞書
+        message_stopped: メッセージ停止フラグ
+        active_processes: アクティブプロセスの辞書（イベントループ内でのみ操作するためロック不要）
+        session_id: Claude CLIのセッションID
+        resume: 既存セッションを再開するか
+        cwd: 作業ディレクトリ（省略時はDEFAULT_CWD）
+        extra_args: Claude CLIに追加で渡す引数
+
+    Returns:
+        終了コード
+    """
+    if current_tools is None:
+        current_tools = {}
+    if message_stopped is None:
+        message_stopped = [False]
+
+    args = build_claude_args(prompt, session_id, resume, extra_args=extra_args)
+    env = build_claude_env()
+
+    proc: asyncio.subprocess.Process | None = None
+    stderr_task = None
+    cgroup = None
+    timer = None
+    span = tracing.start_span("claude.process", claude_session_id=session_id, claude_resume=resume)
+    try:
+        logging.info("Starting claude process (async): %s", " ".join(args))
+        proc = await asyncio.create_subprocess_exec(
+            *args,
+            cwd=cwd or DEFAULT_CWD,
+            env=env,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=STREAM_LIMIT,
+            preexec_fn=LIMITS.preexec_fn(),
+            # 停止時にツールの子プロセスもまとめて止められるよう、専用のプロセスグループで起動
+            start_new_session=True,
+        )
+        logging.info("Claude process started with PID: %s", proc.pid)
+        cgroup = LIMITS.place(proc.pid)
+        started = time.monotonic()
+        first_event = True
+        span.set_attribute("claude.pid", proc.pid)
+        span.add_event("spawned")
+
+        # このスレッド(ts)にぶら下がるプロセスとして登録
+        if thread_ts and active_processes is not None:
+            active_processes[thread_ts] = proc
+
+        # 実行時間の上限に達したら停止
+        if LIMITS.timeout:
+            def _expire():
+                logging.warning("Claude process exceeded CLAUDE_TIMEOUT (%ss), killing", LIMITS.timeout)
+                metrics.CLI_TIMEOUTS.inc()
+                on_stderr(f"[ERROR] 実行時間の上限（{LIMITS.timeout:g}秒）を超えたため停止しました\n")
+                if proc.returncode is None:
+                    stop_process_tree(proc)
+
+            timer = asyncio.get_running_loop().call_later(LIMITS.timeout, _expire)
+
+        stderr_task = asyncio.create_task(_drain_stderr(proc.stderr, on_stderr))
+
+        # イベントハンドラー初期化
+        event_handler = EventHandler(on_stdout, current_tools, message_stopped)
+
+        # STDOUT を逐次パース
+        while True:
+            raw = await proc.stdout.readline()
+            if not raw:
+                break
+            line = raw.decode("utf-8", errors="replace").strip()
+            if not line:
+                continue
+            if first_event:
+                metrics.CLI_TIME_TO_FIRST_TOKEN.observe(time.monotonic() - started)
+                span.add_event("first_token")
+                first_event = False
+
+            logging.debug("RAW STDOUT: %.200s", line)
+
+            # トークンごとのテキストデルタは辞書を作らずに処理
+            text = parse_text_delta(line)
+            if text is not None:
+                event_handler.handle_text_delta(text)
+                continue
+
+            # JSON 以外は捨てる
+            try:
+                evt = decode(line)
+            except Exception as e:
+                logging.info("JSON parse failed: %s (line: %.100s)", e, line)
+                continue
+
+            # イベント処理
+            event_handler.handle_event(evt)
+
+        await proc.wait()
+        process_reaped(proc)
+        # ピークメモリとCPU時間はcgroupがある場合のみ記録（asyncioが子プロセスを回収するため rusage は取れない）
+        if cgroup is not None:
+            record_usage(cgroup.usage(), span)
+            cgroup.remove()
+        logging.info("Claude process finished with code: %s", proc.returncode)
+        metrics.CLI_EXIT.labels(proc.returncode).inc()
+        span.set_attribute("claude.exit_code", proc.returncode)
+        try:
+            await asyncio.wait_for(stderr_task, timeout=5)
+        except asyncio.TimeoutError:
+            stderr_task.cancel()
+        return int(proc.returncode or 0)
+
+    except asyncio.CancelledError:
+        if proc and proc.returncode is None:
+            stop_process_tree(proc, grace=0)
+        raise
+    except Exception as e:
+        logging.exception("run_claude_streaming_async error")
+        span.record_error(e)
+        try:
+            if proc and proc.returncode is None:
+                stop_process_tree(proc, grace=0)
+        except Exception:
+            pass
+        on_stderr(f"[ERROR] {type(e).__name__}: {e}\n")
+        return 1
+    finally:
+        if timer is not None:
+            timer.cancel()
+        span.end()
+        if stderr_task and not stderr_task.done():
+            stderr_task.cancel()
+        # 終了時はこのスレッド(ts)から除外
+        if thread_ts and active_processes is not None and active_processes.get(thread_ts) is proc:
+            active_processes.pop(thread_ts, None)
+
+
+async def _drain_stderr(stream: asyncio.StreamReader, on_stderr: callable):
+    """
+    STDERRを読み取り、先頭と末尾の一定バイト数ずつをon_stderrに渡す
+
+    Args:
+        stream: 子プロセスのstderr
+        on_stderr: 標準エラーを受け取るコールバック
+    """
+    capture = StderrCapture()
+    try:
+        while True:
+            raw = await stream.readline()
+            if not raw:
+                break
+            capture.add(raw.decode("utf-8", errors="replace"), len(raw))
+    except Exception as e:
+        logging.warning("stderr reader error: %s", e)
+    finally:
+        capture.emit(on_stderr)
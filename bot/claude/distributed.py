@@ -0,0 +1,559 @@
+"""
+分散実行モジュール
+複数のボットプロセス（ノード）で1つのジョブキューを共有する
+キューと実行中ジョブの記録は共有ディスク上のSQLiteに置き、各ノードのワーカーがそこからジョブを取り出す
+stop は実行中のノードに停止依頼として届け、status はどのノードで実行中かを返す
+
+ハートビートの途絶えたノードの実行中ジョブは orphaned にする。そのノードが戻ってきたら自分でプロセスを止めて
+失敗として記録し、戻らないまま orphan_timeout を過ぎたら失敗として片付ける（それまで同じスレッドのジョブは取り出さない）
+"""
+import json
+import time
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+
+from .scheduler import Job, _SchedulerMetrics, _queue_position
+
+# 取り出せる最も古いジョブ（同じスレッドのジョブが実行中・orphaned なら飛ばす）
+_CLAIMABLE_SQL = (
+    "SELECT {columns} FROM jobs WHERE status = 'queued' AND route = ? "
+    "AND key NOT IN (SELECT key FROM jobs WHERE status IN ('running', 'orphaned')) ORDER BY id LIMIT 1"
+)
+
+
+class SharedJobStore:
+    """ノード間で共有するジョブキューと実行中ジョブの記録"""
+
+    def __init__(self, path: str, node_id: str, node_timeout: float = 60.0, orphan_timeout: float = 600.0):
+        """
+        Args:
+            path: SQLiteファイルのパス（全ノードから同じファイルを参照する）
+            node_id: このノードの識別子
+            node_timeout: この秒数ハートビートのないノードは停止したとみなし、実行中のジョブを orphaned にする
+            orphan_timeout: この秒数ハートビートのないノードの orphaned のジョブを失敗として片付ける
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.node_id = node_id
+        self.node_timeout = node_timeout
+        self.orphan_timeout = max(node_timeout, orphan_timeout)
+        self._lock = threading.Lock()
+        self._heartbeat_thread = None
+        # WALは同じホストの中でしか共有できないため、ロールバックジャーナルのまま使う
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                route TEXT NOT NULL,
+                key TEXT NOT NULL,
+                user_id TEXT,
+                context TEXT NOT NULL,
+                payloads TEXT NOT NULL,
+                status TEXT NOT NULL,
+                node_id TEXT,
+                stop_requested INTEGER NOT NULL DEFAULT 0,
+                enqueued_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, route, id);
+            CREATE INDEX IF NOT EXISTS idx_jobs_key ON jobs (key, status);
+            CREATE TABLE IF NOT EXISTS nodes (
+                node_id TEXT PRIMARY KEY,
+                heartbeat REAL NOT NULL
+            );
+            """
+        )
+
+    def _transaction(self, func):
+        """書き込みロックを取ってから func(conn) を実行"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def enqueue(self, route: str, job: Job, max_queue: int = 0, idle: int = 0) -> int | None:
+        """
+        ジョブをキューに追加
+
+        Args:
+            route: 実行先の名前
+            job: 追加するジョブ（context と payloads がJSONにできること）
+            max_queue: この実行先の待機キューの最大長（0なら無制限）
+            idle: 投入するノードで空いているワーカー数（待ち順位の見積もりに使う）
+
+        Returns:
+            待ち順位（0なら空いているノードがすぐに取り出す、Noneならキュー満杯で拒否）
+        """
+        def insert(conn):
+            queued = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND route = ?", (route,)
+            ).fetchone()[0]
+            if max_queue and queued >= max_queue:
+                return None
+            job_id = conn.execute(
+                "INSERT INTO jobs (route, key, user_id, context, payloads, status, enqueued_at) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+                (route, job.key, job.user_id, json.dumps(job.context), json.dumps(job.payloads), job.enqueued_at),
+            ).lastrowid
+            return self._position(conn, route, job_id, idle)
+
+        return self._transaction(insert)
+
+    def coalesce(self, key: str, payload) -> int | None:
+        """
+        同じスレッドの待機中ジョブに payload を追加
+
+        Returns:
+            まとめた先のジョブの待ち順位（1始まり）、待機中のジョブがなければNone
+        """
+        def append(conn):
+            row = conn.execute(
+                "SELECT id, route, payloads FROM jobs WHERE key = ? AND status = 'queued' ORDER BY id LIMIT 1", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, route, payloads = row
+            conn.execute(
+                "UPDATE jobs SET payloads = ? WHERE id = ?", (json.dumps(json.loads(payloads) + [payload]), job_id)
+            )
+            return max(1, self._position(conn, route, job_id))
+
+        return self._transaction(append)
+
+    def claim(self, route: str) -> tuple | None:
+        """
+        実行できる最も古いジョブを取り出し、このノードで実行中として記録
+
+        Args:
+            route: 実行先の名前
+
+        Returns:
+            (ジョブID, Job)、実行できるジョブがなければNone
+        """
+        # 空のキューを確認するたびに書き込みロックを取らないよう、先に読み取りだけで候補を確かめる
+        if not self._query(_CLAIMABLE_SQL.format(columns="1"), (route,)):
+            return None
+
+        def take(conn):
+            row = conn.execute(
+                _CLAIMABLE_SQL.format(columns="id, key, user_id, context, payloads, enqueued_at"), (route,)
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, key, user_id, context, payloads, enqueued_at = row
+            conn.execute(
+                "UPDATE jobs SET status = 'running', node_id = ?, started_at = ? WHERE id = ?",
+                (self.node_id, time.time(), job_id),
+            )
+            job = Job(key, user_id, None, context=json.loads(context))
+            job.payloads = json.loads(payloads)
+            job.enqueued_at = enqueued_at
+            return job_id, job
+
+        return self._transaction(take)
+
+    def finish(self, job_id: int, ok: bool) -> bool:
+        """
+        このノードで実行が終わったジョブを記録
+
+        Args:
+            job_id: claim で取り出したジョブID
+            ok: 正常に終わったか
+
+        Returns:
+            結果を記録できたか（実行中に orphaned にされていた場合は失敗として記録してFalse）
+        """
+        def update(conn):
+            now = time.time()
+            if conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = 'running' AND node_id = ?",
+                ("completed" if ok else "failed", now, job_id, self.node_id),
+            ).rowcount:
+                return True
+            # orphaned のジョブは、このノードが止めたことをもって失敗として片付け、同じスレッドのジョブを取り出せるようにする
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ? WHERE id = ? AND status = 'orphaned' AND node_id = ?",
+                (now, job_id, self.node_id),
+            )
+            return False
+
+        return self._transaction(update)
+
+    def position(self, key: str) -> int | None:
+        """指定スレッドの待機中ジョブの待ち順位（1始まり）、待機中でなければNone"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, route FROM jobs WHERE key = ? AND status = 'queued' ORDER BY id LIMIT 1", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            return max(1, self._position(self._conn, row[1], row[0]))
+
+    def _position(self, conn, route: str, job_id: int, idle: int = 0) -> int:
+        """
+        待機中のジョブの待ち順位（claim と同じく、同じスレッドのジョブが実行中・先に待機中なら数えない）
+
+        Args:
+            conn: SQLite接続
+            route: 実行先の名前
+            job_id: 対象のジョブID
+            idle: 空いているワーカー数（分からなければ0）
+        """
+        keys = [key for (key,) in conn.execute(
+            "SELECT key FROM jobs WHERE status = 'queued' AND route = ? AND id <= ? ORDER BY id", (route, job_id)
+        )]
+        running = {key for (key,) in conn.execute("SELECT key FROM jobs WHERE status IN ('running', 'orphaned')")}
+        return _queue_position(keys, running, len(keys) - 1, idle)
+
+    def owner(self, key: str) -> str | None:
+        """指定スレッドのジョブを実行中のノード（実行中でなければNone）"""
+        rows = self._query("SELECT node_id FROM jobs WHERE key = ? AND status = 'running' LIMIT 1", (key,))
+        return rows[0][0] if rows else None
+
+    def cancel(self, key: str) -> int:
+        """指定スレッドの待機中ジョブを取り消し、取り消した件数を返す"""
+        return self._transaction(lambda conn: conn.execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE key = ? AND status = 'queued'",
+            (time.time(), key),
+        ).rowcount)
+
+    def request_stop(self, key: str) -> str | None:
+        """
+        指定スレッドの実行中ジョブに停止を依頼
+
+        Returns:
+            実行中のノード（実行中でなければNone）
+        """
+        def mark(conn):
+            row = conn.execute("SELECT id, node_id FROM jobs WHERE key = ? AND status = 'running' LIMIT 1",
+                               (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET stop_requested = 1 WHERE id = ?", (row[0],))
+            return row[1]
+
+        return self._transaction(mark)
+
+    def take_stop_requests(self, route: str) -> list:
+        """このノードで実行中のジョブへの停止依頼を取り出す（スレッドIDのリスト）"""
+        sql = "SELECT 1 FROM jobs WHERE node_id = ? AND route = ? AND status = 'running' AND stop_requested = 1 LIMIT 1"
+        if not self._query(sql, (self.node_id, route)):
+            return []
+
+        def take(conn):
+            rows = conn.execute(
+                "SELECT id, key FROM jobs WHERE node_id = ? AND route = ? AND status = 'running' AND stop_requested = 1",
+                (self.node_id, route),
+            ).fetchall()
+            for job_id, _ in rows:
+                conn.execute("UPDATE jobs SET stop_requested = 0 WHERE id = ?", (job_id,))
+            return [key for _, key in rows]
+
+        return self._transaction(take)
+
+    def take_orphaned(self, route: str) -> list:
+        """
+        このノードで実行中のまま orphaned にされたジョブ（ハートビートが途絶えている間に片付けられたもの）
+
+        Returns:
+            (ジョブID, スレッドID) のリスト
+        """
+        return self._query(
+            "SELECT id, key FROM jobs WHERE node_id = ? AND route = ? AND status = 'orphaned'", (self.node_id, route)
+        )
+
+    def heartbeat(self) -> tuple:
+        """
+        このノードの生存を記録し、停止したノードで実行中のままのジョブを orphaned にする
+        orphaned のまま orphan_timeout を過ぎたジョブは失敗として片付ける
+        （途中まで実行された依頼を別のノードでやり直すことはしない）
+
+        Returns:
+            (orphaned にしたジョブ数, 失敗として片付けたジョブ数)
+        """
+        now = time.time()
+
+        def beat(conn):
+            conn.execute("INSERT OR REPLACE INTO nodes (node_id, heartbeat) VALUES (?, ?)", (self.node_id, now))
+            orphaned = conn.execute(
+                "UPDATE jobs SET status = 'orphaned' WHERE status = 'running' AND node_id IN "
+                "(SELECT node_id FROM nodes WHERE heartbeat < ?)",
+                (now - self.node_timeout,),
+            ).rowcount
+            expired = conn.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ? WHERE status = 'orphaned' AND node_id IN "
+                "(SELECT node_id FROM nodes WHERE heartbeat < ?)",
+                (now, now - self.orphan_timeout),
+            ).rowcount
+            # 終了から1日たったジョブの記録は削除
+            conn.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (now - 86400,))
+            return orphaned, expired
+
+        return self._transaction(beat)
+
+    def start_heartbeat(self, interval: float):
+        """
+        ハートビートを記録するスレッドを起動（ノードに1つだけ。2回目以降の呼び出しは何もしない）
+
+        Args:
+            interval: 記録する間隔（秒）
+        """
+        with self._lock:
+            if self._heartbeat_thread is not None:
+                return
+            self._heartbeat_thread = threading.Thread(
+                target=self._beat, args=(interval,), name="job-store-heartbeat", daemon=True
+            )
+        self._heartbeat_thread.start()
+
+    def _beat(self, interval: float):
+        """ハートビートスレッド本体"""
+        while True:
+            try:
+                orphaned, expired = self.heartbeat()
+                if orphaned:
+                    logging.warning("Marked %d running job(s) of unresponsive nodes as orphaned", orphaned)
+                if expired:
+                    logging.warning("Marked %d orphaned job(s) as failed", expired)
+            except sqlite3.Error as e:
+                logging.warning("Failed to record heartbeat: %s", e)
+            time.sleep(interval)
+
+    def counts(self, route: str) -> dict:
+        """実行先ごとの待機中・実行中のジョブ数（全ノード合計）"""
+        rows = self._query(
+            "SELECT status, COUNT(*) FROM jobs WHERE route = ? AND status IN ('queued', 'running') GROUP BY status",
+            (route,),
+        )
+        counts = dict(rows)
+        return {"queued": counts.get("queued", 0), "running": counts.get("running", 0)}
+
+
+class DistributedJobScheduler:
+    """共有キューからジョブを取り出して実行するスケジューラー（JobSchedulerと同じ操作を持つ）"""
+
+    # stop/status で他のノードに問い合わせるかの判定に使う
+    distributed = True
+
+    def __init__(self, store: SharedJobStore, route: str, max_workers: int, max_queue: int = 0,
+                 name: str = "claude", poll_interval: float = 1.0):
+        """
+        Args:
+            store: 共有ジョブストア
+            route: 担当する実行先の名前
+            max_workers: このノードで同時に実行するジョブの最大数
+            max_queue: 待機キューの最大長（全ノード合計、0なら無制限）
+            name: ログ・スレッド名に使う名前
+            poll_interval: 共有キューを確認する間隔（秒）
+        """
+        self.store = store
+        self.route = route
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max_queue
+        self.name = name
+        self.poll_interval = poll_interval
+        # 取り出したジョブを実行する関数 executor(job) と、停止依頼を受けたときの関数 on_stop(key)
+        self.executor = None
+        self.on_stop = None
+
+        self._cond = threading.Condition()
+        self._running = {}  # key -> Job（このノードで実行中のもの）
+        self._orphaned = set()  # orphaned にされて停止を済ませたジョブID
+        self._shutdown = False
+
+        # メトリクス
+        self.submitted = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._metrics = _SchedulerMetrics(self, queued=lambda: self.store.counts(self.route)["queued"])
+
+        self._workers = []
+
+    def start(self):
+        """ワーカースレッドと停止依頼の監視スレッドを起動（bind のあとに呼ぶこと）"""
+        # ハートビートはノードで1つ（実行先ごとのスケジューラーで共有する）
+        self.store.start_heartbeat(self.poll_interval)
+        for i in range(self.max_workers):
+            t = threading.Thread(target=self._worker, name=f"{self.name}-worker-{i}", daemon=True)
+            t.start()
+            self._workers.append(t)
+        t = threading.Thread(target=self._watch, name=f"{self.name}-watch", daemon=True)
+        t.start()
+        self._workers.append(t)
+
+    def bind(self, executor, on_stop):
+        """ジョブの実行関数と停止関数を設定（ハンドラー作成時に呼ばれる）"""
+        self.executor = executor
+        self.on_stop = on_stop
+
+    def submit(self, job: Job) -> int | None:
+        """
+        ジョブを共有キューに投入
+
+        Returns:
+            待ち順位（0ならすぐに実行開始、Noneならキュー満杯で拒否）
+        """
+        with self._cond:
+            idle = self.max_workers - len(self._running)
+        position = self.store.enqueue(self.route, job, self.max_queue, idle)
+        if position is None:
+            self.rejected += 1
+            self._metrics.rejected.inc()
+            logging.warning("[%s] queue full, rejected job: key=%s", self.name, job.key)
+            return None
+        self.submitted += 1
+        self._metrics.submitted.inc()
+        with self._cond:
+            self._cond.notify()
+        logging.info("[%s] job queued (shared): key=%s position=%d", self.name, job.key, position)
+        return position
+
+    def coalesce(self, key, payload) -> int | None:
+        """同じスレッドの待機中ジョブ（どのノードが投入したものでもよい）に payload を追加"""
+        position = self.store.coalesce(key, payload)
+        if position is not None:
+            logging.info("[%s] coalesced follow-up into shared job: key=%s", self.name, key)
+        return position
+
+    def position(self, key) -> int | None:
+        """指定キーのジョブの待ち順位（1始まり）、待機中でなければNone"""
+        return self.store.position(key)
+
+    def is_running(self, key) -> bool:
+        """指定キーのジョブがいずれかのノードで実行中かどうか"""
+        return self.store.owner(key) is not None
+
+    def owner(self, key) -> str | None:
+        """指定キーのジョブを実行中のノード"""
+        return self.store.owner(key)
+
+    def cancel(self, key) -> int:
+        """指定キーの待機中ジョブを取り消す（実行中のジョブには影響しない）"""
+        cancelled = self.store.cancel(key)
+        if cancelled:
+            logging.info("[%s] cancelled %d queued job(s): key=%s", self.name, cancelled, key)
+        return cancelled
+
+    def request_stop(self, key) -> str | None:
+        """指定キーの実行中ジョブを実行しているノードに停止を依頼し、そのノードを返す"""
+        return self.store.request_stop(key)
+
+    def stats(self) -> dict:
+        """キュー深さ・待ち時間などの統計（running・queued は全ノード合計）"""
+        counts = self.store.counts(self.route)
+        with self._cond:
+            return {
+                "running": counts["running"],
+                "queued": counts["queued"],
+                "max_workers": self.max_workers,
+                "submitted": self.submitted,
+                "started": self.started,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait": self.total_wait / self.started if self.started else 0.0,
+                "max_wait": self.max_wait,
+            }
+
+    def shutdown(self, wait: bool = True):
+        """ワーカースレッドを停止（共有キューの待機中ジョブは他のノードが実行する）"""
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            for t in self._workers:
+                t.join()
+
+    def _worker(self):
+        """ワーカースレッド本体（共有キューを定期的に確認し、実行できるジョブを取り出す）"""
+        while True:
+            with self._cond:
+                if self._shutdown:
+                    return
+            claimed = None
+            if self.executor is not None:
+                try:
+                    claimed = self.store.claim(self.route)
+                except sqlite3.Error as e:
+                    logging.warning("[%s] failed to claim job: %s", self.name, e)
+            if claimed is None:
+                with self._cond:
+                    if not self._shutdown:
+                        self._cond.wait(self.poll_interval)
+                continue
+
+            job_id, job = claimed
+            job.started_at = time.time()
+            wait = job.started_at - job.enqueued_at
+            with self._cond:
+                self._running[job.key] = job
+                self.started += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            self._metrics.started(wait)
+
+            logging.info("[%s] job started: key=%s wait=%.2fs", self.name, job.key, wait)
+            ok = False
+            try:
+                self.executor(job)
+                ok = True
+            except Exception:
+                logging.exception("[%s] job failed: key=%s", self.name, job.key)
+            finally:
+                try:
+                    if not self.store.finish(job_id, ok):
+                        logging.warning("[%s] job was orphaned while running, recorded as failed: key=%s",
+                                        self.name, job.key)
+                        ok = False
+                except sqlite3.Error as e:
+                    logging.error("[%s] failed to record job result: %s", self.name, e)
+                with self._cond:
+                    self._running.pop(job.key, None)
+                    self._orphaned.discard(job_id)
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+                self._metrics.finished(ok, time.time() - job.started_at)
+                logging.info("[%s] job finished: key=%s duration=%.2fs",
+                             self.name, job.key, time.time() - job.started_at)
+
+    def _watch(self):
+        """このノードで実行中のジョブへの停止依頼と、orphaned にされたジョブの停止"""
+        while True:
+            with self._cond:
+                if self._shutdown:
+                    return
+                self._cond.wait(self.poll_interval)
+            try:
+                # 他のノードから見て停止扱いになったジョブは、同じスレッドで二重に実行されないようここで止める
+                for job_id, key in self.store.take_orphaned(self.route):
+                    with self._cond:
+                        if job_id in self._orphaned or key not in self._running:
+                            continue
+                        self._orphaned.add(job_id)
+                    logging.warning("[%s] job was orphaned by other nodes, stopping: key=%s", self.name, key)
+                    if self.on_stop is not None:
+                        self.on_stop(key)
+                for key in self.store.take_stop_requests(self.route):
+                    logging.info("[%s] stop requested by another node: key=%s", self.name, key)
+                    if self.on_stop is not None:
+                        self.on_stop(key)
+            except sqlite3.Error as e:
+                logging.warning("[%s] shared job store error: %s", self.name, e)
@@ -4,6 +4,11 @@ Claude CLIイベント処理モジュール
 import json
 import logging
 
+from ..utils import metrics
+
+# トークンごとに呼ばれるため、テキストデルタのカウンターは事前に取得しておく
+_TEXT_DELTA_EVENTS = metrics.CLI_EVENTS.labels("content_block_delta")
+
 
 class EventHandler:
     """Claude CLIのイベントを処理するクラス"""
@@ -34,7 +39,11 @@ class EventHandler:
             etype = nested_event.get("type", "")
             evt = nested_event
 
-        logging.info("Event type: %s, full event: %s", etype, json.dumps(evt)[:300])
+        metrics.CLI_EVENTS.labels(etype or "unknown").inc()
+
+        # イベント全体の再シリアライズは重いので、DEBUGログが有効なときだけ行う
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Event type: %s, full event: %s", etype, json.dumps(evt)[:300])
 
         # イベントタイプごとに処理
         if etype == "result":
@@ -54,7 +63,7 @@ class EventHandler:
         elif isinstance(evt.get("text"), str):
             # トップレベルのtext
             text = evt["text"]
-            logging.info("Extracted text (top-level): %s", text[:50])
+            logging.debug("Extracted text (top-level): %.50s", text)
             self.on_stdout(text)
 
     def _handle_result(self, evt: dict):
@@ -108,15 +117,26 @@ class EventHandler:
         # テキストデルタ
         if delta_type in ("text_delta", "output_text_delta"):
             text = delta.get("text", "")
-            logging.info("Extracted text (delta): %s", text[:50])
+            logging.debug("Extracted text (delta): %.50s", text)
             self.on_stdout(text)
 
+    def handle_text_delta(self, text: str):
+        """
+        パーサーの高速パスで取り出したテキストデルタを処理
+
+        Args:
+            text: 増分テキスト
+        """
+        _TEXT_DELTA_EVENTS.inc()
+        logging.debug("Extracted text (delta): %.50s", text)
+        self.on_stdout(text)
+
     def _handle_tool_result_delta(self, evt: dict):
         """tool_result_deltaイベント処理（ツールの増分テキスト）"""
         delta = evt.get("delta") or {}
         if delta.get("type") == "output_text_delta":
             text = delta.get("text", "")
-            logging.info("Extracted text (tool_result_delta): %s", text[:50])
+            logging.debug("Extracted text (tool_result_delta): %.50s", text)
             self.on_stdout(text)
 
     def _handle_tool_result(self, evt: dict):
@@ -124,7 +144,7 @@ class EventHandler:
         for c in (evt.get("content") or []):
             if isinstance(c, dict) and c.get("type") == "output_text":
                 text = c.get("text", "")
-                logging.info("Extracted text (tool_result): %s", text[:50])
+                logging.debug("Extracted text (tool_result): %.50s", text)
                 self.on_stdout(text)
 
     def _handle_user_message(self, evt: dict):
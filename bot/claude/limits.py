@@ -0,0 +1,229 @@
+"""
+リソース制限モジュール
+Claude CLI（と、そこから起動されるツール）のメモリ・CPU時間・優先度・実行時間を制限し、
+ジョブごとのピークメモリとCPU時間を記録する
+cgroup v2 の委譲されたディレクトリがあれば、ジョブごとのcgroupに入れて子プロセスまでまとめて制限・計測する
+"""
+import os
+import sys
+import logging
+import threading
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from ..config import (
+    CLAUDE_MAX_MEMORY_MB, CLAUDE_MAX_CPU_SECONDS, CLAUDE_NICE, CLAUDE_TIMEOUT,
+    CLAUDE_CGROUP_PARENT, CLAUDE_CGROUP_MEMORY_MAX, CLAUDE_CGROUP_CPU_MAX,
+)
+from ..utils import metrics
+
+# ru_maxrss の単位（macOSはバイト、Linuxはキロバイト）
+_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+class Cgroup:
+    """1ジョブ分のcgroup v2ディレクトリ"""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def usage(self) -> dict:
+        """cgroup内の全プロセスのピークメモリとCPU時間"""
+        usage = {}
+        try:
+            peak = self.path / "memory.peak"
+            if peak.exists():
+                usage["max_rss_bytes"] = int(peak.read_text())
+            for line in (self.path / "cpu.stat").read_text().splitlines():
+                key, _, value = line.partition(" ")
+                if key == "usage_usec":
+                    usage["cpu_seconds"] = int(value) / 1e6
+        except (OSError, ValueError) as e:
+            logging.debug("cgroup usage read failed: %s", e)
+        return usage
+
+    def remove(self):
+        """cgroupを削除（ツールのプロセスが残っていると削除できないので、そのまま残す）"""
+        try:
+            self.path.rmdir()
+        except OSError as e:
+            logging.debug("cgroup %s not removed: %s", self.path, e)
+
+
+class ResourceLimits:
+    """Claude CLIプロセスに適用するリソース制限"""
+
+    def __init__(self, max_memory_mb: int = 0, max_cpu_seconds: int = 0, nice: int = 0, timeout: float = 0,
+                 cgroup_parent: str = "", cgroup_memory_max: str = "", cgroup_cpu_max: str = ""):
+        """
+        Args:
+            max_memory_mb: 仮想メモリの上限（RLIMIT_AS、MB、0なら無制限）
+            max_cpu_seconds: CPU時間の上限（RLIMIT_CPU、秒、0なら無制限）
+            nice: 実行優先度の引き下げ幅（0なら変更しない）
+            timeout: 実行時間の上限（秒、0なら無制限）
+            cgroup_parent: ジョブごとのcgroupを作る親ディレクトリ（空なら使わない）
+            cgroup_memory_max: cgroupの memory.max に書き込む値（例: "2G"）
+            cgroup_cpu_max: cgroupの cpu.max に書き込む値（例: "200000 100000" で2コア分）
+        """
+        self.max_memory_mb = max_memory_mb
+        self.max_cpu_seconds = max_cpu_seconds
+        self.nice = nice
+        self.timeout = timeout
+        self.cgroup_parent = Path(cgroup_parent) if cgroup_parent else None
+        self.cgroup_memory_max = cgroup_memory_max
+        self.cgroup_cpu_max = cgroup_cpu_max
+        if self.cgroup_parent is not None and not (self.cgroup_parent / "cgroup.procs").exists():
+            logging.warning("cgroup v2 directory not available: %s (cgroup placement disabled)", self.cgroup_parent)
+            self.cgroup_parent = None
+
+    def preexec_fn(self):
+        """
+        子プロセスで exec 前に実行する関数（制限がなければNone）
+
+        Returns:
+            Popen の preexec_fn に渡す関数
+        """
+        if resource is None or not (self.max_memory_mb or self.max_cpu_seconds or self.nice):
+            return None
+        memory = self.max_memory_mb * 1024 * 1024
+        cpu = self.max_cpu_seconds
+        nice = self.nice
+
+        # fork後のプロセスで動くため、ロックやログを使わずにシステムコールだけを呼ぶ
+        def apply():
+            if memory:
+                resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+            if cpu:
+                resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+            if nice:
+                os.nice(nice)
+
+        return apply
+
+    def place(self, pid: int) -> Cgroup | None:
+        """
+        プロセスをジョブ用のcgroupに移す（以降に起動される子プロセスも同じcgroupに入る）
+
+        Args:
+            pid: Claude CLIのプロセスID
+
+        Returns:
+            作成したcgroup（使わない・失敗した場合はNone）
+        """
+        if self.cgroup_parent is None:
+            return None
+        path = self.cgroup_parent / f"claude-{pid}"
+        try:
+            path.mkdir(exist_ok=True)
+            if self.cgroup_memory_max:
+                (path / "memory.max").write_text(self.cgroup_memory_max)
+            if self.cgroup_cpu_max:
+                (path / "cpu.max").write_text(self.cgroup_cpu_max)
+            (path / "cgroup.procs").write_text(str(pid))
+        except OSError as e:
+            logging.warning("Failed to place pid %s in cgroup %s: %s", pid, path, e)
+            return None
+        return Cgroup(path)
+
+    def start_timer(self, kill, on_timeout=None) -> threading.Timer | None:
+        """
+        実行時間の上限に達したらプロセスを止めるタイマーを開始
+
+        Args:
+            kill: プロセスを止める関数
+            on_timeout: 上限に達したときに呼ぶ関数（Slackへの通知など）
+
+        Returns:
+            タイマー（上限なしならNone）。終了時に cancel() すること
+        """
+        if not self.timeout:
+            return None
+
+        def expire():
+            logging.warning("Claude process exceeded CLAUDE_TIMEOUT (%ss), killing", self.timeout)
+            metrics.CLI_TIMEOUTS.inc()
+            if on_timeout is not None:
+                on_timeout()
+            kill()
+
+        timer = threading.Timer(self.timeout, expire)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+
+def wait_with_usage(proc) -> dict:
+    """
+    プロセスの終了を待ち、そのプロセス（と回収済みの子孫）のピークメモリとCPU時間を返す
+
+    Args:
+        proc: subprocess.Popen
+
+    Returns:
+        {"max_rss_bytes": int, "cpu_seconds": float}（取得できなければ空の辞書）
+    """
+    if not hasattr(os, "wait4"):
+        proc.wait()
+        return {}
+    try:
+        _, status, rusage = os.wait4(proc.pid, 0)
+    except ChildProcessError:
+        # 他の箇所（stopコマンドの poll など）で回収済み
+        proc.wait()
+        return {}
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return {
+        "max_rss_bytes": rusage.ru_maxrss * _MAXRSS_UNIT,
+        "cpu_seconds": rusage.ru_utime + rusage.ru_stime,
+    }
+
+
+def sample_usage(pid: int) -> dict | None:
+    """
+    実行中のプロセスの現在のメモリ使用量とCPU時間（/proc のあるLinuxのみ）
+
+    Args:
+        pid: プロセスID
+
+    Returns:
+        {"rss_bytes": int, "max_rss_bytes": int, "cpu_seconds": float}、取得できなければNone
+    """
+    try:
+        status = Path(f"/proc/{pid}/status").read_text()
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except OSError:
+        return None
+    usage = {}
+    for line in status.splitlines():
+        if line.startswith("VmRSS:"):
+            usage["rss_bytes"] = int(line.split()[1]) * 1024
+        elif line.startswith("VmHWM:"):
+            usage["max_rss_bytes"] = int(line.split()[1]) * 1024
+    # コマンド名に空白や括弧が含まれることがあるので、最後の ")" 以降を分割する
+    fields = stat.rsplit(")", 1)[1].split()
+    usage["cpu_seconds"] = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return usage
+
+
+def record_usage(usage: dict, span=None):
+    """ジョブのリソース使用量をメトリクスとスパンに記録"""
+    if "max_rss_bytes" in usage:
+        metrics.CLI_MAX_RSS.observe(usage["max_rss_bytes"])
+    if "cpu_seconds" in usage:
+        metrics.CLI_CPU_SECONDS.observe(usage["cpu_seconds"])
+    if span is not None:
+        for key, value in usage.items():
+            span.set_attribute(f"claude.{key}", value)
+    if usage:
+        logging.info("Claude process usage: max_rss=%.1fMB cpu=%.2fs",
+                     usage.get("max_rss_bytes", 0) / 1024 / 1024, usage.get("cpu_seconds", 0.0))
+
+
+LIMITS = ResourceLimits(
+    CLAUDE_MAX_MEMORY_MB, CLAUDE_MAX_CPU_SECONDS, CLAUDE_NICE, CLAUDE_TIMEOUT,
+    CLAUDE_CGROUP_PARENT, CLAUDE_CGROUP_MEMORY_MAX, CLAUDE_CGROUP_CPU_MAX,
+)
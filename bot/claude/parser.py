@@ -0,0 +1,68 @@
+"""
+stream-json パースモジュール
+Claude CLIの出力1行をイベントに変換する（orjson / msgspec があれば高速なデコーダーを使う）
+"""
+import re
+import json
+
+# 高速なJSONデコーダー（orjson → msgspec → 標準jsonの順に使えるものを選ぶ）
+try:
+    import orjson
+
+    _decode = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    try:
+        import msgspec
+
+        _decode = msgspec.json.decode
+        JSON_BACKEND = "msgspec"
+    except ImportError:
+        _decode = json.loads
+        JSON_BACKEND = "json"
+
+# --include-partial-messages のトークンごとのテキストデルタ行
+# CLIはキー順を固定で出力するため、この形に一致した行だけ辞書を作らずにテキストを取り出す
+TEXT_DELTA_RE = re.compile(
+    r'^\{"type":"stream_event","event":\{"type":"content_block_delta","index":\d+,'
+    r'"delta":\{"type":"text_delta","text":("(?:[^"\\]|\\.)*")\}\}'
+)
+_TEXT_DELTA_PREFIX = '{"type":"stream_event","event":{"type":"content_block_delta"'
+
+
+def decode(line: str | bytes):
+    """
+    JSON文字列をデコード
+
+    Args:
+        line: JSON文字列
+
+    Returns:
+        デコードしたオブジェクト
+
+    Raises:
+        Exception: JSONとして不正な場合（例外の型はバックエンドによって異なる）
+    """
+    return _decode(line)
+
+
+def parse_text_delta(line: str) -> str | None:
+    """
+    テキストデルタ行ならテキストだけを取り出す
+
+    Args:
+        line: stdoutの1行（前後の空白は除去済み）
+
+    Returns:
+        テキスト、テキストデルタ行でなければNone（通常のパースに回す）
+    """
+    if not line.startswith(_TEXT_DELTA_PREFIX):
+        return None
+    m = TEXT_DELTA_RE.match(line)
+    if not m:
+        return None
+    literal = m.group(1)
+    # エスケープがなければ引用符を外すだけでよい
+    if "\\" not in literal:
+        return literal[1:-1]
+    return json.loads(literal)
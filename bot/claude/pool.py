@@ -0,0 +1,238 @@
+"""
+Claude CLIのプロセスプールモジュール
+stream-json入力モードのCLIを事前に起動しておき、依頼が来たらプロンプトを書き込むだけで実行を始める
+（Nodeの起動や認証・設定の読み込みを依頼の処理時間から外す）
+"""
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from subprocess import Popen, PIPE
+
+from ..config import DEFAULT_CWD
+from ..utils import metrics
+from .runner import StderrCapture, build_claude_args, build_claude_env
+from .limits import LIMITS
+from .process import stop_process_tree, process_reaped
+
+
+class WarmProcess:
+    """プールで待機しているClaude CLIプロセス"""
+
+    def __init__(self, pool, cwd: str):
+        """
+        Args:
+            pool: 所属するプール
+            cwd: 作業ディレクトリ
+        """
+        self.pool = pool
+        self.cwd = cwd
+        # 起動時にセッションIDを決める（依頼を受けたスレッドにはこのIDを紐付ける）
+        self.session_id = str(uuid.uuid4())
+        self.started_at = time.time()
+        self._stderr_lock = threading.Lock()
+        self._stderr = StderrCapture()
+        self.proc = Popen(
+            build_claude_args(session_id=self.session_id, stream_input=True),
+            cwd=cwd,
+            env=build_claude_env(),
+            stdin=PIPE,
+            stdout=PIPE,
+            stderr=PIPE,
+            text=True,
+            bufsize=1,
+            preexec_fn=LIMITS.preexec_fn(),
+            start_new_session=True,
+        )
+        self.cgroup = LIMITS.place(self.proc.pid)
+        # 待機中もstderrを読み続け、パイプが詰まらないようにする
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        self._stderr_thread.start()
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def send_prompt(self, prompt: str):
+        """
+        プロンプトを1件書き込んでstdinを閉じる（応答後にプロセスが終了する）
+
+        1プロセスは1依頼にだけ使う（同じセッションIDを複数のスレッドに紐付けないため）
+
+        Args:
+            prompt: プロンプト文字列
+        """
+        message = {"type": "user", "message": {"role": "user", "content": [{"type": "text", "text": prompt}]}}
+        self.proc.stdin.write(json.dumps(message, ensure_ascii=False) + "\n")
+        self.proc.stdin.flush()
+        self.proc.stdin.close()
+
+    def take_stderr(self, wait: bool = False) -> StderrCapture:
+        """
+        ここまでのstderrを取り出す（以降は新しいバッファに溜める）
+
+        Args:
+            wait: stderrの読み取り終了（プロセス終了）を待つか
+        """
+        if wait:
+            self._stderr_thread.join(timeout=5)
+        with self._stderr_lock:
+            capture, self._stderr = self._stderr, StderrCapture()
+        return capture
+
+    def release(self):
+        """依頼の処理が終わったらプールに返す"""
+        self.pool.release(self)
+
+    def terminate(self):
+        """プロセスを終了（依頼の途中で止めた場合に残ったツールの子プロセスも含める）"""
+        try:
+            stop_process_tree(self.proc, grace=0)
+            self.proc.wait(timeout=5)
+            process_reaped(self.proc)
+        except Exception as e:
+            logging.warning("Failed to terminate pooled claude process: %s", e)
+        if self.cgroup is not None:
+            self.cgroup.remove()
+
+    def _drain_stderr(self):
+        try:
+            for line in self.proc.stderr:
+                if line:
+                    with self._stderr_lock:
+                        self._stderr.add(line)
+        except Exception as e:
+            logging.warning("pooled stderr reader error: %s", e)
+
+
+class ClaudeProcessPool:
+    """事前起動したClaude CLIプロセスのプール"""
+
+    def __init__(self, size: int, max_idle: float = 600.0, cwd: str = DEFAULT_CWD):
+        """
+        Args:
+            size: 待機させておくプロセス数
+            max_idle: 待機させておく最大秒数（超えたら起動し直す）
+            cwd: 作業ディレクトリ
+        """
+        self.size = max(1, size)
+        self.max_idle = max_idle
+        self.cwd = cwd
+
+        self._idle = deque()
+        self._spawning = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # メトリクス
+        self.hits = 0
+        self.misses = 0
+        self.spawned = 0
+
+        self._thread = threading.Thread(target=self._maintain, name="claude-pool", daemon=True)
+        self._thread.start()
+
+    def acquire(self) -> WarmProcess | None:
+        """
+        待機中のプロセスを1つ取り出す（なければNoneを返し、呼び出し側は通常どおり起動する）
+
+        Returns:
+            WarmProcess または None
+        """
+        stale = []
+        with self._cond:
+            warm = None
+            while self._idle:
+                candidate = self._idle.popleft()
+                if candidate.alive and time.time() - candidate.started_at < self.max_idle:
+                    warm = candidate
+                    break
+                stale.append(candidate)
+            if warm is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._cond.notify()
+        metrics.POOL_ACQUIRE.labels("hit" if warm is not None else "miss").inc()
+        for proc in stale:
+            proc.terminate()
+        return warm
+
+    def release(self, warm: WarmProcess):
+        """
+        使い終わったプロセスを返す（再利用はせず、終了させて補充する）
+
+        Args:
+            warm: acquire で取り出したプロセス
+        """
+        warm.terminate()
+        with self._cond:
+            self._cond.notify()
+
+    def idle_count(self) -> int:
+        """待機中のプロセス数"""
+        with self._cond:
+            return len(self._idle)
+
+    def stats(self) -> dict:
+        """プールの状態"""
+        with self._cond:
+            return {
+                "idle": len(self._idle),
+                "spawning": self._spawning,
+                "hits": self.hits,
+                "misses": self.misses,
+                "spawned": self.spawned,
+            }
+
+    def shutdown(self):
+        """待機中のプロセスをすべて終了"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for warm in idle:
+            warm.terminate()
+
+    def _maintain(self):
+        """待機プロセスがsize個になるよう補充し、古くなったものを入れ替える"""
+        while True:
+            stale = []
+            with self._cond:
+                while not self._closed and len(self._idle) + self._spawning >= self.size:
+                    # 一番古いプロセスの期限まで待って入れ替える
+                    timeout = None
+                    if self._idle:
+                        timeout = max(0.0, self._idle[0].started_at + self.max_idle - time.time())
+                    self._cond.wait(timeout)
+                    if self._idle and time.time() - self._idle[0].started_at >= self.max_idle:
+                        stale.append(self._idle.popleft())
+                closed = self._closed
+                if not closed:
+                    self._spawning += 1
+            # 終了待ちで数秒かかることがあるので、ロックを離してから止める
+            for proc in stale:
+                proc.terminate()
+            if closed:
+                return
+            try:
+                warm = WarmProcess(self, self.cwd)
+            except Exception as e:
+                logging.error("Failed to start pooled claude process: %s", e)
+                warm = None
+            with self._cond:
+                self._spawning -= 1
+                closed = self._closed
+                if warm is not None:
+                    self.spawned += 1
+                    if not closed:
+                        self._idle.append(warm)
+            if warm is not None and closed:
+                warm.terminate()
+                return
+            if warm is None:
+                # 起動に失敗し続ける場合にCPUを使い切らないよう少し待つ
+                time.sleep(5)
@@ -0,0 +1,110 @@
+"""
+プロセスツリー停止モジュール
+Claude CLIは新しいセッション（プロセスグループ）で起動し、停止時はツールが起動したビルドやテストの
+子プロセスも含めてグループごとに SIGTERM → 猶予後に SIGKILL を送る
+"""
+import os
+import signal
+import logging
+import threading
+
+from ..config import CLAUDE_STOP_GRACE
+
+# 猶予後にSIGKILLを送るタイマー（proc -> Timer、プロセスを回収したら process_reaped で取り消す）
+_kill_timers = {}
+_kill_lock = threading.Lock()
+
+
+def signal_process_group(pid: int, sig: int) -> bool:
+    """
+    プロセスグループ全体にシグナルを送る（start_new_session で起動したのでグループIDはPIDと同じ）
+
+    Args:
+        pid: グループリーダー（Claude CLI）のプロセスID
+        sig: 送るシグナル
+
+    Returns:
+        送れたか（グループのプロセスがすべて終了済みならFalse）
+    """
+    try:
+        os.killpg(pid, sig)
+        return True
+    except ProcessLookupError:
+        return False
+    except OSError as e:
+        logging.warning("Failed to send signal %s to process group %s: %s", sig, pid, e)
+        return False
+
+
+def stop_process_tree(proc, grace: float = CLAUDE_STOP_GRACE) -> threading.Timer | None:
+    """
+    プロセスとその子孫をまとめて停止（待たずに戻る）
+    まずSIGTERMで終了処理の機会を与え、grace秒後にまだ残っているプロセスをSIGKILLする
+
+    Args:
+        proc: subprocess.Popen または asyncio.subprocess.Process（start_new_session=True で起動したもの）
+        grace: SIGKILLまでの猶予（秒、0以下ならすぐにSIGKILL）
+
+    Returns:
+        SIGKILLを送るタイマー（すぐに送った場合はNone）
+    """
+    if not hasattr(os, "killpg"):
+        # Windows: グループ単位の停止はできないので本体だけを止める
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+        return None
+    if grace <= 0:
+        signal_process_group(proc.pid, signal.SIGKILL)
+        return None
+    logging.info("Stopping claude process group %s (grace %ss)", proc.pid, grace)
+    signal_process_group(proc.pid, signal.SIGTERM)
+    with _kill_lock:
+        # 停止済みならそのタイマー（先に期限が来る）を使う
+        timer = _kill_timers.get(proc)
+        if timer is None:
+            timer = threading.Timer(grace, _kill_after_grace, (proc,))
+            timer.daemon = True
+            _kill_timers[proc] = timer
+            timer.start()
+    return timer
+
+
+def _kill_after_grace(proc):
+    """猶予が過ぎたらグループに残っているプロセスをSIGKILL"""
+    with _kill_lock:
+        if _kill_timers.pop(proc, None) is None:
+            return
+        # 本体を回収する前ならグループIDはまだこのプロセスのもの（回収後は別のプロセスに再利用されうるので送らない）
+        if proc.returncode is None:
+            signal_process_group(proc.pid, signal.SIGKILL)
+
+
+def process_reaped(proc):
+    """
+    プロセス本体を回収したら呼ぶ（猶予中のSIGKILLタイマーを取り消す）
+    停止中だった場合は、SIGTERMを無視して残った子プロセスをここでSIGKILLする
+    （グループに残っているプロセスがある間はグループIDが再利用されないので、回収直後なら安全に送れる）
+
+    Args:
+        proc: stop_process_tree に渡したプロセス
+    """
+    with _kill_lock:
+        timer = _kill_timers.pop(proc, None)
+    if timer is None:
+        return
+    timer.cancel()
+    signal_process_group(proc.pid, signal.SIGKILL)
+
+
+def stop_all(active_processes: dict):
+    """
+    実行中のプロセスをすべてグループごと停止（ボットの終了時用）
+    別のセッションで起動しているため、端末のCtrl-Cはツールの子プロセスまで届かない
+
+    Args:
+        active_processes: アクティブプロセスの辞書
+    """
+    for proc in list(active_processes.values()):
+        stop_process_tree(proc, grace=0)
@@ -0,0 +1,237 @@
+"""
+実行結果キャッシュモジュール
+同じリポジトリの状態に対する同じ依頼（READMEの要約など）は最終出力を使い回し、
+同時に届いた同じ依頼は1回のClaude CLI実行を共有する（single-flight）
+"""
+import os
+import re
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+import subprocess
+from collections import OrderedDict
+
+from ..utils import metrics
+
+# 1件あたりに保存する最終出力の上限（文字数）
+MAX_RESULT_CHARS = 200_000
+
+# 同じ依頼の完了を待っている間、停止されていないかを確認する間隔（秒）
+WAIT_POLL_INTERVAL = 1.0
+
+
+def normalize_prompt(prompt: str) -> str:
+    """空白の違いと大文字・小文字の違いを無視するよう正規化"""
+    return re.sub(r"\s+", " ", prompt).strip().casefold()
+
+
+def repo_state(cwd: str) -> str | None:
+    """
+    作業ディレクトリのリポジトリの状態を表すハッシュ（HEADと未コミットの変更・未追跡ファイルから計算）
+
+    Args:
+        cwd: 作業ディレクトリ
+
+    Returns:
+        ハッシュ文字列（gitリポジトリでない・gitが使えない場合はNone）
+    """
+    digest = hashlib.sha256()
+    outputs = []
+    commands = [
+        ["git", "rev-parse", "HEAD"],
+        ["git", "diff", "HEAD", "--binary"],
+        # 未追跡ファイルは内容まで読まず、一覧とサイズ・更新時刻で変化を検出する
+        ["git", "ls-files", "--others", "--exclude-standard", "-z"],
+    ]
+    for args in commands:
+        try:
+            result = subprocess.run(args, cwd=cwd, capture_output=True, timeout=30)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logging.warning("repo_state: %s failed: %s", " ".join(args), e)
+            return None
+        if result.returncode != 0:
+            return None
+        digest.update(result.stdout)
+        digest.update(b"\0")
+        outputs.append(result.stdout)
+    for name in outputs[-1].split(b"\0"):
+        if not name:
+            continue
+        try:
+            st = os.stat(os.path.join(os.fsencode(cwd), name))
+        except OSError:
+            continue
+        digest.update(f"{st.st_size}:{st.st_mtime_ns}\0".encode())
+    return digest.hexdigest()
+
+
+def format_cache_age(created_at: float) -> str:
+    """結果を保存してからの経過時間（「3分前」など）"""
+    elapsed = int(time.time() - created_at)
+    if elapsed < 60:
+        return "1分以内"
+    if elapsed < 3600:
+        return f"{elapsed // 60}分前"
+    return f"{elapsed // 3600}時間前"
+
+
+def cache_key(prompt: str, cwd: str, args: list, state: str) -> str:
+    """正規化したプロンプト・実行先・リポジトリの状態からキャッシュキーを作る"""
+    material = "\0".join([normalize_prompt(prompt), cwd, " ".join(args), state])
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+class CachedResult:
+    """キャッシュした最終出力"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.created_at = time.time()
+
+
+class ResultCache:
+    """
+    最終出力のキャッシュ（有効期限と件数の上限つきLRU）
+    同じキーの実行中に届いた依頼は、実行の完了を待って結果を共有する
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 100, wait_timeout: float = 600.0):
+        """
+        Args:
+            ttl: 結果を使い回す秒数
+            max_entries: 保持する結果の上限（超えた分は使われていない順に削除）
+            wait_timeout: 同じ依頼の完了を待つ最大秒数（超えたら待つのをやめて自分で実行する）
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout
+        self._entries = OrderedDict()  # key -> CachedResult
+        self._inflight = set()
+        self._waiters = set()  # 同じ依頼の完了を待っている依頼（スレッドのts）
+        self._cond = threading.Condition()
+
+    def acquire(self, key: str, waiter: str | None = None, cancelled=None) -> tuple:
+        """
+        キャッシュを引く（同じキーを実行中なら完了まで待つ）
+
+        Args:
+            key: cache_key で作ったキー
+            waiter: 待っている依頼の識別子（スレッドのts。is_waiting で停止対象かを判定する）
+            cancelled: 待つのをやめるべきかを返す関数（停止されたらTrue）
+
+        Returns:
+            (キャッシュした結果, 実行を担当するか)
+            結果がNoneなら呼び出し側が実行する。担当する場合は必ず release を呼ぶこと
+            （停止された・待ち時間の上限を超えた場合は (None, False)）
+        """
+        waited = False
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            try:
+                while True:
+                    entry = self._get(key)
+                    if entry is not None:
+                        metrics.RESULT_CACHE.labels("shared" if waited else "hit").inc()
+                        return entry, False
+                    if key not in self._inflight:
+                        self._inflight.add(key)
+                        metrics.RESULT_CACHE.labels("miss").inc()
+                        return None, True
+                    if self._give_up(deadline, cancelled):
+                        return None, False
+                    if waiter is not None:
+                        self._waiters.add(waiter)
+                    waited = True
+                    self._cond.wait(min(deadline - time.monotonic(), WAIT_POLL_INTERVAL))
+            finally:
+                self._waiters.discard(waiter)
+
+    def is_waiting(self, waiter: str) -> bool:
+        """指定した依頼が同じ依頼の完了を待っているか（stop で取り消す対象か）"""
+        with self._cond:
+            return waiter in self._waiters
+
+    def release(self, key: str, text: str | None):
+        """
+        実行結果を登録し、待っている依頼を起こす
+
+        Args:
+            key: acquire に渡したキー
+            text: 最終出力（失敗した・保存しない場合はNone。待っていた依頼のうち1件が代わりに実行する）
+        """
+        with self._cond:
+            self._inflight.discard(key)
+            self._put(key, text)
+            self._cond.notify_all()
+
+    def _give_up(self, deadline: float, cancelled) -> bool:
+        """停止されたか待ち時間の上限を超えたら、待つのをやめる"""
+        if cancelled is not None and cancelled():
+            return True
+        if time.monotonic() >= deadline:
+            logging.warning("Result cache: gave up waiting for an identical request after %gs", self.wait_timeout)
+            metrics.RESULT_CACHE.labels("timeout").inc()
+            return True
+        return False
+
+    def _get(self, key: str) -> CachedResult | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry.created_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put(self, key: str, text: str | None):
+        if text is None or len(text) > MAX_RESULT_CHARS:
+            return
+        self._entries[key] = CachedResult(text)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class AsyncResultCache(ResultCache):
+    """ResultCache のasyncio版（同じキーの実行の完了をイベントループ上で待つ）"""
+
+    def __init__(self, ttl: float, max_entries: int = 100, wait_timeout: float = 600.0):
+        super().__init__(ttl, max_entries, wait_timeout)
+        self._events = {}  # key -> asyncio.Event
+
+    async def acquire(self, key: str, waiter: str | None = None, cancelled=None) -> tuple:
+        """キャッシュを引く（同じキーを実行中なら完了まで待つ。戻り値は ResultCache.acquire と同じ）"""
+        waited = False
+        deadline = time.monotonic() + self.wait_timeout
+        try:
+            while True:
+                entry = self._get(key)
+                if entry is not None:
+                    metrics.RESULT_CACHE.labels("shared" if waited else "hit").inc()
+                    return entry, False
+                event = self._events.get(key)
+                if event is None:
+                    self._events[key] = asyncio.Event()
+                    metrics.RESULT_CACHE.labels("miss").inc()
+                    return None, True
+                if self._give_up(deadline, cancelled):
+                    return None, False
+                if waiter is not None:
+                    self._waiters.add(waiter)
+                waited = True
+                try:
+                    await asyncio.wait_for(event.wait(), min(deadline - time.monotonic(), WAIT_POLL_INTERVAL))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._waiters.discard(waiter)
+
+    def release(self, key: str, text: str | None):
+        """実行結果を登録し、待っている依頼を起こす"""
+        self._put(key, text)
+        event = self._events.pop(key, None)
+        if event is not None:
+            event.set()
@@ -0,0 +1,178 @@
+"""
+ルーティングモジュール
+チャンネルやプロンプトの先頭の文字列から実行先（作業ディレクトリ・CLI引数・同時実行数）を決め、
+実行先ごとのスケジューラーにジョブを振り分ける（忙しいリポジトリが他のリポジトリの枠を使い切らないようにする）
+"""
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from ..config import DEFAULT_CWD, MAX_CONCURRENT_JOBS, MAX_QUEUED_JOBS
+
+# 覚えておくスレッドと実行先の対応の上限
+MAX_THREAD_ROUTES = 5000
+
+
+class Route:
+    """1つの実行先"""
+
+    def __init__(self, name: str, cwd: str, args: list | None = None, max_concurrent: int = MAX_CONCURRENT_JOBS,
+                 max_queue: int = MAX_QUEUED_JOBS, channels: list | None = None, prefix: str | None = None):
+        """
+        Args:
+            name: 実行先の名前（ログ・メトリクスのラベルに使う）
+            cwd: Claude CLIを実行する作業ディレクトリ
+            args: Claude CLIに追加で渡す引数
+            max_concurrent: この実行先の同時実行数
+            max_queue: この実行先の待機キューの最大長（0なら無制限）
+            channels: この実行先に振り分けるチャンネルID
+            prefix: プロンプトがこの文字列で始まれば振り分ける（振り分け後に取り除く）
+        """
+        self.name = name
+        self.cwd = cwd
+        self.args = list(args or [])
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.channels = set(channels or [])
+        self.prefix = prefix
+        self.scheduler = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Route":
+        """ルーティングファイルの1項目から作成"""
+        name = data.get("name")
+        cwd = data.get("cwd")
+        if not name or not cwd:
+            raise ValueError(f"route requires 'name' and 'cwd': {data}")
+        cwd = os.path.expanduser(cwd)
+        if not Path(cwd).is_dir():
+            raise ValueError(f"route '{name}': cwd does not exist: {cwd}")
+        return cls(
+            name,
+            cwd,
+            args=data.get("args"),
+            max_concurrent=int(data.get("max_concurrent", MAX_CONCURRENT_JOBS)),
+            max_queue=int(data.get("max_queue", MAX_QUEUED_JOBS)),
+            channels=data.get("channels"),
+            prefix=data.get("prefix"),
+        )
+
+
+class Router:
+    """メンションを実行先に振り分けるクラス"""
+
+    def __init__(self, routes: list, default: Route):
+        """
+        Args:
+            routes: 実行先のリスト（先に書いたものが優先）
+            default: どれにも当てはまらない場合の実行先
+        """
+        self.routes = list(routes)
+        self.default = default
+        self._threads = OrderedDict()  # thread_ts -> Route
+        self._lock = threading.Lock()
+
+    @property
+    def all_routes(self) -> list:
+        """既定の実行先を含むすべての実行先"""
+        return [self.default] + self.routes
+
+    @property
+    def schedulers(self) -> list:
+        """実行先ごとのスケジューラー"""
+        return [route.scheduler for route in self.all_routes]
+
+    def create_schedulers(self, scheduler_class):
+        """
+        実行先ごとにスケジューラーを作成
+
+        Args:
+            scheduler_class: JobScheduler / AsyncJobScheduler（または同じ引数で分散実行用のスケジューラーを作る関数）
+        """
+        for route in self.all_routes:
+            name = "claude" if route is self.default else f"claude-{route.name}"
+            route.scheduler = scheduler_class(route.max_concurrent, route.max_queue, name=name)
+
+    def resolve(self, channel: str, thread_ts: str, prompt: str) -> tuple:
+        """
+        依頼の実行先を決める（スレッドの前回の実行先 → 先頭の文字列 → チャンネル → 既定 の順）
+        セッションは作業ディレクトリごとに保存されるため、一度振り分けたスレッドの続きは同じ実行先で動かす
+
+        Args:
+            channel: チャンネルID
+            thread_ts: スレッドID
+            prompt: プロンプト文字列
+
+        Returns:
+            (Route, 振り分け用の文字列を取り除いたプロンプト)
+        """
+        with self._lock:
+            route = self._threads.get(thread_ts)
+        if route is None:
+            route = next((r for r in self.routes if r.prefix and prompt.startswith(r.prefix)), None)
+        if route is None:
+            route = self.route_for_thread(channel, thread_ts)
+        if route.prefix and prompt.startswith(route.prefix):
+            prompt = prompt[len(route.prefix):].strip()
+        self._remember(thread_ts, route)
+        return route, prompt
+
+    def route_for_thread(self, channel: str, thread_ts: str) -> Route:
+        """
+        スレッドの実行先（振り分け済みならその実行先、なければチャンネルで決める）
+
+        Args:
+            channel: チャンネルID
+            thread_ts: スレッドID
+
+        Returns:
+            Route
+        """
+        with self._lock:
+            route = self._threads.get(thread_ts)
+        if route is not None:
+            return route
+        for route in self.routes:
+            if channel in route.channels:
+                return route
+        return self.default
+
+    def _remember(self, thread_ts: str, route: Route):
+        """同じスレッドの続きを同じ実行先で動かすために覚えておく"""
+        with self._lock:
+            self._threads[thread_ts] = route
+            self._threads.move_to_end(thread_ts)
+            while len(self._threads) > MAX_THREAD_ROUTES:
+                self._threads.popitem(last=False)
+
+
+def load_router(path: str | None) -> Router:
+    """
+    ルーティングファイル（JSON）を読み込む（ファイルがなければDEFAULT_CWDだけの実行先にする）
+
+    ファイルの形式:
+        {"routes": [{"name": "api", "cwd": "~/src/api", "channels": ["C0123"], "prefix": "api:",
+                     "args": ["--model", "sonnet"], "max_concurrent": 2, "max_queue": 10}]}
+
+    Args:
+        path: ルーティングファイルのパス
+
+    Returns:
+        Router
+    """
+    default = Route("default", DEFAULT_CWD)
+    if not path or not Path(path).is_file():
+        return Router([], default)
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    routes = [Route.from_dict(item) for item in data.get("routes", [])]
+    names = [route.name for route in routes]
+    if len(set(names)) != len(names) or "default" in names:
+        raise ValueError(f"route names must be unique and not 'default': {names}")
+    for route in routes:
+        logging.info("Route %s: cwd=%s channels=%s prefix=%s max_concurrent=%d",
+                     route.name, route.cwd, sorted(route.channels), route.prefix, route.max_concurrent)
+    return Router(routes, default)
@@ -2,13 +2,120 @@
 Claude CLI実行モジュール
 """
 import os
-import json
+import time
 import logging
 import threading
+from collections import deque
 from subprocess import Popen, PIPE
 
-from ..config import CLAUDE_BIN, DEFAULT_CWD
+from ..config import CLAUDE_BIN, DEFAULT_CWD, STDERR_HEAD_BYTES, STDERR_TAIL_BYTES
 from .events import EventHandler
+from .parser import decode, parse_text_delta
+from .limits import LIMITS, wait_with_usage, record_usage
+from .process import stop_process_tree, process_reaped
+from ..utils import metrics, tracing
+
+
+class StderrCapture:
+    """
+    stderrの先頭と末尾だけを保持するバッファ
+    バイト数を積算で管理し、末尾はdequeのリングで古い行から捨てるため1行あたり定数時間で済む
+    """
+
+    def __init__(self, head_bytes: int = STDERR_HEAD_BYTES, tail_bytes: int = STDERR_TAIL_BYTES):
+        """
+        Args:
+            head_bytes: 先頭として保持するバイト数（超えた行から末尾側に回す）
+            tail_bytes: 末尾として保持するバイト数
+        """
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = []
+        self.tail = deque()
+        self._head_size = 0
+        self._tail_size = 0
+
+    def add(self, line: str, size: int | None = None):
+        """
+        1行を追加
+
+        Args:
+            line: stderrの1行
+            size: 行のバイト数（省略時はUTF-8で数える）
+        """
+        if size is None:
+            size = len(line.encode())
+        if self._head_size < self.head_bytes:
+            self.head.append(line)
+            self._head_size += size
+            return
+        self.tail.append((line, size))
+        self._tail_size += size
+        while self._tail_size > self.tail_bytes:
+            _, dropped = self.tail.popleft()
+            self._tail_size -= dropped
+
+    def emit(self, on_stderr: callable):
+        """保持している先頭・末尾をon_stderrに渡す"""
+        if self.head:
+            on_stderr("[DEBUG] stderr head\n" + "".join(self.head))
+        if self.tail:
+            on_stderr("[DEBUG] stderr tail\n" + "".join(line for line, _ in self.tail))
+
+
+def build_claude_args(
+    prompt: str | None = None,
+    session_id: str | None = None,
+    resume: bool = False,
+    stream_input: bool = False,
+    extra_args: list | None = None,
+) -> list:
+    """
+    Claude CLIの起動引数を組み立てる
+
+    Args:
+        prompt: プロンプト文字列（stream_input 時は起動後にstdinから渡すので不要）
+        session_id: セッションID（指定時はこのIDでセッションを作成・再開）
+        resume: 既存セッションを再開するか
+        stream_input: プロンプトをstdinからstream-jsonで受け取るモードで起動するか
+        extra_args: 実行先ごとの追加の引数
+
+    Returns:
+        引数リスト
+    """
+    args = [
+        CLAUDE_BIN,
+        "--print",
+        "--verbose",
+        "--output-format", "stream-json",
+        "--include-partial-messages",
+        "--permission-mode", "bypassPermissions",
+    ]
+    if stream_input:
+        args += ["--input-format", "stream-json"]
+    if session_id:
+        args += ["--resume" if resume else "--session-id", session_id]
+    if extra_args:
+        args += extra_args
+    if prompt is not None:
+        args.append(prompt)
+    return args
+
+
+def build_claude_env() -> dict:
+    """
+    Claude CLI用の環境変数を組み立てる
+
+    Returns:
+        環境変数の辞書
+    """
+    env = {
+        **os.environ,
+        "PATH": f"/opt/homebrew/bin:/usr/local/bin:{os.environ.get('PATH', '')}",
+    }
+    # ANTHROPIC_API_KEYを削除してOAuth認証を使用
+    env.pop("ANTHROPIC_API_KEY", None)
+    return env
 
 
 def run_claude_streaming(
@@ -20,6 +127,11 @@ def run_claude_streaming(
     message_stopped: list | None = None,
     active_processes: dict | None = None,
     active_lock = None,
+    session_id: str | None = None,
+    resume: bool = False,
+    warm_process=None,
+    cwd: str | None = None,
+    extra_args: list | None = None,
 ) -> int:
     """
     Claude CLIをストリーミングモードで実行
@@ -33,6 +145,12 @@ def run_claude_streaming(
         message_stopped: メッセージ停止フラグ
         active_processes: アクティブプロセスの辞書
         active_lock: プロセス管理用のロック
+        session_id: Claude CLIのセッションID
+        resume: 既存セッションを再開するか
+        warm_process: プールから取り出した起動済みプロセス（指定時は新たに起動せずプロンプトを書き込む。
+            セッションIDはプロセス側のものを使う）
+        cwd: 作業ディレクトリ（省略時はDEFAULT_CWD）
+        extra_args: Claude CLIに追加で渡す引数
 
     Returns:
         終了コード
@@ -42,67 +160,73 @@ def run_claude_streaming(
     if message_stopped is None:
         message_stopped = [False]
 
-    args = [
-        CLAUDE_BIN,
-        "--print",
-        "--verbose",
-        "--output-format", "stream-json",
-        "--include-partial-messages",
-        "--permission-mode", "bypassPermissions",
-        prompt,
-    ]
-
-    env = {
-        **os.environ,
-        "PATH": f"/opt/homebrew/bin:/usr/local/bin:{os.environ.get('PATH', '')}",
-    }
-    # ANTHROPIC_API_KEYを削除してOAuth認証を使用
-    env.pop("ANTHROPIC_API_KEY", None)
+    if warm_process is not None:
+        session_id = warm_process.session_id
 
     proc: Popen | None = None
+    cgroup = None
+    timer = None
+    returncode = 1
+    span = tracing.start_span(
+        "claude.process", claude_session_id=session_id, claude_resume=resume, claude_warm=warm_process is not None
+    )
     try:
-        logging.info("Starting claude process: %s", " ".join(args))
-        proc = Popen(
-            args,
-            cwd=DEFAULT_CWD,
-            env=env,
-            stdout=PIPE,
-            stderr=PIPE,
-            text=True,
-            bufsize=1,
-        )
-        logging.info("Claude process started with PID: %s", proc.pid)
+        started = time.monotonic()
+        if warm_process is not None:
+            proc = warm_process.proc
+            cgroup = warm_process.cgroup
+            logging.info("Using warm claude process PID %s", proc.pid)
+            warm_process.send_prompt(prompt)
+        else:
+            args = build_claude_args(prompt, session_id, resume, extra_args=extra_args)
+            logging.info("Starting claude process: %s", " ".join(args))
+            proc = Popen(
+                args,
+                cwd=cwd or DEFAULT_CWD,
+                env=build_claude_env(),
+                stdout=PIPE,
+                stderr=PIPE,
+                text=True,
+                bufsize=1,
+                preexec_fn=LIMITS.preexec_fn(),
+                # 停止時にツールの子プロセスもまとめて止められるよう、専用のプロセスグループで起動
+                start_new_session=True,
+            )
+            logging.info("Claude process started with PID: %s", proc.pid)
+            cgroup = LIMITS.place(proc.pid)
+        first_event = True
+        span.set_attribute("claude.pid", proc.pid)
+        span.add_event("spawned")
 
         # このスレッド(ts)にぶら下がるプロセスとして登録
         if thread_ts and active_processes is not None and active_lock is not None:
             with active_lock:
                 active_processes[thread_ts] = proc
 
-        # STDERR を別スレッドで処理
-        stderr_first, stderr_last = [], []
+        # 実行時間の上限に達したら停止
+        timer = LIMITS.start_timer(
+            lambda: stop_process_tree(proc), lambda: on_stderr(f"[ERROR] 実行時間の上限（{LIMITS.timeout:g}秒）を超えたため停止しました\n")
+        )
+
+        # STDERR を別スレッドで処理（先頭と末尾だけを保持）
+        # 起動済みプロセスのstderrはプール側で読み続けているので、終了時にまとめて受け取る
+        stderr_capture = StderrCapture()
 
         def _drain_stderr():
             try:
                 if proc.stderr:
                     for line in proc.stderr:
-                        if not line:
-                            continue
-                        if sum(len(x.encode()) for x in stderr_first) < 2048:
-                            stderr_first.append(line)
-                        else:
-                            stderr_last.append(line)
-                            while sum(len(x.encode()) for x in stderr_last) > 2048:
-                                stderr_last.pop(0)
+                        if line:
+                            stderr_capture.add(line)
             except Exception as e:
                 logging.warning("stderr reader error: %s", e)
             finally:
-                if stderr_first:
-                    on_stderr("[DEBUG] stderr head\n" + "".join(stderr_first))
-                if stderr_last:
-                    on_stderr("[DEBUG] stderr tail\n" + "".join(stderr_last))
+                stderr_capture.emit(on_stderr)
 
-        t = threading.Thread(target=_drain_stderr, daemon=True)
-        t.start()
+        t = None
+        if warm_process is None:
+            t = threading.Thread(target=_drain_stderr, daemon=True)
+            t.start()
 
         # イベントハンドラー初期化
         event_handler = EventHandler(on_stdout, current_tools, message_stopped)
@@ -115,35 +239,68 @@ def run_claude_streaming(
                 line = raw.strip()
                 if not line:
                     continue
+                if first_event:
+                    metrics.CLI_TIME_TO_FIRST_TOKEN.observe(time.monotonic() - started)
+                    span.add_event("first_token")
+                    first_event = False
+
+                logging.debug("RAW STDOUT: %.200s", line)
 
-                logging.info("RAW STDOUT: %s", line[:200])
+                # トークンごとのテキストデルタは辞書を作らずに処理
+                text = parse_text_delta(line)
+                if text is not None:
+                    event_handler.handle_text_delta(text)
+                    continue
 
                 # JSON 以外は捨てる
                 try:
-                    evt = json.loads(line)
+                    evt = decode(line)
                 except Exception as e:
-                    logging.info("JSON parse failed: %s (line: %s)", e, line[:100])
+                    logging.info("JSON parse failed: %s (line: %.100s)", e, line)
                     continue
 
                 # イベント処理
                 event_handler.handle_event(evt)
 
-        proc.wait()
-        logging.info("Claude process finished with code: %s", proc.returncode)
-        t.join(timeout=5)
-        return int(proc.returncode or 0)
+        # ジョブ全体のピークメモリとCPU時間を記録（cgroupがあればツールのプロセスも含めた値を使う）
+        usage = wait_with_usage(proc)
+        process_reaped(proc)
+        if cgroup is not None:
+            usage.update(cgroup.usage())
+            cgroup.remove()
+        record_usage(usage, span)
+        returncode = int(proc.returncode or 0)
+        logging.info("Claude process finished with code: %s", returncode)
+        metrics.CLI_EXIT.labels(returncode).inc()
+        span.set_attribute("claude.exit_code", returncode)
+        if t is not None:
+            # プロセスグループごと終了していればstderrはEOFになっている
+            t.join(timeout=5)
+            if t.is_alive():
+                logging.warning("stderr reader did not finish (a descendant may still hold the pipe)")
+        else:
+            warm_process.take_stderr(wait=True).emit(on_stderr)
+        return returncode
 
     except Exception as e:
         logging.exception("run_claude_streaming error")
+        span.record_error(e)
         try:
             if proc and proc.poll() is None:
-                proc.kill()
+                stop_process_tree(proc, grace=0)
         except Exception:
             pass
         on_stderr(f"[ERROR] {type(e).__name__}: {e}\n")
         return 1
     finally:
-        # 終了時はこのスレッド(ts)から除外
+        if timer is not None:
+            timer.cancel()
+        span.end()
+        if warm_process is not None:
+            # 使い終わったプロセスは再利用せず、プールに補充させる
+            warm_process.release()
+        # 終了時はこのスレッド(ts)から除外（同じスレッドの新しい実行が登録済みならそのまま残す）
         if thread_ts and active_processes is not None and active_lock is not None:
             with active_lock:
-                active_processes.pop(thread_ts, None)
+                if active_processes.get(thread_ts) is proc:
+                    active_processes.pop(thread_ts, None)
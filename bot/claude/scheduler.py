@@ -0,0 +1,441 @@
+"""
+ジョブスケジューラーモジュール
+Claude CLIの同時実行数を制限し、あふれたジョブをFIFOキューで待機させる
+同じキー（スレッド）のジョブは同時に実行せず、前のジョブが終わるまで待たせる
+"""
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+
+from ..utils import metrics
+
+
+class Job:
+    """スケジューラーに投入される1件のジョブ"""
+
+    def __init__(self, key, user_id, func, payload=None, context=None):
+        """
+        Args:
+            key: ジョブの識別キー（SlackスレッドID）
+            user_id: 依頼したユーザーID
+            func: ワーカースレッドで実行する関数（引数なし）
+            payload: ジョブの内容（coalesce で後続の依頼がまとめられると payloads に追加される）
+            context: 別のノードで実行するときに必要な情報（JSONにできる値、分散実行時のみ使用）
+        """
+        self.key = key
+        self.user_id = user_id
+        self.func = func
+        self.payloads = [payload] if payload is not None else []
+        self.context = context or {}
+        self.enqueued_at = time.time()
+        self.started_at = None
+
+
+def _next_runnable(queue: deque, running: dict) -> Job | None:
+    """同じキーのジョブが実行中でない先頭のジョブをキューから取り出す"""
+    for i, job in enumerate(queue):
+        if job.key not in running:
+            del queue[i]
+            return job
+    return None
+
+
+def _queue_position(keys: list, running_keys, index: int, idle: int) -> int:
+    """
+    キューの index 番目のジョブの待ち順位（_next_runnable と同じ規則で数える）
+    同じキーのジョブが実行中か、キューの前に並んでいるジョブは先に取り出されないため数えない
+
+    Args:
+        keys: 待機中のジョブのキー（キューの先頭から順に）
+        running_keys: 実行中のジョブのキー
+        index: 対象のジョブの位置
+        idle: 空いているワーカー数
+
+    Returns:
+        待ち順位（0ならすぐに実行開始）
+    """
+    blocked = set(running_keys)
+    ahead = 0
+    for key in keys[:index]:
+        if key not in blocked:
+            ahead += 1
+            blocked.add(key)
+    position = max(0, ahead + 1 - idle)
+    # 同じスレッドの先行ジョブが終わるまでは始まらない
+    return max(1, position) if keys[index] in blocked else position
+
+
+class _SchedulerMetrics:
+    """スケジューラー1つぶんのメトリクス（ラベルにスケジューラー名を付ける）"""
+
+    def __init__(self, scheduler, queued=None):
+        """
+        Args:
+            scheduler: 対象のスケジューラー
+            queued: 待機中のジョブ数を返す関数（省略時はスケジューラーのキューの長さ）
+        """
+        name = scheduler.name
+        self.submitted = metrics.JOBS_SUBMITTED.labels(name)
+        self.rejected = metrics.JOBS_REJECTED.labels(name)
+        self._started = metrics.JOBS_STARTED.labels(name)
+        self._ok = metrics.JOBS_FINISHED.labels(name, "completed")
+        self._failed = metrics.JOBS_FINISHED.labels(name, "failed")
+        self._wait = metrics.JOB_QUEUE_WAIT.labels(name)
+        self._duration = metrics.JOB_DURATION.labels(name)
+        metrics.JOBS_RUNNING.labels(name).set_function(lambda: len(scheduler._running))
+        metrics.JOBS_QUEUED.labels(name).set_function(queued or (lambda: len(scheduler._queue)))
+
+    def started(self, wait: float):
+        self._started.inc()
+        self._wait.observe(wait)
+
+    def finished(self, ok: bool, duration: float):
+        (self._ok if ok else self._failed).inc()
+        self._duration.observe(duration)
+
+
+class JobScheduler:
+    """固定数のワーカースレッドでジョブを実行するスケジューラー"""
+
+    def __init__(self, max_workers: int, max_queue: int = 0, name: str = "claude"):
+        """
+        Args:
+            max_workers: 同時に実行するジョブの最大数
+            max_queue: 待機キューの最大長（0なら無制限）
+            name: ログ・スレッド名に使う名前
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max_queue
+        self.name = name
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._running = {}  # key -> Job
+        self._shutdown = False
+
+        # メトリクス
+        self.submitted = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._metrics = _SchedulerMetrics(self)
+
+        self._workers = []
+
+    def start(self):
+        """ワーカースレッドを起動（起動するまで投入したジョブは待機キューに溜まる）"""
+        for i in range(self.max_workers):
+            t = threading.Thread(target=self._worker, name=f"{self.name}-worker-{i}", daemon=True)
+            t.start()
+            self._workers.append(t)
+
+    def submit(self, job: Job) -> int | None:
+        """
+        ジョブを投入
+
+        Args:
+            job: 投入するジョブ
+
+        Returns:
+            待ち順位（0ならすぐに実行開始、Noneならキュー満杯で拒否）
+        """
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("scheduler is shut down")
+            idle = self.max_workers - len(self._running)
+            if self.max_queue and len(self._queue) - idle >= self.max_queue:
+                self.rejected += 1
+                self._metrics.rejected.inc()
+                logging.warning("[%s] queue full, rejected job: key=%s", self.name, job.key)
+                return None
+            self._queue.append(job)
+            self.submitted += 1
+            self._metrics.submitted.inc()
+            position = self._position_at(len(self._queue) - 1)
+            self._cond.notify()
+        logging.info("[%s] job queued: key=%s position=%d depth=%d",
+                     self.name, job.key, position, len(self._queue))
+        return position
+
+    def coalesce(self, key, payload) -> int | None:
+        """
+        同じキーの待機中ジョブがあれば、その内容に payload を追加する
+
+        Args:
+            key: ジョブの識別キー
+            payload: 追加する内容
+
+        Returns:
+            まとめた先のジョブの待ち順位（1始まり）、待機中のジョブがなければNone
+        """
+        with self._cond:
+            for i, job in enumerate(self._queue):
+                if job.key == key:
+                    job.payloads.append(payload)
+                    logging.info("[%s] coalesced follow-up into queued job: key=%s payloads=%d",
+                                 self.name, key, len(job.payloads))
+                    return max(1, self._position_at(i))
+        return None
+
+    def position(self, key) -> int | None:
+        """
+        指定キーのジョブの待ち順位を取得
+
+        Returns:
+            待ち順位（1始まり）、待機中でなければNone
+        """
+        with self._cond:
+            for i, job in enumerate(self._queue):
+                if job.key == key:
+                    return max(1, self._position_at(i))
+        return None
+
+    def _position_at(self, index: int) -> int:
+        """キューの index 番目のジョブの待ち順位（ロックを取ってから呼ぶ）"""
+        keys = [job.key for job in self._queue]
+        return _queue_position(keys, self._running, index, self.max_workers - len(self._running))
+
+    def is_running(self, key) -> bool:
+        """指定キーのジョブが実行中かどうか"""
+        with self._cond:
+            return key in self._running
+
+    def cancel(self, key) -> int:
+        """
+        指定キーの待機中ジョブを取り消す（実行中のジョブには影響しない）
+
+        Returns:
+            取り消したジョブ数
+        """
+        with self._cond:
+            remaining = deque(job for job in self._queue if job.key != key)
+            cancelled = len(self._queue) - len(remaining)
+            self._queue = remaining
+        if cancelled:
+            logging.info("[%s] cancelled %d queued job(s): key=%s", self.name, cancelled, key)
+        return cancelled
+
+    def stats(self) -> dict:
+        """キュー深さ・待ち時間などの統計を取得"""
+        with self._cond:
+            return {
+                "running": len(self._running),
+                "queued": len(self._queue),
+                "max_workers": self.max_workers,
+                "submitted": self.submitted,
+                "started": self.started,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait": self.total_wait / self.started if self.started else 0.0,
+                "max_wait": self.max_wait,
+            }
+
+    def shutdown(self, wait: bool = True):
+        """ワーカースレッドを停止（待機中のジョブは破棄）"""
+        with self._cond:
+            self._shutdown = True
+            self._queue.clear()
+            self._cond.notify_all()
+        if wait:
+            for t in self._workers:
+                t.join()
+
+    def _worker(self):
+        """ワーカースレッド本体"""
+        while True:
+            with self._cond:
+                job = None
+                while not self._shutdown:
+                    job = _next_runnable(self._queue, self._running)
+                    if job is not None:
+                        break
+                    self._cond.wait()
+                if self._shutdown:
+                    return
+                job.started_at = time.time()
+                self._running[job.key] = job
+                wait = job.started_at - job.enqueued_at
+                self.started += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                depth = len(self._queue)
+            self._metrics.started(wait)
+
+            logging.info("[%s] job started: key=%s wait=%.2fs depth=%d",
+                         self.name, job.key, wait, depth)
+            ok = False
+            try:
+                job.func()
+                ok = True
+            except Exception:
+                logging.exception("[%s] job failed: key=%s", self.name, job.key)
+            finally:
+                with self._cond:
+                    self._running.pop(job.key, None)
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+                    # 同じスレッドの後続ジョブが実行可能になったことを知らせる
+                    self._cond.notify_all()
+                self._metrics.finished(ok, time.time() - job.started_at)
+                logging.info("[%s] job finished: key=%s duration=%.2fs",
+                             self.name, job.key, time.time() - job.started_at)
+
+
+class AsyncJobScheduler:
+    """固定数のワーカータスクでコルーチンジョブを実行するスケジューラー（asyncio版）"""
+
+    def __init__(self, max_workers: int, max_queue: int = 0, name: str = "claude"):
+        """
+        Args:
+            max_workers: 同時に実行するジョブの最大数
+            max_queue: 待機キューの最大長（0なら無制限）
+            name: ログに使う名前
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max_queue
+        self.name = name
+
+        self._queue = deque()
+        self._wakeup = None
+        self._running = {}  # key -> Job
+        self._workers = []
+
+        # メトリクス
+        self.submitted = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._metrics = _SchedulerMetrics(self)
+
+    def start(self):
+        """ワーカータスクを起動（イベントループ上で呼ぶこと）"""
+        self._wakeup = asyncio.Condition()
+        for _ in range(self.max_workers):
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def submit(self, job: Job) -> int | None:
+        """
+        ジョブを投入
+
+        Args:
+            job: 投入するジョブ（funcは引数なしのコルーチン関数）
+
+        Returns:
+            待ち順位（0ならすぐに実行開始、Noneならキュー満杯で拒否）
+        """
+        idle = self.max_workers - len(self._running)
+        if self.max_queue and len(self._queue) - idle >= self.max_queue:
+            self.rejected += 1
+            self._metrics.rejected.inc()
+            logging.warning("[%s] queue full, rejected job: key=%s", self.name, job.key)
+            return None
+        self._queue.append(job)
+        self.submitted += 1
+        self._metrics.submitted.inc()
+        position = self._position_at(len(self._queue) - 1)
+        async with self._wakeup:
+            self._wakeup.notify()
+        logging.info("[%s] job queued: key=%s position=%d depth=%d",
+                     self.name, job.key, position, len(self._queue))
+        return position
+
+    def coalesce(self, key, payload) -> int | None:
+        """同じキーの待機中ジョブに payload を追加し、その待ち順位を返す（待機中のジョブがなければNone）"""
+        for i, job in enumerate(self._queue):
+            if job.key == key:
+                job.payloads.append(payload)
+                logging.info("[%s] coalesced follow-up into queued job: key=%s payloads=%d",
+                             self.name, key, len(job.payloads))
+                return max(1, self._position_at(i))
+        return None
+
+    def position(self, key) -> int | None:
+        """指定キーのジョブの待ち順位（1始まり）、待機中でなければNone"""
+        for i, job in enumerate(self._queue):
+            if job.key == key:
+                return max(1, self._position_at(i))
+        return None
+
+    def _position_at(self, index: int) -> int:
+        """キューの index 番目のジョブの待ち順位"""
+        keys = [job.key for job in self._queue]
+        return _queue_position(keys, self._running, index, self.max_workers - len(self._running))
+
+    def is_running(self, key) -> bool:
+        """指定キーのジョブが実行中かどうか"""
+        return key in self._running
+
+    def cancel(self, key) -> int:
+        """指定キーの待機中ジョブを取り消し、取り消した件数を返す"""
+        remaining = deque(job for job in self._queue if job.key != key)
+        cancelled = len(self._queue) - len(remaining)
+        self._queue = remaining
+        return cancelled
+
+    def stats(self) -> dict:
+        """キュー深さ・待ち時間などの統計を取得"""
+        return {
+            "running": len(self._running),
+            "queued": len(self._queue),
+            "max_workers": self.max_workers,
+            "submitted": self.submitted,
+            "started": self.started,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait": self.total_wait / self.started if self.started else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+    async def shutdown(self):
+        """ワーカータスクを停止（待機中のジョブは破棄）"""
+        self._queue.clear()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+    async def _worker(self):
+        """ワーカータスク本体"""
+        while True:
+            async with self._wakeup:
+                await self._wakeup.wait_for(lambda: any(j.key not in self._running for j in self._queue))
+                job = _next_runnable(self._queue, self._running)
+            job.started_at = time.time()
+            self._running[job.key] = job
+            wait = job.started_at - job.enqueued_at
+            self.started += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._metrics.started(wait)
+
+            logging.info("[%s] job started: key=%s wait=%.2fs depth=%d",
+                         self.name, job.key, wait, len(self._queue))
+            ok = False
+            try:
+                await job.func()
+                self.completed += 1
+                ok = True
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.failed += 1
+                logging.exception("[%s] job failed: key=%s", self.name, job.key)
+            finally:
+                self._running.pop(job.key, None)
+                # 同じスレッドの後続ジョブが実行可能になったことを知らせる
+                async with self._wakeup:
+                    self._wakeup.notify_all()
+                self._metrics.finished(ok, time.time() - job.started_at)
+                logging.info("[%s] job finished: key=%s duration=%.2fs",
+                             self.name, job.key, time.time() - job.started_at)
@@ -3,6 +3,7 @@
 環境変数の読み込みと設定の一元管理
 """
 import os
+import socket
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -14,6 +15,10 @@ load_dotenv(env_path)
 # Claude CLI設定
 CLAUDE_BIN = os.environ.get("CLAUDE_BIN", "/usr/local/bin/claude")
 DEFAULT_CWD = os.environ.get("DEFAULT_CWD", os.getcwd())
+CLAUDE_CONFIG_DIR = os.environ.get("CLAUDE_CONFIG_DIR", str(Path.home() / ".claude"))  # CLIのセッション保存先
+ENABLE_SESSION_RESUME = os.environ.get("ENABLE_SESSION_RESUME", "true").lower() == "true"  # スレッド単位でセッションを再開
+STDERR_HEAD_BYTES = int(os.environ.get("STDERR_HEAD_BYTES", "2048"))  # Slackに送るstderrの先頭部分のバイト数
+STDERR_TAIL_BYTES = int(os.environ.get("STDERR_TAIL_BYTES", "2048"))  # Slackに送るstderrの末尾部分のバイト数
 
 # エディタ設定
 EDITOR_CMD = os.environ.get("EDITOR_CMD", "code")  # code or cursor
@@ -23,10 +28,71 @@ SLACK_BOT_TOKEN = os.environ["SLACK_BOT_TOKEN"]
 SLACK_APP_TOKEN = os.environ["SLACK_APP_TOKEN"]
 
 # スクリーンショット設定
-SCREENSHOT_OS = os.environ.get("SCREENSHOT_OS", "macos")  # macos, windows, linux
+SCREENSHOT_OS = os.environ.get("SCREENSHOT_OS", "macos")  # macos, windows, linux, headless（エディタを使わず画像に描画）
+SCREENSHOT_READY_TIMEOUT = float(os.environ.get("SCREENSHOT_READY_TIMEOUT", "10"))  # macos: エディタにファイルが表示されるまで待つ最大秒数
+SCREENSHOT_SETTLE = float(os.environ.get("SCREENSHOT_SETTLE", "0.3"))  # macos: 表示されてから撮影するまでの待ち時間（秒）
+SCREENSHOT_LINES = int(os.environ.get("SCREENSHOT_LINES", "40"))  # headless: 描画する行数
+SCREENSHOT_STYLE = os.environ.get("SCREENSHOT_STYLE", "monokai")  # headless: Pygmentsのスタイル名
+SCREENSHOT_FONT = os.environ.get("SCREENSHOT_FONT", "")  # headless: 等幅フォント名（空ならPygmentsの既定）
+SCREENSHOT_FONT_SIZE = int(os.environ.get("SCREENSHOT_FONT_SIZE", "14"))  # headless: フォントサイズ
+
+# ジョブ実行設定
+MAX_CONCURRENT_JOBS = int(os.environ.get("MAX_CONCURRENT_JOBS", "2"))  # Claude CLIの同時実行数
+MAX_QUEUED_JOBS = int(os.environ.get("MAX_QUEUED_JOBS", "20"))  # 待機キューの最大長（0なら無制限）
+ROUTES_FILE = os.environ.get("ROUTES_FILE", str(script_dir / "config" / "routes.json"))  # チャンネル・先頭の文字列ごとの実行先（なければDEFAULT_CWDのみ）
+COALESCE_FOLLOWUPS = os.environ.get("COALESCE_FOLLOWUPS", "false").lower() == "true"  # 同じスレッドの待機中の依頼を1回の実行にまとめる
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", "0"))  # 同じリポジトリの状態への同じ依頼の結果を使い回す秒数（0なら無効）
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "100"))  # 保持する結果の上限
+RESULT_CACHE_WAIT_TIMEOUT = float(os.environ.get("RESULT_CACHE_WAIT_TIMEOUT", "600"))  # 実行中の同じ依頼の完了を待つ最大秒数（超えたら自分で実行）
+CLAUDE_STOP_GRACE = float(os.environ.get("CLAUDE_STOP_GRACE", "5"))  # 停止時にSIGTERMを送ってからSIGKILLするまでの猶予（秒）
+
+# リソース制限設定（0・空なら制限しない）
+CLAUDE_MAX_MEMORY_MB = int(os.environ.get("CLAUDE_MAX_MEMORY_MB", "0"))  # 仮想メモリの上限（RLIMIT_AS、MB。Nodeは大きく予約するので余裕を持たせる）
+CLAUDE_MAX_CPU_SECONDS = int(os.environ.get("CLAUDE_MAX_CPU_SECONDS", "0"))  # CPU時間の上限（RLIMIT_CPU、秒）
+CLAUDE_NICE = int(os.environ.get("CLAUDE_NICE", "0"))  # 実行優先度の引き下げ幅（0〜19）
+CLAUDE_TIMEOUT = float(os.environ.get("CLAUDE_TIMEOUT", "0"))  # 1回の実行の上限時間（秒）
+CLAUDE_CGROUP_PARENT = os.environ.get("CLAUDE_CGROUP_PARENT", "")  # ジョブごとのcgroupを作る委譲済みのcgroup v2ディレクトリ
+CLAUDE_CGROUP_MEMORY_MAX = os.environ.get("CLAUDE_CGROUP_MEMORY_MAX", "")  # ジョブのcgroupの memory.max（例: 2G）
+CLAUDE_CGROUP_CPU_MAX = os.environ.get("CLAUDE_CGROUP_CPU_MAX", "")  # ジョブのcgroupの cpu.max（例: "200000 100000" で2コア分）
+
+# 分散実行設定（JOB_STORE_PATHを設定すると、同じファイルを参照する複数のボットプロセスでキューを共有）
+JOB_STORE_PATH = os.environ.get("JOB_STORE_PATH", "")  # 共有ジョブキューのSQLiteファイル（全ノードから見える場所）
+NODE_ID = os.environ.get("NODE_ID", f"{socket.gethostname()}-{os.getpid()}")  # このボットプロセスの識別子
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1.0"))  # 共有キューを確認する間隔（秒）
+NODE_TIMEOUT = float(os.environ.get("NODE_TIMEOUT", "60"))  # この秒数応答のないノードの実行中ジョブは orphaned 扱い
+NODE_ORPHAN_TIMEOUT = float(os.environ.get("NODE_ORPHAN_TIMEOUT", "600"))  # この秒数応答のないノードの orphaned のジョブは失敗扱い
+
+# プロセスプール設定（CLAUDE_POOL_SIZEを0にすると無効）
+CLAUDE_POOL_SIZE = int(os.environ.get("CLAUDE_POOL_SIZE", "0"))  # 事前に起動しておくClaude CLIの数
+CLAUDE_POOL_MAX_IDLE = float(os.environ.get("CLAUDE_POOL_MAX_IDLE", "600"))  # 待機プロセスを起動し直すまでの秒数
+
+# メトリクス設定（METRICS_PORTを設定すると有効）
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))  # /metrics をPrometheus形式で公開するポート（0なら公開しない。例: 9464）
 
 # その他の設定
 MAX_LEN = 39000  # Slackメッセージの最大文字数
 FLUSH_INTERVAL = 1.0  # バッファフラッシュ間隔（秒）
+FLUSH_POLICY = os.environ.get("FLUSH_POLICY", "adaptive")  # fixed: 固定間隔 / adaptive: Slackの応答速度とレート制限に合わせて調整
 PROGRESS_INTERVAL = 60.0  # 進捗メッセージ送信間隔（秒）
+STREAM_MODE = os.environ.get("STREAM_MODE", "post")  # post: 新規投稿を重ねる / update: 1つのメッセージを編集し続ける
+STREAM_UPDATES_PER_SEC = max(0.1, float(os.environ.get("STREAM_UPDATES_PER_SEC", "1")))  # updateモードでのスレッドあたり最大編集回数（毎秒、0.1以上）
+SENDER_MAX_PENDING_CHARS = int(os.environ.get("SENDER_MAX_PENDING_CHARS", "100000"))  # Slackが遅れたとき送信待ちにできる途中経過の文字数
 MAX_HISTORY_MESSAGES = 10  # 会話履歴の最大メッセージ数（最新N往復分）
+
+# 会話履歴キャッシュ設定（HISTORY_DB_PATHを空にすると無効）
+DATA_DIR = Path(os.environ.get("DATA_DIR", str(script_dir / "data")))
+HISTORY_DB_PATH = os.environ.get("HISTORY_DB_PATH", str(DATA_DIR / "history.sqlite3"))
+HISTORY_CACHE_MAX_THREADS = int(os.environ.get("HISTORY_CACHE_MAX_THREADS", "500"))  # 保持するスレッド数の上限
+SESSION_MAP_PATH = os.environ.get("SESSION_MAP_PATH", str(DATA_DIR / "sessions.json"))  # プール使用時のスレッドとセッションIDの対応
+SCREENSHOT_CACHE_DIR = os.environ.get("SCREENSHOT_CACHE_DIR", str(DATA_DIR / "screenshots"))  # 撮影した画像のキャッシュ（空なら無効）
+SCREENSHOT_CACHE_MAX_MB = int(os.environ.get("SCREENSHOT_CACHE_MAX_MB", "200"))  # 画像キャッシュの合計サイズの上限（MB）
+
+# 重複イベント除外設定（Slackの再送で同じメンションを2回実行しない）
+EVENT_DEDUPE_TTL = float(os.environ.get("EVENT_DEDUPE_TTL", "3600"))  # 処理済みのイベントを覚えておく秒数
+EVENT_DEDUPE_PATH = os.environ.get("EVENT_DEDUPE_PATH", "")  # 処理済みのイベントを保存するSQLiteファイル（空ならメモリ上のみ。複数プロセスで共有可）
+
+# トレーシング設定
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "none")  # none: 無効 / file: TRACE_FILEにJSONLで出力 / otlp: OpenTelemetry SDKで送信
+TRACE_FILE = os.environ.get("TRACE_FILE", str(DATA_DIR / "traces.jsonl"))
+TRACE_SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "claude-via-slack")
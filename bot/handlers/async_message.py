@@ -0,0 +1,312 @@
+"""
+Slackメッセージハンドラー（asyncio版）
+AsyncAppから呼ばれ、Claude実行はAsyncJobSchedulerのワーカータスクで行う
+"""
+import re
+import time
+import asyncio
+import logging
+
+from ..config import ENABLE_SESSION_RESUME, COALESCE_FOLLOWUPS
+from ..utils.session import thread_ts_to_session_id, session_exists
+from ..utils.async_buffer import AsyncOutputBuffer
+from ..utils.history import get_thread_history, format_history_for_prompt, format_followups_for_prompt
+from ..utils import tracing
+from ..claude.async_runner import run_claude_streaming_async
+from ..claude.process import stop_process_tree
+from ..claude.scheduler import Job
+from ..claude.result_cache import repo_state, cache_key, format_cache_age
+from ..screenshot.screenshot import take_screenshot
+from .commands import handle_screenshot, format_process_status
+
+
+def create_async_mention_handler(
+    client, sync_client, active_processes, stopped_threads, router, identity, history_store=None, dedupe=None,
+    result_cache=None, screenshot_cache=None,
+):
+    """
+    app_mentionイベントハンドラーを作成（asyncio版）
+
+    Args:
+        client: Slack AsyncWebClient
+        sync_client: Slack WebClient（スレッドで実行する同期処理用）
+        active_processes: アクティブプロセスの辞書
+        stopped_threads: 停止されたスレッドのセット
+        router: 実行先ごとのスケジューラー（AsyncJobScheduler）を持つルーター
+        identity: ボット情報キャッシュ（BotIdentity）
+        history_store: 会話履歴キャッシュ（Noneなら毎回Slackから取得）
+        dedupe: 処理済みイベントの記録（EventDeduplicator。Noneなら再送されたイベントも処理する）
+        result_cache: 実行結果キャッシュ（AsyncResultCache。Noneなら毎回実行する）
+        screenshot_cache: スクリーンショットのキャッシュ（ScreenshotCache。Noneなら毎回撮影する）
+
+    Returns:
+        ハンドラー関数
+    """
+    async def run_job(channel, thread_ts, user_id, prompt, enable_streaming, route, new_thread=False, trace=tracing.NOOP_SPAN):
+        """
+        Claude実行ジョブ本体（スケジューラーのワーカータスクで実行）
+
+        Args:
+            channel: チャンネルID
+            thread_ts: スレッドID
+            user_id: ユーザーID
+            prompt: プロンプト文字列
+            enable_streaming: ストリーミング有効フラグ
+            route: 実行先（作業ディレクトリ・追加のCLI引数）
+            new_thread: このメンションでスレッドが始まったか（過去の履歴なし）
+            trace: 依頼全体のスパン（on_mentionで開始し、ジョブ終了時に閉じる）
+        """
+        # 以降の段階はすべて依頼全体のスパンの子として記録する
+        with trace:
+            # 実行開始メッセージ
+            with tracing.start_span("slack.post_start"):
+                await client.chat_postMessage(channel=channel, thread_ts=thread_ts, text="開始シマス")
+
+            # スレッド単位のセッションが残っていれば再開し、履歴の再送を省略
+            session_id = thread_ts_to_session_id(thread_ts)
+            trace.set_attribute("claude.session_id", session_id)
+            with tracing.start_span("claude.session_lookup") as span:
+                resume = ENABLE_SESSION_RESUME and session_exists(session_id, route.cwd)
+                span.set_attribute("claude.resume", resume)
+            if not resume and not new_thread:
+                # スレッドの会話履歴を取得（同期APIのためスレッドで実行、ボットのユーザーIDは起動時に取得済み）
+                with tracing.start_span("history.fetch", history_cached=history_store is not None) as span:
+                    history = await asyncio.to_thread(
+                        lambda: get_thread_history(sync_client, channel, thread_ts, identity.user_id, history_store)
+                    )
+                    span.set_attribute("history.messages", len(history))
+                logging.info(f"Retrieved {len(history)} messages from thread history")
+
+                # 履歴をプロンプトに追加
+                if history:
+                    history_text = format_history_for_prompt(history)
+                    prompt = f"{history_text}\n新しい質問:\n{prompt}"
+
+            # バッファ初期化
+            buffer = AsyncOutputBuffer(client, channel, thread_ts, enable_streaming, time.time(), history_store)
+            buffer.start_auto_flusher()
+
+            # 新しいスレッドの依頼は、同じリポジトリの状態に対する同じ依頼の結果を使い回す
+            # （同じ依頼を実行中なら、その完了を待って結果を共有する）
+            cached = None
+            leader_key = None
+            state = None
+            if result_cache is not None and new_thread and not resume:
+                with tracing.start_span("claude.cache_lookup") as span:
+                    state = await asyncio.to_thread(repo_state, route.cwd)
+                    if state is not None:
+                        key = cache_key(prompt, route.cwd, route.args, state)
+                        cached, leader = await result_cache.acquire(
+                            key, thread_ts, lambda: thread_ts in stopped_threads
+                        )
+                        if leader:
+                            leader_key = key
+                    span.set_attribute("cache.hit", cached is not None)
+            trace.set_attribute("claude.cached", cached is not None)
+
+            # キャッシュに保存するため最終出力を記録
+            final_output = []
+
+            def on_stdout(text):
+                if buffer.message_stopped[0]:
+                    final_output.append(text)
+                buffer.append_stdout(text)
+
+            code = 1
+            try:
+                if cached is not None:
+                    buffer.message_stopped[0] = True
+                    buffer.append_stdout(cached.text)
+                    code = 0
+                elif thread_ts not in stopped_threads:
+                    # Claude実行（同じ依頼の完了を待っている間に停止されたら実行しない）
+                    with tracing.start_span("claude.run", claude_resume=resume, claude_prompt_chars=len(prompt)) as span:
+                        code = await run_claude_streaming_async(
+                            prompt,
+                            on_stdout,
+                            buffer.append_stderr,
+                            thread_ts=thread_ts,
+                            current_tools={},
+                            message_stopped=buffer.message_stopped,
+                            active_processes=active_processes,
+                            session_id=session_id if ENABLE_SESSION_RESUME else None,
+                            resume=resume,
+                            cwd=route.cwd,
+                            extra_args=route.args,
+                        )
+                        span.set_attribute("claude.exit_code", code)
+            finally:
+                if leader_key is not None:
+                    # 正常終了し、実行中にリポジトリを変更しなかった（読み取りだけの）依頼の結果のみ保存
+                    cacheable = (
+                        code == 0 and thread_ts not in stopped_threads
+                        and await asyncio.to_thread(repo_state, route.cwd) == state
+                    )
+                    result_cache.release(leader_key, "".join(final_output) if cacheable and final_output else None)
+
+            # フラッシャータスクを停止
+            await buffer.stop_auto_flusher()
+
+            # 手動停止された場合はバッファをクリアして終了
+            if thread_ts in stopped_threads:
+                stopped_threads.discard(thread_ts)
+                trace.set_attribute("job.stopped", True)
+                buffer.clear()
+                return
+
+            # 残りのバッファをすべて投稿
+            await buffer.flush()
+
+            # 最終メッセージ
+            if cached is not None:
+                text = f"<@{user_id}> 完了シマシタ（キャッシュ: {format_cache_age(cached.created_at)}に実行した同じ依頼の結果です）"
+            elif code == 0:
+                text = f"<@{user_id}> 完了シマシタ"
+            else:
+                text = f"<@{user_id}> エラーが発生しました（code={code}）"
+            with tracing.start_span("slack.post_final"):
+                await client.chat_postMessage(channel=channel, thread_ts=thread_ts, text=text)
+
+    async def handle_status(channel, thread_ts, user_id):
+        """statusコマンドの処理"""
+        scheduler = router.route_for_thread(channel, thread_ts).scheduler
+        proc = active_processes.get(thread_ts)
+        position = scheduler.position(thread_ts)
+        if proc and proc.returncode is None:
+            text = f"<@{user_id}> 実行中です（{format_process_status(proc.pid)}）"
+            if position is not None:
+                text += "\nこのスレッドの次の依頼が実行待ちです。"
+        elif position is not None:
+            stats = scheduler.stats()
+            text = f"<@{user_id}> 順番待ち中です（{position}番目 / 実行中 {stats['running']}件・待機中 {stats['queued']}件）"
+        else:
+            text = f"<@{user_id}> 実行中のプロセスはありません。"
+        await client.chat_postMessage(channel=channel, thread_ts=thread_ts, text=text)
+
+    async def handle_stop(channel, thread_ts, user_id):
+        """stopコマンドの処理（待機中のジョブを取り消し、実行中のプロセスも停止）"""
+        scheduler = router.route_for_thread(channel, thread_ts).scheduler
+        cancelled = scheduler.cancel(thread_ts)
+        proc = active_processes.get(thread_ts)
+        if proc and proc.returncode is None:
+            stopped_threads.add(thread_ts)
+            stop_process_tree(proc)
+            active_processes.pop(thread_ts, None)
+            text = f"<@{user_id}> Claudeプロセスを停止しました。"
+            if cancelled:
+                text += f"（待機中のジョブ{cancelled}件も取り消しました）"
+        elif result_cache is not None and result_cache.is_waiting(thread_ts):
+            # 同じ依頼の完了を待っている依頼は、待つのをやめて実行せずに終わる
+            stopped_threads.add(thread_ts)
+            text = f"<@{user_id}> 同じ依頼の完了待ちを取り消しました。"
+        elif cancelled:
+            text = f"<@{user_id}> 待機中のジョブを取り消しました。"
+        else:
+            text = f"<@{user_id}> このスレッドに実行中のプロセスはありません。"
+        await client.chat_postMessage(channel=channel, thread_ts=thread_ts, text=text)
+
+    async def on_mention(body):
+        # Slackの再送（応答遅れ・再接続）で同じメンションを2回実行しない
+        # （SQLiteへの書き込みでイベントループを止めないようスレッドで実行）
+        if dedupe is not None and not await asyncio.to_thread(dedupe.first_seen, body):
+            return
+
+        event = body.get("event", {})
+        channel = event.get("channel")
+        user_id = event.get("user")
+        text = event.get("text", "") or ""
+
+        # このイベントの親: 返信ならそのthread_ts、そうでなければ自身のts
+        thread_ts = event.get("thread_ts") or event.get("ts")
+        new_thread = event.get("thread_ts") is None
+
+        # 依頼全体のスパン（ジョブとして投入した場合はジョブの終了時に閉じる）
+        trace = tracing.start_span(
+            "slack.mention", parent=tracing.NOOP_SPAN,
+            slack_channel=channel, slack_thread_ts=thread_ts, slack_user=user_id, slack_event_ts=event.get("ts"),
+        )
+
+        # 履歴キャッシュに記録（スレッドの起点なら過去の履歴はないので同期済みとする）
+        if history_store is not None:
+            with tracing.start_span("history.record", parent=trace):
+                await asyncio.to_thread(history_store.record_message, channel, thread_ts, event, synced=new_thread)
+
+        # メンションを除去してプロンプト化
+        prompt = re.sub(r"<@[^>]+>\s*", "", text).strip()
+
+        # ストリーミング有効フラグ（streamで始まる場合のみストリーミング）
+        enable_streaming = prompt.lower().startswith("stream")
+        if enable_streaming:
+            prompt = prompt[6:].strip()  # "stream"を除去
+
+        if prompt.lower() == "status":
+            trace.set_attribute("slack.command", "status")
+            with trace:
+                await handle_status(channel, thread_ts, user_id)
+            return
+
+        if prompt.lower() == "stop":
+            trace.set_attribute("slack.command", "stop")
+            with trace:
+                await handle_stop(channel, thread_ts, user_id)
+            return
+
+        # screenshot コマンド（同期処理のためスレッドで実行）
+        if prompt.lower().startswith("screenshot"):
+            trace.set_attribute("slack.command", "screenshot")
+            with trace:
+                await asyncio.to_thread(
+                    handle_screenshot, sync_client, channel, thread_ts, user_id, prompt, take_screenshot, screenshot_cache,
+                )
+            return
+
+        # 実行先を決める（振り分け用の先頭の文字列は取り除く）
+        route, prompt = router.resolve(channel, thread_ts, prompt)
+        scheduler = route.scheduler
+        trace.set_attribute("job.route", route.name)
+
+        if not prompt:
+            trace.end()
+            await client.chat_postMessage(
+                channel=channel, thread_ts=thread_ts,
+                text="プロンプトが空です。`@Bot 〜〜` の形で送ってください。"
+            )
+            return
+
+        # 同じスレッドの依頼が実行待ちなら、新しいジョブを作らずにその依頼へまとめる
+        if COALESCE_FOLLOWUPS:
+            position = scheduler.coalesce(thread_ts, prompt)
+            if position is not None:
+                trace.set_attribute("job.coalesced", True)
+                trace.end()
+                await client.chat_postMessage(
+                    channel=channel, thread_ts=thread_ts,
+                    text=f"<@{user_id}> 実行待ちの依頼とまとめて実行します（{position}番目）"
+                )
+                return
+
+        # ジョブをキューに投入（待ち時間はジョブの開始時にスパンとして記録）
+        # 同じスレッドのジョブは前のジョブが終わるまで始まらない
+        async def start_job():
+            tracing.start_span("job.queue", parent=trace, start_time=job.enqueued_at).end()
+            trace.set_attribute("job.coalesced_prompts", len(job.payloads))
+            merged_prompt = format_followups_for_prompt(job.payloads)
+            await run_job(channel, thread_ts, user_id, merged_prompt, enable_streaming, route, new_thread, trace)
+
+        job = Job(thread_ts, user_id, start_job, prompt)
+        position = await scheduler.submit(job)
+        trace.set_attribute("job.queue_position", position)
+        if position is None:
+            trace.record_error("queue full")
+            trace.end()
+            await client.chat_postMessage(
+                channel=channel, thread_ts=thread_ts,
+                text=f"<@{user_id}> 混雑しているため受け付けできませんでした。しばらくしてから再度お試しください。"
+            )
+        elif position > 0:
+            await client.chat_postMessage(
+                channel=channel, thread_ts=thread_ts,
+                text=f"<@{user_id}> 順番待ち中です（{position}番目）"
+            )
+
+    return on_mention
@@ -6,8 +6,32 @@ import os
 import re
 import logging
 
+from slack_sdk.errors import SlackApiError
 
-def handle_status(client, channel, thread_ts, user_id, active_processes, active_lock):
+from ..claude.limits import sample_usage
+from ..claude.process import stop_process_tree
+
+
+def format_process_status(pid: int) -> str:
+    """
+    実行中のプロセスのPIDと現在のリソース使用量（取得できる場合）
+
+    Args:
+        pid: プロセスID
+
+    Returns:
+        "PID: 123 / メモリ 512.0MB（最大 600.0MB） / CPU 12.3秒" のような文字列
+    """
+    usage = sample_usage(pid)
+    if not usage:
+        return f"PID: {pid}"
+    return (
+        f"PID: {pid} / メモリ {usage.get('rss_bytes', 0) / 1024 / 1024:.1f}MB"
+        f"（最大 {usage.get('max_rss_bytes', 0) / 1024 / 1024:.1f}MB） / CPU {usage['cpu_seconds']:.1f}秒"
+    )
+
+
+def handle_status(client, channel, thread_ts, user_id, active_processes, active_lock, scheduler=None):
     """
     statusコマンドの処理
 
@@ -18,13 +42,27 @@ def handle_status(client, channel, thread_ts, user_id, active_processes, active_
         user_id: ユーザーID
         active_processes: アクティブプロセスの辞書
         active_lock: プロセス管理用のロック
+        scheduler: ジョブスケジューラー（待機中ジョブの確認用）
     """
     with active_lock:
         proc = active_processes.get(thread_ts)
+    position = scheduler.position(thread_ts) if scheduler else None
     if proc and proc.poll() is None:
+        text = f"<@{user_id}> 実行中です（{format_process_status(proc.pid)}）"
+        if position is not None:
+            text += "\nこのスレッドの次の依頼が実行待ちです。"
+        client.chat_postMessage(channel=channel, thread_ts=thread_ts, text=text)
+    elif getattr(scheduler, "distributed", False) and (node := scheduler.owner(thread_ts)):
+        # 他のノードで実行中
+        client.chat_postMessage(
+            channel=channel, thread_ts=thread_ts,
+            text=f"<@{user_id}> ノード {node} で実行中です"
+        )
+    elif position is not None:
+        stats = scheduler.stats()
         client.chat_postMessage(
             channel=channel, thread_ts=thread_ts,
-            text=f"<@{user_id}> 実行中です（PID: {proc.pid}）"
+            text=f"<@{user_id}> 順番待ち中です（{position}番目 / 実行中 {stats['running']}件・待機中 {stats['queued']}件）"
         )
     else:
         client.chat_postMessage(
@@ -33,7 +71,8 @@ def handle_status(client, channel, thread_ts, user_id, active_processes, active_
         )
 
 
-def handle_stop(client, channel, thread_ts, user_id, active_processes, active_lock, stopped_threads):
+def handle_stop(client, channel, thread_ts, user_id, active_processes, active_lock, stopped_threads, scheduler=None,
+                result_cache=None):
     """
     stopコマンドの処理
 
@@ -45,19 +84,42 @@ def handle_stop(client, channel, thread_ts, user_id, active_processes, active_lo
         active_processes: アクティブプロセスの辞書
         active_lock: プロセス管理用のロック
         stopped_threads: 停止されたスレッドのセット
+        scheduler: ジョブスケジューラー（待機中ジョブの取り消し用）
+        result_cache: 実行結果キャッシュ（同じ依頼の完了待ちの取り消し用）
     """
+    # 待機中のジョブは実行前に取り消す（同じスレッドの後続ジョブが実行中のジョブの後に始まらないよう先に行う）
+    cancelled = scheduler.cancel(thread_ts) if scheduler else 0
+
     with active_lock:
         proc = active_processes.get(thread_ts)
     if proc and proc.poll() is None:
         stopped_threads.add(thread_ts)
         try:
-            proc.kill()
+            stop_process_tree(proc)
         finally:
             with active_lock:
                 active_processes.pop(thread_ts, None)
+        text = f"<@{user_id}> Claudeプロセスを停止しました。"
+        if cancelled:
+            text += f"（待機中のジョブ{cancelled}件も取り消しました）"
+        client.chat_postMessage(channel=channel, thread_ts=thread_ts, text=text)
+    elif result_cache is not None and result_cache.is_waiting(thread_ts):
+        # 同じ依頼の完了を待っている依頼は、待つのをやめて実行せずに終わる
+        stopped_threads.add(thread_ts)
         client.chat_postMessage(
             channel=channel, thread_ts=thread_ts,
-            text=f"<@{user_id}> Claudeプロセスを停止しました。"
+            text=f"<@{user_id}> 同じ依頼の完了待ちを取り消しました。"
+        )
+    elif getattr(scheduler, "distributed", False) and (node := scheduler.request_stop(thread_ts)):
+        # 他のノードで実行中なら、そのノードに停止を依頼する
+        text = f"<@{user_id}> ノード {node} で実行中のClaudeプロセスに停止を依頼しました。"
+        if cancelled:
+            text += f"（待機中のジョブ{cancelled}件も取り消しました）"
+        client.chat_postMessage(channel=channel, thread_ts=thread_ts, text=text)
+    elif cancelled:
+        client.chat_postMessage(
+            channel=channel, thread_ts=thread_ts,
+            text=f"<@{user_id}> 待機中のジョブを取り消しました。"
         )
     else:
         client.chat_postMessage(
@@ -66,7 +128,7 @@ def handle_stop(client, channel, thread_ts, user_id, active_processes, active_lo
         )
 
 
-def handle_screenshot(client, channel, thread_ts, user_id, prompt, take_screenshot):
+def handle_screenshot(client, channel, thread_ts, user_id, prompt, take_screenshot, screenshot_cache=None):
     """
     screenshotコマンドの処理
 
@@ -77,6 +139,7 @@ def handle_screenshot(client, channel, thread_ts, user_id, prompt, take_screensh
         user_id: ユーザーID
         prompt: コマンド文字列
         take_screenshot: スクリーンショット撮影関数
+        screenshot_cache: スクリーンショットのキャッシュ（ScreenshotCache。Noneなら毎回撮影する）
     """
     parts = prompt.split(maxsplit=1)
     if len(parts) < 2:
@@ -112,15 +175,27 @@ def handle_screenshot(client, channel, thread_ts, user_id, prompt, take_screensh
         text=f"スクリーンショットを撮影します: {file_path}" + (f" (行 {line_range}から)" if line_range else "")
     )
 
-    # スクリーンショットを撮影
     line_number = int(line_range) if line_range else None
-    success, message, screenshot_path = take_screenshot(file_path, line_number)
+
+    # 内容の変わっていないファイルは前回の画像を使う（このチャンネルにアップロード済みならそのファイルを共有）
+    key = screenshot_cache.key(file_path, line_number) if screenshot_cache is not None else None
+    if key is not None and _share_uploaded_screenshot(client, channel, thread_ts, user_id, screenshot_cache, key):
+        return
+    cached_path = screenshot_cache.get(key) if key is not None else None
+
+    if cached_path:
+        success, message, screenshot_path = True, "スクリーンショットを撮影しました（キャッシュ）", cached_path
+    else:
+        # スクリーンショットを撮影
+        success, message, screenshot_path = take_screenshot(file_path, line_number)
+        if success and screenshot_path and key is not None:
+            screenshot_path = screenshot_cache.put(key, screenshot_path)
 
     if success and screenshot_path:
         try:
             # Slackにファイルをアップロード
             with open(screenshot_path, "rb") as f:
-                client.files_upload_v2(
+                response = client.files_upload_v2(
                     channel=channel,
                     thread_ts=thread_ts,
                     file=f,
@@ -128,8 +203,11 @@ def handle_screenshot(client, channel, thread_ts, user_id, prompt, take_screensh
                     title=f"Screenshot: {file_path}",
                     initial_comment=f"<@{user_id}> {message}"
                 )
-            # 一時ファイルを削除
-            os.unlink(screenshot_path)
+            if key is not None:
+                screenshot_cache.remember_upload(key, channel, (response.get("files") or [response.get("file")])[0])
+            else:
+                # 一時ファイルを削除
+                os.unlink(screenshot_path)
         except Exception as e:
             logging.exception("Failed to upload screenshot")
             client.chat_postMessage(
@@ -141,3 +219,37 @@ def handle_screenshot(client, channel, thread_ts, user_id, prompt, take_screensh
             channel=channel, thread_ts=thread_ts,
             text=f"<@{user_id}> {message}"
         )
+
+
+def _share_uploaded_screenshot(client, channel, thread_ts, user_id, screenshot_cache, key) -> bool:
+    """
+    同じ画像をこのチャンネルにアップロード済みなら、再アップロードせずにファイルのリンクを投稿する
+
+    Returns:
+        投稿できたらTrue（アップロード済みのファイルがない・削除されていた場合はFalse）
+    """
+    uploaded = screenshot_cache.uploaded_file(key, channel)
+    if not uploaded:
+        return False
+    permalink = uploaded.get("permalink")
+    if screenshot_cache.verify_uploads:
+        try:
+            # ファイルが削除されていないか確認（アップロード直後の応答にはリンクが含まれないことがあるのでここで取得）
+            info = client.files_info(file=uploaded["id"])
+            permalink = info["file"].get("permalink") or permalink
+        except SlackApiError as e:
+            if e.response.get("error") == "missing_scope":
+                # files:read のないインストールでは確認できないので、以降は確認せずに記録したリンクを使う
+                logging.warning("files:read scope is missing; reusing screenshot links without checking them")
+                screenshot_cache.verify_uploads = False
+            else:
+                logging.info("Cached screenshot file %s is no longer available: %s", uploaded["id"], e.response.get("error"))
+                screenshot_cache.forget_upload(key, channel)
+                return False
+    if not permalink:
+        return False
+    client.chat_postMessage(
+        channel=channel, thread_ts=thread_ts,
+        text=f"<@{user_id}> スクリーンショットを撮影しました（キャッシュ）\n{permalink}"
+    )
+    return True
@@ -4,16 +4,25 @@ Slackメッセージハンドラー
 import re
 import time
 import logging
+import functools
 
-from ..utils.session import thread_ts_to_session_id
+from ..config import ENABLE_SESSION_RESUME, COALESCE_FOLLOWUPS
+from ..utils.session import thread_ts_to_session_id, session_exists
 from ..utils.buffer import OutputBuffer
-from ..utils.history import get_thread_history, format_history_for_prompt
+from ..utils.history import get_thread_history, format_history_for_prompt, format_followups_for_prompt
+from ..utils import tracing
 from ..claude.runner import run_claude_streaming
+from ..claude.process import stop_process_tree
+from ..claude.scheduler import Job
+from ..claude.result_cache import repo_state, cache_key, format_cache_age
 from ..screenshot.screenshot import take_screenshot
 from .commands import handle_status, handle_stop, handle_screenshot
 
 
-def create_mention_handler(client, active_processes, active_lock, stopped_threads):
+def create_mention_handler(
+    client, active_processes, active_lock, stopped_threads, router, identity, history_store=None,
+    pool=None, session_map=None, dedupe=None, result_cache=None, screenshot_cache=None,
+):
     """
     app_mentionイベントハンドラーを作成
 
@@ -22,11 +31,233 @@ def create_mention_handler(client, active_processes, active_lock, stopped_thread
         active_processes: アクティブプロセスの辞書
         active_lock: プロセス管理用のロック
         stopped_threads: 停止されたスレッドのセット
+        router: 実行先ごとのスケジューラーを持つルーター
+        identity: ボット情報キャッシュ（BotIdentity）
+        history_store: 会話履歴キャッシュ（Noneなら毎回Slackから取得）
+        pool: 起動済みClaude CLIのプール（Noneなら毎回起動）
+        session_map: スレッドとセッションIDの対応表（プール使用時に必要）
+        dedupe: 処理済みイベントの記録（EventDeduplicator。Noneなら再送されたイベントも処理する）
+        result_cache: 実行結果キャッシュ（ResultCache。Noneなら毎回実行する）
+        screenshot_cache: スクリーンショットのキャッシュ（ScreenshotCache。Noneなら毎回撮影する）
 
     Returns:
         ハンドラー関数
     """
+    def run_job(channel, thread_ts, user_id, prompt, enable_streaming, route, new_thread=False, trace=tracing.NOOP_SPAN):
+        """
+        Claude実行ジョブ本体（スケジューラーのワーカースレッドで実行）
+
+        Args:
+            channel: チャンネルID
+            thread_ts: スレッドID
+            user_id: ユーザーID
+            prompt: プロンプト文字列
+            enable_streaming: ストリーミング有効フラグ
+            route: 実行先（作業ディレクトリ・追加のCLI引数）
+            new_thread: このメンションでスレッドが始まったか（過去の履歴なし）
+            trace: 依頼全体のスパン（on_mentionで開始し、ジョブ終了時に閉じる）
+        """
+        # 以降の段階はすべて依頼全体のスパンの子として記録する
+        with trace:
+            # 実行開始メッセージ
+            with tracing.start_span("slack.post_start"):
+                client.chat_postMessage(channel=channel, thread_ts=thread_ts, text="開始シマス")
+
+            # スレッド単位のセッションが残っていれば再開し、履歴の再送を省略
+            if session_map is not None:
+                session_id = session_map.session_id_for(thread_ts)
+            else:
+                session_id = thread_ts_to_session_id(thread_ts)
+            with tracing.start_span("claude.session_lookup") as span:
+                resume = ENABLE_SESSION_RESUME and session_exists(session_id, route.cwd)
+                span.set_attribute("claude.resume", resume)
+            if resume:
+                logging.info(f"Resuming session {session_id} for thread {thread_ts}")
+            elif not new_thread:
+                # スレッドの会話履歴を取得（ボットのユーザーIDは起動時に取得済み）
+                with tracing.start_span("history.fetch", history_cached=history_store is not None) as span:
+                    history = get_thread_history(client, channel, thread_ts, identity.user_id, history_store)
+                    span.set_attribute("history.messages", len(history))
+                logging.info(f"Retrieved {len(history)} messages from thread history")
+
+                # 履歴をプロンプトに追加
+                if history:
+                    history_text = format_history_for_prompt(history)
+                    prompt = f"{history_text}\n新しい質問:\n{prompt}"
+                    logging.info(f"Added history to prompt. Total prompt length: {len(prompt)}")
+
+            # バッファ初期化
+            start_time = time.time()
+            buffer = OutputBuffer(client, channel, thread_ts, enable_streaming, start_time, history_store)
+
+            # ツール実行追跡用
+            current_tools = {}  # index -> {name, input_parts, id}
+
+            # 自動フラッシュスレッド開始
+            flusher_thread = buffer.start_auto_flusher()
+
+            # 新しいスレッドの依頼は、同じリポジトリの状態に対する同じ依頼の結果を使い回す
+            # （同じ依頼を実行中なら、その完了を待って結果を共有する）
+            cached = None
+            leader_key = None
+            state = None
+            if result_cache is not None and new_thread and not resume:
+                with tracing.start_span("claude.cache_lookup") as span:
+                    state = repo_state(route.cwd)
+                    if state is not None:
+                        key = cache_key(prompt, route.cwd, route.args, state)
+                        cached, leader = result_cache.acquire(key, thread_ts, lambda: thread_ts in stopped_threads)
+                        if leader:
+                            leader_key = key
+                    span.set_attribute("cache.hit", cached is not None)
+            trace.set_attribute("claude.cached", cached is not None)
+
+            # キャッシュに保存するため最終出力を記録
+            final_output = []
+
+            def on_stdout(text):
+                if buffer.message_stopped[0]:
+                    final_output.append(text)
+                buffer.append_stdout(text)
+
+            code = 1
+            try:
+                if cached is not None:
+                    buffer.message_stopped[0] = True
+                    buffer.append_stdout(cached.text)
+                    code = 0
+                elif thread_ts not in stopped_threads:
+                    # 同じ依頼の完了を待っている間に停止されたら実行しない
+                    code = run_claude(thread_ts, prompt, on_stdout, buffer, current_tools, session_id, resume, route, trace)
+            finally:
+                if leader_key is not None:
+                    # 正常終了し、実行中にリポジトリを変更しなかった（読み取りだけの）依頼の結果のみ保存
+                    cacheable = code == 0 and thread_ts not in stopped_threads and repo_state(route.cwd) == state
+                    result_cache.release(leader_key, "".join(final_output) if cacheable and final_output else None)
+
+            # フラッシャースレッドを停止
+            buffer.stop_auto_flusher()
+
+            # 手動停止された場合はバッファをクリアして終了
+            if thread_ts in stopped_threads:
+                stopped_threads.discard(thread_ts)
+                trace.set_attribute("job.stopped", True)
+                buffer.clear()
+                buffer.close()
+                return
+
+            # 残りのバッファをすべて投稿し、送信スレッドが送り切ってから完了を知らせる
+            with tracing.start_span("slack.drain"):
+                buffer.close()
+
+            # 最終メッセージ
+            with tracing.start_span("slack.post_final"):
+                if cached is not None:
+                    client.chat_postMessage(
+                        channel=channel,
+                        thread_ts=thread_ts,
+                        text=f"<@{user_id}> 完了シマシタ（キャッシュ: {format_cache_age(cached.created_at)}に実行した同じ依頼の結果です）"
+                    )
+                elif code == 0:
+                    client.chat_postMessage(
+                        channel=channel,
+                        thread_ts=thread_ts,
+                        text=f"<@{user_id}> 完了シマシタ"
+                    )
+                else:
+                    client.chat_postMessage(
+                        channel=channel,
+                        thread_ts=thread_ts,
+                        text=f"<@{user_id}> エラーが発生しました（code={code}）"
+                    )
+
+    def run_claude(thread_ts, prompt, on_stdout, buffer, current_tools, session_id, resume, route, trace):
+        """
+        Claude CLIを実行して終了コードを返す
+
+        Args:
+            thread_ts: スレッドID
+            prompt: プロンプト文字列
+            on_stdout: 標準出力を受け取るコールバック
+            buffer: 出力バッファ
+            current_tools: ツール実行状態を保持する辞書
+            session_id: Claude CLIのセッションID
+            resume: 既存セッションを再開するか
+            route: 実行先
+            trace: 依頼全体のスパン
+
+        Returns:
+            終了コード
+        """
+        # 新しいセッションなら起動済みのプロセスを使う（再開はCLIの起動引数で指定するため毎回起動）
+        # プールのプロセスは既定の作業ディレクトリ・引数で起動しているので、同じ実行先の場合のみ
+        warm_process = None
+        if pool is not None and not resume and route.cwd == pool.cwd and not route.args:
+            warm_process = pool.acquire()
+            if warm_process is not None:
+                session_id = warm_process.session_id
+                if session_map is not None:
+                    session_map.set(thread_ts, session_id)
+        trace.set_attribute("claude.session_id", session_id)
+        trace.set_attribute("claude.warm", warm_process is not None)
+
+        # Claude実行
+        with tracing.start_span("claude.run", claude_resume=resume, claude_prompt_chars=len(prompt)) as span:
+            code = run_claude_streaming(
+                prompt,
+                on_stdout,
+                buffer.append_stderr,
+                thread_ts=thread_ts,
+                current_tools=current_tools,
+                message_stopped=buffer.message_stopped,
+                active_processes=active_processes,
+                active_lock=active_lock,
+                session_id=session_id if ENABLE_SESSION_RESUME else None,
+                resume=resume,
+                warm_process=warm_process,
+                cwd=route.cwd,
+                extra_args=route.args,
+            )
+            span.set_attribute("claude.exit_code", code)
+        return code
+
+    def run_shared_job(route, job):
+        """
+        共有キューから取り出したジョブを実行（投入したノードとは別のノードで実行されることがある）
+
+        Args:
+            route: 実行先
+            job: 共有キューから取り出したジョブ（context にチャンネルなどを持つ）
+        """
+        context = job.context
+        trace = tracing.start_span(
+            "slack.job", parent=tracing.NOOP_SPAN,
+            slack_channel=context["channel"], slack_thread_ts=job.key, slack_user=job.user_id, job_route=route.name,
+        )
+        tracing.start_span("job.queue", parent=trace, start_time=job.enqueued_at).end()
+        trace.set_attribute("job.coalesced_prompts", len(job.payloads))
+        merged_prompt = format_followups_for_prompt(job.payloads)
+        run_job(context["channel"], job.key, job.user_id, merged_prompt, context["enable_streaming"], route,
+                context["new_thread"], trace)
+
+    def stop_local(thread_ts):
+        """このノードで実行中のプロセスを停止（他のノードからの停止依頼）"""
+        with active_lock:
+            proc = active_processes.get(thread_ts)
+        if proc and proc.poll() is None:
+            stopped_threads.add(thread_ts)
+            stop_process_tree(proc)
+
+    # 分散実行時は、共有キューから取り出したジョブをこのノードで実行できるようにする
+    for route in router.all_routes:
+        if getattr(route.scheduler, "distributed", False):
+            route.scheduler.bind(functools.partial(run_shared_job, route), stop_local)
+
     def on_mention(body, _say, _logger):
+        # Slackの再送（応答遅れ・再接続）で同じメンションを2回実行しない
+        if dedupe is not None and not dedupe.first_seen(body):
+            return
+
         event = body.get("event", {})
         channel = event.get("channel")
         user_id = event.get("user")
@@ -34,6 +265,18 @@ def create_mention_handler(client, active_processes, active_lock, stopped_thread
 
         # このイベントの親: 返信ならそのthread_ts、そうでなければ自身のts
         thread_ts = event.get("thread_ts") or event.get("ts")
+        new_thread = event.get("thread_ts") is None
+
+        # 依頼全体のスパン（ジョブとして投入した場合はジョブの終了時に閉じる）
+        trace = tracing.start_span(
+            "slack.mention", parent=tracing.NOOP_SPAN,
+            slack_channel=channel, slack_thread_ts=thread_ts, slack_user=user_id, slack_event_ts=event.get("ts"),
+        )
+
+        # 履歴キャッシュに記録（スレッドの起点なら過去の履歴はないので同期済みとする）
+        if history_store is not None:
+            with tracing.start_span("history.record", parent=trace):
+                history_store.record_message(channel, thread_ts, event, synced=new_thread)
 
         # メンションを除去してプロンプト化
         prompt = re.sub(r"<@[^>]+>\s*", "", text).strip()
@@ -43,91 +286,84 @@ def create_mention_handler(client, active_processes, active_lock, stopped_thread
         if enable_streaming:
             prompt = prompt[6:].strip()  # "stream"を除去
 
+        # このスレッドの実行先のスケジューラー
+        scheduler = router.route_for_thread(channel, thread_ts).scheduler
+
         # status コマンド
         if prompt.lower() == "status":
-            handle_status(client, channel, thread_ts, user_id, active_processes, active_lock)
+            trace.set_attribute("slack.command", "status")
+            with trace:
+                handle_status(client, channel, thread_ts, user_id, active_processes, active_lock, scheduler)
             return
 
         # stop コマンド
         if prompt.lower() == "stop":
-            handle_stop(client, channel, thread_ts, user_id, active_processes, active_lock, stopped_threads)
+            trace.set_attribute("slack.command", "stop")
+            with trace:
+                handle_stop(
+                    client, channel, thread_ts, user_id, active_processes, active_lock, stopped_threads, scheduler,
+                    result_cache,
+                )
             return
 
         # screenshot コマンド
         if prompt.lower().startswith("screenshot"):
-            handle_screenshot(client, channel, thread_ts, user_id, prompt, take_screenshot)
+            trace.set_attribute("slack.command", "screenshot")
+            with trace:
+                handle_screenshot(client, channel, thread_ts, user_id, prompt, take_screenshot, screenshot_cache)
             return
 
+        # 実行先を決める（振り分け用の先頭の文字列は取り除く）
+        route, prompt = router.resolve(channel, thread_ts, prompt)
+        scheduler = route.scheduler
+        trace.set_attribute("job.route", route.name)
+
         if not prompt:
+            trace.end()
             client.chat_postMessage(
                 channel=channel, thread_ts=thread_ts,
                 text="プロンプトが空です。`@Bot 〜〜` の形で送ってください。"
             )
             return
 
-        # 実行開始メッセージ
-        client.chat_postMessage(channel=channel, thread_ts=thread_ts, text="開始シマス")
-
-        # ボットのユーザーIDを取得
-        bot_info = client.auth_test()
-        bot_user_id = bot_info.get("user_id")
-
-        # スレッドの会話履歴を取得
-        history = get_thread_history(client, channel, thread_ts, bot_user_id)
-        logging.info(f"Retrieved {len(history)} messages from thread history")
-
-        # 履歴をプロンプトに追加
-        if history:
-            history_text = format_history_for_prompt(history)
-            prompt = f"{history_text}\n新しい質問:\n{prompt}"
-            logging.info(f"Added history to prompt. Total prompt length: {len(prompt)}")
-
-        # バッファ初期化
-        start_time = time.time()
-        buffer = OutputBuffer(client, channel, thread_ts, enable_streaming, start_time)
+        # 同じスレッドの依頼が実行待ちなら、新しいジョブを作らずにその依頼へまとめる
+        if COALESCE_FOLLOWUPS:
+            position = scheduler.coalesce(thread_ts, prompt)
+            if position is not None:
+                trace.set_attribute("job.coalesced", True)
+                trace.end()
+                client.chat_postMessage(
+                    channel=channel, thread_ts=thread_ts,
+                    text=f"<@{user_id}> 実行待ちの依頼とまとめて実行します（{position}番目）"
+                )
+                return
 
-        # ツール実行追跡用
-        current_tools = {}  # index -> {name, input_parts, id}
+        # ジョブをキューに投入（待ち時間はジョブの開始時にスパンとして記録）
+        # 同じスレッドのジョブは前のジョブが終わるまで始まらない
+        def start_job():
+            tracing.start_span("job.queue", parent=trace, start_time=job.enqueued_at).end()
+            trace.set_attribute("job.coalesced_prompts", len(job.payloads))
+            merged_prompt = format_followups_for_prompt(job.payloads)
+            run_job(channel, thread_ts, user_id, merged_prompt, enable_streaming, route, new_thread, trace)
 
-        # 自動フラッシュスレッド開始
-        flusher_thread = buffer.start_auto_flusher()
-
-        # Claude実行
-        code = run_claude_streaming(
-            prompt,
-            buffer.append_stdout,
-            buffer.append_stderr,
-            thread_ts=thread_ts,
-            current_tools=current_tools,
-            message_stopped=buffer.message_stopped,
-            active_processes=active_processes,
-            active_lock=active_lock,
-        )
-
-        # フラッシャースレッドを停止
-        buffer.stop_auto_flusher()
-
-        # 手動停止された場合はバッファをクリアして終了
-        if thread_ts in stopped_threads:
-            stopped_threads.discard(thread_ts)
-            buffer.clear()
-            return
-
-        # 残りのバッファをすべて投稿
-        buffer.flush()
-
-        # 最終メッセージ
-        if code == 0:
+        context = {"channel": channel, "enable_streaming": enable_streaming, "new_thread": new_thread}
+        job = Job(thread_ts, user_id, start_job, prompt, context)
+        position = scheduler.submit(job)
+        trace.set_attribute("job.queue_position", position)
+        if getattr(scheduler, "distributed", False):
+            # 共有キューのジョブは別のノードで実行されることがあるので、受け付けた時点で閉じる
+            trace.end()
+        if position is None:
+            trace.record_error("queue full")
+            trace.end()
             client.chat_postMessage(
-                channel=channel,
-                thread_ts=thread_ts,
-                text=f"<@{user_id}> 完了シマシタ"
+                channel=channel, thread_ts=thread_ts,
+                text=f"<@{user_id}> 混雑しているため受け付けできませんでした。しばらくしてから再度お試しください。"
             )
-        else:
+        elif position > 0:
             client.chat_postMessage(
-                channel=channel,
-                thread_ts=thread_ts,
-                text=f"<@{user_id}> エラーが発生しました（code={code}）"
+                channel=channel, thread_ts=thread_ts,
+                text=f"<@{user_id}> 順番待ち中です（{position}番目）"
             )
 
     return on_mention
@@ -0,0 +1,176 @@
+"""
+スクリーンショットのキャッシュモジュール
+ファイルの内容・行番号・描画設定が同じならエディタを開かずに前回の画像を使い、
+同じチャンネルにアップロード済みならSlackのファイルを再アップロードせずに共有する
+"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+from ..config import (
+    SCREENSHOT_OS, EDITOR_CMD, SCREENSHOT_LINES, SCREENSHOT_STYLE, SCREENSHOT_FONT, SCREENSHOT_FONT_SIZE,
+)
+
+
+def renderer_fingerprint() -> str:
+    """描画結果に影響する設定（変わったら別の画像として扱う）"""
+    return "|".join(str(v) for v in (
+        SCREENSHOT_OS, EDITOR_CMD, SCREENSHOT_LINES, SCREENSHOT_STYLE, SCREENSHOT_FONT, SCREENSHOT_FONT_SIZE,
+    ))
+
+
+class ScreenshotCache:
+    """
+    内容で引けるスクリーンショットのディスクキャッシュ（合計サイズの上限つきLRU）
+    画像は <キー>.png、アップロード済みのSlackファイルは <キー>.json に保存する
+    """
+
+    def __init__(self, directory: str, max_bytes: int, default_cwd: str):
+        """
+        Args:
+            directory: 画像を保存するディレクトリ
+            max_bytes: 画像の合計サイズの上限（超えたら使われていない順に削除）
+            default_cwd: 相対パスの基準ディレクトリ（ハンドラーと同じ解決をする）
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.default_cwd = default_cwd
+        self.fingerprint = renderer_fingerprint()
+        # アップロード済みのファイルが削除されていないか files.info で確認する（files:read がなければFalseになる）
+        self.verify_uploads = True
+        self._lock = threading.Lock()
+        # パス -> (mtime_ns, サイズ, 内容のハッシュ)。変更のないファイルを毎回読み直さない
+        self._digests = {}
+
+    def key(self, file_path: str, line_number: int | None) -> str | None:
+        """
+        キャッシュキーを作る
+
+        Args:
+            file_path: ファイルパス（相対パスならdefault_cwd基準）
+            line_number: 行番号
+
+        Returns:
+            キー（ファイルが読めない場合はNone）
+        """
+        if not os.path.isabs(file_path):
+            file_path = os.path.join(self.default_cwd, file_path)
+        abs_path = os.path.abspath(file_path)
+        try:
+            st = os.stat(abs_path)
+            with self._lock:
+                cached = self._digests.get(abs_path)
+            if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+                digest = cached[2]
+            else:
+                with open(abs_path, "rb") as f:
+                    digest = hashlib.file_digest(f, "sha256").hexdigest()
+                with self._lock:
+                    self._digests[abs_path] = (st.st_mtime_ns, st.st_size, digest)
+        except OSError:
+            return None
+        material = "\0".join([abs_path, digest, str(line_number or ""), self.fingerprint])
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """
+        キャッシュした画像のパス（なければNone）。取り出した画像は最近使ったものとして扱う
+
+        Args:
+            key: key() で作ったキー
+        """
+        path = self.directory / f"{key}.png"
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return str(path)
+
+    def put(self, key: str, image_path: str) -> str:
+        """
+        撮影した画像をキャッシュに移す
+
+        Args:
+            key: key() で作ったキー
+            image_path: 撮影した画像（一時ファイル。キャッシュに移動する）
+
+        Returns:
+            キャッシュ内の画像のパス
+        """
+        path = self.directory / f"{key}.png"
+        shutil.move(image_path, path)
+        self._evict()
+        return str(path)
+
+    def uploaded_file(self, key: str, channel: str) -> dict | None:
+        """
+        このチャンネルにアップロード済みのSlackファイル
+
+        Args:
+            key: key() で作ったキー
+            channel: チャンネルID
+
+        Returns:
+            {"id": ..., "permalink": ...}（なければNone）
+        """
+        return self._read_meta(key).get(channel)
+
+    def remember_upload(self, key: str, channel: str, file_info: dict):
+        """
+        アップロードしたSlackファイルを記録
+
+        Args:
+            key: key() で作ったキー
+            channel: チャンネルID
+            file_info: files_upload_v2 の応答のファイル情報
+        """
+        if not file_info or not file_info.get("id"):
+            return
+        meta = self._read_meta(key)
+        meta[channel] = {"id": file_info["id"], "permalink": file_info.get("permalink")}
+        self._write_meta(key, meta)
+
+    def forget_upload(self, key: str, channel: str):
+        """Slack側で削除されたファイルの記録を消す"""
+        meta = self._read_meta(key)
+        if meta.pop(channel, None) is not None:
+            self._write_meta(key, meta)
+
+    def _read_meta(self, key: str) -> dict:
+        try:
+            return json.loads((self.directory / f"{key}.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, key: str, meta: dict):
+        path = self.directory / f"{key}.json"
+        tmp = path.with_suffix(".json.tmp")
+        try:
+            tmp.write_text(json.dumps(meta), encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError as e:
+            logging.warning("Failed to save screenshot upload record: %s", e)
+
+    def _evict(self):
+        """合計サイズが上限を超えたら、最後に使った時刻が古い画像から削除"""
+        with self._lock:
+            entries = []
+            for path in self.directory.glob("*.png"):
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                path.with_suffix(".json").unlink(missing_ok=True)
+                total -= size
+                logging.info("Evicted cached screenshot %s", path.name)
@@ -0,0 +1,182 @@
+"""
+ヘッドレス用スクリーンショット実装
+エディタを起動せず、Pygmentsでシンタックスハイライトしたコードを直接PNGに描画する
+（GUIセッションのないLinuxサーバーでも動き、エディタの起動待ちがないため1秒以内に撮影できる）
+"""
+import os
+import tempfile
+import logging
+from typing import Tuple, Optional
+
+from .base import ScreenshotHandler
+
+# Pygments（PNGの描画にはPillowも必要）
+try:
+    from pygments import lex
+    from pygments.lexers import get_lexer_for_filename, guess_lexer
+    from pygments.lexers.special import TextLexer
+    from pygments.formatters.img import ImageFormatter, FontNotFound
+    from pygments.util import ClassNotFound
+    import PIL  # noqa: F401  ImageFormatter が内部で使う
+    PYGMENTS_AVAILABLE = True
+except ImportError:
+    PYGMENTS_AVAILABLE = False
+
+# ファイル全体を字句解析する上限（超えたら表示する範囲だけを解析する）
+MAX_LEX_BYTES = 1_000_000
+
+
+class HeadlessScreenshotHandler(ScreenshotHandler):
+    """エディタを使わずにコードを画像に描画するスクリーンショットハンドラー"""
+
+    def __init__(self, editor_cmd: str, default_cwd: str, lines: int = 40, style: str = "monokai",
+                 font_name: str = "", font_size: int = 14, max_columns: int = 160):
+        """
+        Args:
+            editor_cmd: エディタコマンド（使用しない）
+            default_cwd: デフォルト作業ディレクトリ
+            lines: 描画する行数（エディタの1画面分）
+            style: Pygmentsのスタイル名
+            font_name: 等幅フォント名（空ならPygmentsの既定）
+            font_size: フォントサイズ
+            max_columns: 1行に描画する最大文字数（超えた分は省略）
+        """
+        super().__init__(editor_cmd, default_cwd)
+        self.lines = max(1, lines)
+        self.style = style
+        self.font_name = font_name
+        self.font_size = font_size
+        self.max_columns = max_columns
+        if not PYGMENTS_AVAILABLE:
+            logging.warning("Pygments/Pillow not available. Headless screenshot feature will not work.")
+
+    def take_screenshot(
+        self,
+        file_path: str,
+        line_number: Optional[int] = None,
+        output_path: Optional[str] = None
+    ) -> Tuple[bool, str, Optional[str]]:
+        """
+        スクリーンショットを撮影する（行番号付きでハイライトしたコードをPNGに描画）
+
+        Args:
+            file_path: ファイルパス
+            line_number: 中央に表示して強調する行番号
+            output_path: 出力先パス
+
+        Returns:
+            (成功フラグ, メッセージ, スクリーンショットファイルパス)
+        """
+        if not PYGMENTS_AVAILABLE:
+            return False, "ヘッドレス版の撮影には Pygments と Pillow が必要です（pip install Pygments Pillow）", None
+        try:
+            # ファイルパスを解決
+            if not os.path.isabs(file_path):
+                file_path = os.path.join(self.default_cwd, file_path)
+
+            if not os.path.isfile(file_path):
+                return False, f"ファイルが見つかりません: {file_path}", None
+
+            with open(file_path, "rb") as f:
+                data = f.read()
+            if b"\0" in data[:8192]:
+                return False, f"バイナリファイルは表示できません: {file_path}", None
+            code = data.decode("utf-8", errors="replace")
+
+            # 表示する範囲（指定行が中央に来るようにし、ファイルの端では範囲をずらす）
+            total = code.count("\n") + (0 if code.endswith("\n") else 1)
+            total = max(total, 1)
+            target = min(max(line_number, 1), total) if line_number else None
+            start = max(1, target - self.lines // 2) if target else 1
+            end = min(total, start + self.lines - 1)
+            start = max(1, end - self.lines + 1)
+
+            lexer = self._get_lexer(file_path, code)
+            if len(data) > MAX_LEX_BYTES:
+                # 大きなファイルは表示範囲だけを解析する（複数行にまたがる文字列などの色は崩れることがある）
+                window = "".join(code.splitlines(keepends=True)[start - 1:end])
+                tokens = lex(window, lexer)
+                offset = start
+            else:
+                tokens = lex(code, lexer)
+                offset = 1
+
+            formatter_options = {
+                "style": self.style,
+                "font_size": self.font_size,
+                "line_numbers": True,
+                "line_number_start": start,
+                # hl_lines は描画する範囲の先頭を1とした行番号
+                "hl_lines": [target - start + 1] if target else [],
+                "image_pad": 12,
+            }
+            if self.font_name:
+                formatter_options["font_name"] = self.font_name
+            formatter = ImageFormatter(**formatter_options)
+
+            # 出力先を決定
+            if output_path is None:
+                temp_screenshot = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
+                screenshot_path = temp_screenshot.name
+                temp_screenshot.close()
+            else:
+                screenshot_path = output_path
+
+            with open(screenshot_path, "wb") as out:
+                formatter.format(self._clip(tokens, offset, start, end), out)
+
+            logging.info("Rendered %s lines %d-%d to %s", file_path, start, end, screenshot_path)
+            return True, "スクリーンショットを撮影しました", screenshot_path
+
+        except FontNotFound as e:
+            return False, f"フォントが見つかりません（SCREENSHOT_FONTで等幅フォントを指定してください）: {e}", None
+        except Exception as e:
+            logging.exception("Headless screenshot error")
+            return False, f"エラーが発生しました: {str(e)}", None
+
+    def cleanup(self):
+        """リソースのクリーンアップ（ウィンドウを開かないので不要）"""
+        pass
+
+    def _get_lexer(self, file_path: str, code: str):
+        """ファイル名（分からなければ内容）から字句解析器を選ぶ"""
+        try:
+            return get_lexer_for_filename(file_path, code)
+        except ClassNotFound:
+            pass
+        try:
+            # 全候補で解析を試すため、先頭だけで判定する
+            return guess_lexer(code[:10000])
+        except ClassNotFound:
+            return TextLexer()
+
+    def _clip(self, tokens, offset: int, start: int, end: int):
+        """
+        トークン列から start〜end 行だけを取り出し、長すぎる行を切り詰める
+
+        Args:
+            tokens: (トークン種別, 文字列) の列
+            offset: トークン列の先頭の行番号
+            start: 描画する最初の行番号
+            end: 描画する最後の行番号
+        """
+        lineno = offset
+        column = 0
+        for ttype, value in tokens:
+            for part in value.splitlines(keepends=True):
+                if start <= lineno <= end:
+                    text = part.rstrip("\n")
+                    room = self.max_columns - column
+                    if room > 0:
+                        if len(text) >= room:
+                            text = text[:room - 1] + "…"
+                        column += len(text)
+                        if text:
+                            yield ttype, text
+                    if part.endswith("\n"):
+                        yield ttype, "\n"
+                if part.endswith("\n"):
+                    lineno += 1
+                    column = 0
+                if lineno > end:
+                    return
@@ -6,6 +6,7 @@ import os
 import time
 import tempfile
 import logging
+import threading
 from subprocess import run
 from typing import Tuple, Optional
 
@@ -19,18 +20,31 @@ try:
         kCGNullWindowID,
         kCGWindowOwnerName,
         kCGWindowLayer,
-        kCGWindowNumber
+        kCGWindowNumber,
+        kCGWindowName,
+        kCGWindowBounds
     )
     PYOBJC_AVAILABLE = True
 except ImportError:
     PYOBJC_AVAILABLE = False
     logging.warning("PyObjC not available. Screenshot feature may not work properly.")
 
+# ウィンドウの準備を確認する間隔（最初は短く、確認するたびに倍にする）
+POLL_INITIAL_INTERVAL = 0.05
+POLL_MAX_INTERVAL = 0.25
+
 
 class MacOSScreenshotHandler(ScreenshotHandler):
     """macOS用スクリーンショットハンドラー"""
 
-    def __init__(self, editor_cmd: str, default_cwd: str):
+    def __init__(self, editor_cmd: str, default_cwd: str, ready_timeout: float = 10.0, settle: float = 0.3):
+        """
+        Args:
+            editor_cmd: エディタコマンド（"code" or "cursor"）
+            default_cwd: デフォルト作業ディレクトリ
+            ready_timeout: ウィンドウにファイルが表示されるまで待つ最大秒数
+            settle: ファイルが表示されてから撮影するまでの待ち時間（指定行へのスクロールと描画用）
+        """
         super().__init__(editor_cmd, default_cwd)
 
         # エディタの設定
@@ -38,6 +52,11 @@ class MacOSScreenshotHandler(ScreenshotHandler):
         self.app_name = "Cursor" if self.is_cursor else "Visual Studio Code"
         self.process_name = "Cursor" if self.is_cursor else "Code"
 
+        self.ready_timeout = ready_timeout
+        self.settle = settle
+        # 開く前後のウィンドウを比べて撮影用のウィンドウを特定するので、撮影は1件ずつ行う
+        self._lock = threading.Lock()
+
     def take_screenshot(
         self,
         file_path: str,
@@ -46,6 +65,8 @@ class MacOSScreenshotHandler(ScreenshotHandler):
     ) -> Tuple[bool, str, Optional[str]]:
         """
         スクリーンショットを撮影する
+        ファイルを新しいウィンドウで開き、開く前になかったウィンドウだけを操作・撮影して閉じる
+        （ユーザーが使っているウィンドウにはキー入力を送らない）
 
         Args:
             file_path: ファイルパス
@@ -55,70 +76,207 @@ class MacOSScreenshotHandler(ScreenshotHandler):
         Returns:
             (成功フラグ, メッセージ, スクリーンショットファイルパス)
         """
-        try:
-            # ファイルパスを解決
-            if not os.path.isabs(file_path):
-                file_path = os.path.join(self.default_cwd, file_path)
+        with self._lock:
+            title = None
+            try:
+                # ファイルパスを解決
+                if not os.path.isabs(file_path):
+                    file_path = os.path.join(self.default_cwd, file_path)
 
-            if not os.path.exists(file_path):
-                return False, f"ファイルが見つかりません: {file_path}", None
+                if not os.path.exists(file_path):
+                    return False, f"ファイルが見つかりません: {file_path}", None
 
-            abs_path = os.path.abspath(file_path)
+                abs_path = os.path.abspath(file_path)
+                file_name = os.path.basename(abs_path)
 
-            # 出力先を決定
-            if output_path is None:
-                temp_screenshot = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
-                screenshot_path = temp_screenshot.name
-                temp_screenshot.close()
-            else:
-                screenshot_path = output_path
+                # 出力先を決定
+                if output_path is None:
+                    temp_screenshot = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
+                    screenshot_path = temp_screenshot.name
+                    temp_screenshot.close()
+                else:
+                    screenshot_path = output_path
 
-            # エディタで新しいウィンドウで開く
-            if line_number:
-                open_cmd = [self.editor_cmd, "--new-window", "--goto", f"{abs_path}:{line_number}"]
-            else:
-                open_cmd = [self.editor_cmd, "--new-window", abs_path]
+                # 開く前のウィンドウを記録（同じファイルを表示しているユーザーのウィンドウと区別する）
+                before_ids = {wid for wid, _, _ in self._editor_windows()} if PYOBJC_AVAILABLE else set()
+                before_titles = self._window_titles()
 
-            logging.info(f"Opening file with command: {' '.join(open_cmd)}")
-            result = run(open_cmd, capture_output=True, text=True)
+                # エディタで新しいウィンドウで開く
+                target = f"{abs_path}:{line_number}" if line_number else abs_path
+                open_cmd = [self.editor_cmd, "--new-window", "--goto", target]
 
-            if result.returncode != 0:
-                return False, f"ファイルを開けませんでした: {result.stderr}", None
+                logging.info(f"Opening file with command: {' '.join(open_cmd)}")
+                result = run(open_cmd, capture_output=True, text=True)
 
-            # エディタが起動するまで待機
-            time.sleep(3)
+                if result.returncode != 0:
+                    return False, f"ファイルを開けませんでした: {result.stderr}", None
 
-            # エディタをアクティブにする
-            activate_script = f'tell application "{self.app_name}" to activate'
-            run(["osascript", "-e", activate_script], capture_output=True, text=True)
-            time.sleep(2)
+                # 新しいウィンドウにファイル名が出るまで待つ（固定の待ち時間の代わり）
+                window_id, title = self._wait_for_new_window(file_name, before_ids, before_titles)
+                if window_id is None and title is None:
+                    return False, "エディタのウィンドウが時間内に開きませんでした", None
 
-            # ウィンドウを最大化
-            self._maximize_window()
-            time.sleep(1.5)
+                # エディタをアクティブにする
+                activate_script = f'tell application "{self.app_name}" to activate'
+                run(["osascript", "-e", activate_script], capture_output=True, text=True)
 
-            # スクリーンショット撮影
-            screenshot_success = self._capture_screenshot(screenshot_path)
+                # ウィンドウを最大化し、サイズが反映されるまで待つ
+                if title:
+                    self._maximize_window(title)
+                    if window_id:
+                        self._wait_for_bounds_stable(window_id)
 
-            if not screenshot_success:
-                return False, "スクリーンショットの撮影に失敗しました", None
+                # 指定行へのスクロールと描画を待つ
+                time.sleep(self.settle)
 
-            # ウィンドウを閉じる
-            self._close_window()
+                # スクリーンショット撮影
+                screenshot_success = self._capture_screenshot(screenshot_path, window_id, title)
 
-            return True, "スクリーンショットを撮影しました", screenshot_path
+                if not screenshot_success:
+                    return False, "スクリーンショットの撮影に失敗しました", None
 
-        except Exception as e:
-            logging.exception("Screenshot error")
-            return False, f"エラーが発生しました: {str(e)}", None
+                return True, "スクリーンショットを撮影しました", screenshot_path
+
+            except Exception as e:
+                logging.exception("Screenshot error")
+                return False, f"エラーが発生しました: {str(e)}", None
+            finally:
+                # 撮影のために開いたウィンドウだけを閉じる
+                if title:
+                    self._close_window(title)
+
+    def _poll(self, check, timeout: float):
+        """
+        check() が値を返すまで、間隔を伸ばしながら繰り返す
+
+        Args:
+            check: 準備ができていれば真となる値を返す関数
+            timeout: 待つ最大秒数
+
+        Returns:
+            check() の返した値（時間切れならNone）
+        """
+        deadline = time.monotonic() + timeout
+        interval = POLL_INITIAL_INTERVAL
+        while True:
+            try:
+                value = check()
+            except Exception as e:
+                logging.debug(f"Readiness check failed: {e}")
+                value = None
+            if value:
+                return value
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, POLL_MAX_INTERVAL)
+
+    def _editor_windows(self) -> list:
+        """
+        エディタの通常ウィンドウの一覧
+
+        Returns:
+            [(ウィンドウID, タイトル, 境界の辞書)]
+        """
+        window_list = CGWindowListCopyWindowInfo(kCGWindowListOptionOnScreenOnly, kCGNullWindowID) or []
+        windows = []
+        for window in window_list:
+            owner = window.get(kCGWindowOwnerName, "")
+            layer = window.get(kCGWindowLayer, -1)
+            if self.process_name in owner and layer == 0:
+                windows.append((
+                    int(window.get(kCGWindowNumber, 0)),
+                    window.get(kCGWindowName, "") or "",
+                    dict(window.get(kCGWindowBounds, {}) or {}),
+                ))
+        return windows
+
+    def _window_titles(self) -> list:
+        """AppleScript（アクセシビリティ）で取得したエディタのウィンドウのタイトル一覧"""
+        script = f'''
+        tell application "System Events"
+            if not (exists process "{self.process_name}") then return ""
+            tell process "{self.process_name}"
+                set AppleScript's text item delimiters to linefeed
+                return (name of every window) as text
+            end tell
+        end tell
+        '''
+        result = run(["osascript", "-e", script], capture_output=True, text=True, timeout=5)
+        if result.returncode != 0:
+            return []
+        return [line for line in result.stdout.splitlines() if line]
+
+    def _new_window_title(self, file_name: str, before_titles: list) -> Optional[str]:
+        """
+        開く前にはなかった、ファイル名を含むウィンドウのタイトル
+
+        Returns:
+            タイトル（見つからない・1つに決まらない場合はNone）
+        """
+        titles = self._window_titles()
+        # 同じタイトルのウィンドウが複数あると、タイトルで指定したときにユーザーのウィンドウを操作しかねない
+        new = {t for t in titles if file_name in t and t not in before_titles and titles.count(t) == 1}
+        return new.pop() if len(new) == 1 else None
 
-    def _maximize_window(self):
-        """ウィンドウを最大化"""
+    def _wait_for_new_window(self, file_name: str, before_ids: set, before_titles: list) -> Tuple[Optional[int], Optional[str]]:
+        """
+        開く前にはなかったエディタのウィンドウにファイルが表示されるまで待つ
+
+        Args:
+            file_name: 開いたファイルの名前
+            before_ids: 開く前のウィンドウID（PyObjCがなければ空）
+            before_titles: 開く前のウィンドウのタイトル
+
+        Returns:
+            (CGWindowID, タイトル)。特定できなかった方はNone
+        """
+        window_id = None
+        if PYOBJC_AVAILABLE:
+            def check():
+                new = [(wid, title) for wid, title, _ in self._editor_windows() if wid not in before_ids]
+                for wid, title in new:
+                    if file_name in title:
+                        return wid
+                # タイトルの取得には画面収録の権限が必要。取れない環境では新しいウィンドウが1つならそれを使う
+                if len(new) == 1 and not new[0][1]:
+                    return new[0][0]
+                return None
+
+            window_id = self._poll(check, self.ready_timeout)
+            if window_id is None:
+                return None, None
+            logging.info(f"Editor window ready: id={window_id}")
+
+        # 操作（最大化・閉じる）はタイトルで指定するので、アクセシビリティ経由のタイトルも特定する
+        title = self._poll(
+            lambda: self._new_window_title(file_name, before_titles),
+            POLL_MAX_INTERVAL * 4 if window_id else self.ready_timeout,
+        )
+        if title is None:
+            logging.warning("Could not identify the new editor window by title; it will not be resized or closed")
+        return window_id, title
+
+    def _wait_for_bounds_stable(self, window_id: int):
+        """最大化などでウィンドウの大きさが変わり終わるまで待つ（2回続けて同じ値になるまで）"""
+        last = [None]
+
+        def check():
+            bounds = next((b for wid, _, b in self._editor_windows() if wid == window_id), None)
+            stable = bounds is not None and bounds == last[0]
+            last[0] = bounds
+            return stable
+
+        self._poll(check, self.ready_timeout)
+
+    def _maximize_window(self, title: str):
+        """撮影用のウィンドウを最大化"""
         maximize_script = f"""
         tell application "System Events"
             tell process "{self.process_name}"
-                if exists window 1 then
-                    tell window 1
+                if exists window {_applescript_string(title)} then
+                    tell window {_applescript_string(title)}
                         set position to {{0, 23}}
                         set size to {{1920, 1057}}
                     end tell
@@ -132,16 +290,19 @@ class MacOSScreenshotHandler(ScreenshotHandler):
         else:
             logging.info("Window maximized successfully")
 
-    def _capture_screenshot(self, screenshot_path: str) -> bool:
+    def _capture_screenshot(self, screenshot_path: str, window_id: Optional[int], title: Optional[str]) -> bool:
         """
         スクリーンショットを撮影
 
+        Args:
+            screenshot_path: 出力先パス
+            window_id: 撮影するウィンドウのID（PyObjCで取得できなかった場合はNone）
+            title: 撮影するウィンドウのタイトル（フォールバック用）
+
         Returns:
             成功フラグ
         """
-        # 方法1: PyObjCでウィンドウIDを取得
-        window_id = self._find_window_id()
-
+        # 方法1: PyObjCで取得したウィンドウIDで撮影
         if window_id:
             try:
                 result = run(
@@ -158,7 +319,7 @@ class MacOSScreenshotHandler(ScreenshotHandler):
 
         # 方法2（フォールバック）: AXで座標/サイズを取得して矩形キャプチャ
         logging.info("Trying fallback method: AX bounds + screencapture -R")
-        bounds = self._get_window_bounds()
+        bounds = self._get_window_bounds(title) if title else None
         if bounds:
             x, y, w, h = bounds
             try:
@@ -176,51 +337,13 @@ class MacOSScreenshotHandler(ScreenshotHandler):
 
         return False
 
-    def _find_window_id(self, retry: int = 20, sleep_sec: float = 0.25) -> Optional[int]:
-        """
-        CGWindowListを使用してウィンドウIDを取得
-
-        Returns:
-            CGWindowID または None
-        """
-        if not PYOBJC_AVAILABLE:
-            logging.error("PyObjC is not available")
-            return None
-
-        for attempt in range(retry):
-            try:
-                window_list = CGWindowListCopyWindowInfo(
-                    kCGWindowListOptionOnScreenOnly,
-                    kCGNullWindowID
-                )
-
-                if not window_list:
-                    logging.warning(f"No windows found (attempt {attempt + 1}/{retry})")
-                    time.sleep(sleep_sec)
-                    continue
-
-                for window in window_list:
-                    owner = window.get(kCGWindowOwnerName, "")
-                    layer = window.get(kCGWindowLayer, -1)
-                    window_id = window.get(kCGWindowNumber, 0)
-
-                    if self.process_name in owner and layer == 0:
-                        logging.info(f"Found window: owner={owner}, id={window_id}, layer={layer}")
-                        return int(window_id)
-
-                logging.debug(f"Window not found for owner={self.process_name} (attempt {attempt + 1}/{retry})")
-                time.sleep(sleep_sec)
-
-            except Exception as e:
-                logging.error(f"Error finding window ID: {e}")
-                time.sleep(sleep_sec)
-
-        return None
-
-    def _get_window_bounds(self) -> Optional[Tuple[int, int, int, int]]:
+    def _get_window_bounds(self, title: str) -> Optional[Tuple[int, int, int, int]]:
         """
         AppleScriptを使用してウィンドウの座標とサイズを取得
 
+        Args:
+            title: 対象のウィンドウのタイトル
+
         Returns:
             (x, y, width, height) または None
         """
@@ -228,9 +351,9 @@ class MacOSScreenshotHandler(ScreenshotHandler):
         tell application "System Events"
             if not (exists process "{self.process_name}") then return "ERR"
             tell process "{self.process_name}"
-                if (count of windows) < 1 then return "ERR"
-                set p to position of window 1
-                set s to size of window 1
+                if not (exists window {_applescript_string(title)}) then return "ERR"
+                set p to position of window {_applescript_string(title)}
+                set s to size of window {_applescript_string(title)}
                 return ((item 1 of p) as text) & "," & ((item 2 of p) as text) & "," & ((item 1 of s) as text) & "," & ((item 2 of s) as text)
             end tell
         end tell
@@ -258,14 +381,22 @@ class MacOSScreenshotHandler(ScreenshotHandler):
 
         return None
 
-    def _close_window(self):
-        """ウィンドウを閉じる"""
+    def _close_window(self, title: str):
+        """
+        撮影のために開いたウィンドウを閉じる（タイトルで指定したウィンドウの閉じるボタンを押す）
+        同じタイトルのウィンドウが他にもある場合は、ユーザーのウィンドウを閉じないよう何もしない
+
+        Args:
+            title: 撮影用のウィンドウのタイトル
+        """
+        if self._window_titles().count(title) != 1:
+            logging.warning(f"Not closing editor window {title!r}: it cannot be told apart from other windows")
+            return
         close_window_script = f"""
         tell application "System Events"
             tell process "{self.process_name}"
-                if exists window 1 then
-                    set frontmost to true
-                    keystroke "w" using {{command down, shift down}}
+                if exists window {_applescript_string(title)} then
+                    click (first button of window {_applescript_string(title)} whose subrole is "AXCloseButton")
                 end if
             end tell
         end tell
@@ -275,8 +406,12 @@ class MacOSScreenshotHandler(ScreenshotHandler):
             logging.warning(f"Failed to close window: {result.stderr}")
         else:
             logging.info("Window closed successfully")
-        time.sleep(0.5)
 
     def cleanup(self):
-        """リソースのクリーンアップ"""
+        """リソースのクリーンアップ（撮影ごとにウィンドウを閉じるため不要）"""
         pass
+
+
+def _applescript_string(text: str) -> str:
+    """AppleScriptの文字列リテラルにする"""
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
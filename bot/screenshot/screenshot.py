@@ -3,18 +3,24 @@
 独立実行可能・他モジュールからimport可能
 """
 import sys
+import atexit
 import argparse
 import logging
+import threading
 from pathlib import Path
 
 # 親ディレクトリをパスに追加（独立実行時のため）
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
-from bot.config import SCREENSHOT_OS, EDITOR_CMD, DEFAULT_CWD
+from bot.config import (
+    SCREENSHOT_OS, EDITOR_CMD, DEFAULT_CWD, SCREENSHOT_READY_TIMEOUT, SCREENSHOT_SETTLE,
+    SCREENSHOT_LINES, SCREENSHOT_STYLE, SCREENSHOT_FONT, SCREENSHOT_FONT_SIZE,
+)
 from bot.screenshot.base import ScreenshotHandler
 from bot.screenshot.macos import MacOSScreenshotHandler
 from bot.screenshot.windows import WindowsScreenshotHandler
 from bot.screenshot.linux import LinuxScreenshotHandler
+from bot.screenshot.headless import HeadlessScreenshotHandler
 
 logging.basicConfig(
     level=logging.INFO,
@@ -22,12 +28,17 @@ logging.basicConfig(
 )
 
 
+# OS種別ごとのハンドラー（撮影を1件ずつ行うため、プロセス内で1つだけ作る）
+_handlers = {}
+_handlers_lock = threading.Lock()
+
+
 def get_screenshot_handler(os_type: str = None) -> ScreenshotHandler:
     """
-    OS別のスクリーンショットハンドラーを取得
+    OS別のスクリーンショットハンドラーを取得（作成済みならそれを返す）
 
     Args:
-        os_type: OS種別（"macos", "windows", "linux"）
+        os_type: OS種別（"macos", "windows", "linux", "headless"）
 
     Returns:
         ScreenshotHandler
@@ -37,12 +48,25 @@ def get_screenshot_handler(os_type: str = None) -> ScreenshotHandler:
 
     os_type = os_type.lower()
 
+    with _handlers_lock:
+        handler = _handlers.get(os_type)
+        if handler is None:
+            handler = _handlers[os_type] = _create_screenshot_handler(os_type)
+        return handler
+
+
+def _create_screenshot_handler(os_type: str) -> ScreenshotHandler:
+    """OS別のスクリーンショットハンドラーを作成"""
     if os_type == "macos":
-        return MacOSScreenshotHandler(EDITOR_CMD, DEFAULT_CWD)
+        return MacOSScreenshotHandler(EDITOR_CMD, DEFAULT_CWD, SCREENSHOT_READY_TIMEOUT, SCREENSHOT_SETTLE)
     elif os_type == "windows":
         return WindowsScreenshotHandler(EDITOR_CMD, DEFAULT_CWD)
     elif os_type == "linux":
         return LinuxScreenshotHandler(EDITOR_CMD, DEFAULT_CWD)
+    elif os_type == "headless":
+        return HeadlessScreenshotHandler(
+            EDITOR_CMD, DEFAULT_CWD, SCREENSHOT_LINES, SCREENSHOT_STYLE, SCREENSHOT_FONT, SCREENSHOT_FONT_SIZE
+        )
     else:
         raise ValueError(f"Unsupported OS: {os_type}")
 
@@ -66,10 +90,20 @@ def take_screenshot(
         (成功フラグ, メッセージ, スクリーンショットファイルパス)
     """
     handler = get_screenshot_handler(os_type)
-    try:
-        return handler.take_screenshot(file_path, line_number, output_path)
-    finally:
-        handler.cleanup()
+    return handler.take_screenshot(file_path, line_number, output_path)
+
+
+@atexit.register
+def cleanup_screenshot_handlers():
+    """終了時に各ハンドラーのリソースを片付ける"""
+    with _handlers_lock:
+        handlers = list(_handlers.values())
+        _handlers.clear()
+    for handler in handlers:
+        try:
+            handler.cleanup()
+        except Exception as e:
+            logging.warning(f"Screenshot handler cleanup failed: {e}")
 
 
 def main():
@@ -93,7 +127,7 @@ def main():
     )
     parser.add_argument(
         "--os",
-        choices=["macos", "windows", "linux"],
+        choices=["macos", "windows", "linux", "headless"],
         help=f"OS種別（デフォルト: {SCREENSHOT_OS}）"
     )
     parser.add_argument(
@@ -0,0 +1,270 @@
+"""
+バッファ管理モジュール（asyncio版）
+コールバックは同期的にバッファへ積むだけで、Slackへの投稿は1つのフラッシャータスクが順番に行う
+"""
+import time
+import asyncio
+import logging
+
+from ..config import FLUSH_INTERVAL, PROGRESS_INTERVAL, MAX_LEN, STREAM_MODE, STREAM_UPDATES_PER_SEC, FLUSH_POLICY, SENDER_MAX_PENDING_CHARS
+from .text import sanitize, chunk
+from .flush_policy import create_flush_policy
+from . import tracing
+
+FINAL_SEPARATOR = "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n**最終出力**\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━"
+
+
+class AsyncOutputBuffer:
+    """出力バッファを管理するクラス（AsyncWebClient用）"""
+
+    def __init__(self, client, channel, thread_ts, enable_streaming, start_time, history_store=None):
+        """
+        Args:
+            client: Slack AsyncWebClient
+            channel: チャンネルID
+            thread_ts: スレッドID
+            enable_streaming: ストリーミング有効フラグ
+            start_time: 実行開始時刻
+            history_store: 会話履歴キャッシュ（投稿したメッセージを記録）
+        """
+        self.client = client
+        self.channel = channel
+        self.thread_ts = thread_ts
+        self.enable_streaming = enable_streaming
+        self.start_time = start_time
+        self.history_store = history_store
+
+        self.output_buffer = []
+        self.stderr_buffer = []
+        self.final_buffer = []
+        self.buffered_len = 0
+        self.omitted = 0  # Slackが遅れて間引いた途中経過の文字数
+        self.last_progress_time = time.time()
+        self.message_stopped = [False]
+
+        # updateモード: 途中経過を1つのメッセージに追記し chat.update で編集する
+        self.update_in_place = STREAM_MODE == "update"
+        self.flush_interval = 1.0 / STREAM_UPDATES_PER_SEC if self.update_in_place else FLUSH_INTERVAL
+        self.live_ts = None
+        self.live_text = ""
+
+        # いつフラッシュするかはポリシーが決める（updateモードでは編集間隔を下限にする）
+        self.policy = create_flush_policy(
+            FLUSH_POLICY, self.flush_interval,
+            min_gap=self.flush_interval if self.update_in_place else 0.0,
+        )
+
+        # フラッシュのスパンは、作成時点のスパン（ジョブ）の子として記録する
+        self.trace_parent = tracing.current_span()
+
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._flusher_task = None
+
+    async def post_content(self, content: str, wrap_code: bool = False):
+        """
+        コンテンツをSlackに投稿
+
+        Args:
+            content: 投稿内容
+            wrap_code: コードブロックで囲むか
+        """
+        content = sanitize(content)
+        if wrap_code and content.strip():
+            content = f"```\n{content}\n```"
+        for part in chunk(content, MAX_LEN):
+            try:
+                started = time.monotonic()
+                result = await self.client.chat_postMessage(
+                    channel=self.channel,
+                    thread_ts=self.thread_ts,
+                    text=part
+                )
+                self._observe("chat.postMessage", time.monotonic() - started)
+                if self.history_store is not None and result.get("message"):
+                    await asyncio.to_thread(
+                        self.history_store.record_message, self.channel, self.thread_ts, result["message"]
+                    )
+            except Exception as e:
+                logging.exception("Failed to post to Slack: %s", e)
+        # 別メッセージを挟んだら、以降の途中経過は新しいメッセージに書く
+        self.live_ts = None
+
+    async def post_live(self, content: str):
+        """
+        途中経過を編集中のメッセージに追記（updateモード）
+        MAX_LEN を超える場合は新しいメッセージに切り替える
+
+        Args:
+            content: 追記する内容
+        """
+        content = sanitize(content)
+        # コードブロックの ``` と改行ぶんを差し引いた長さで判定
+        limit = MAX_LEN - 8
+        try:
+            if self.live_ts and len(self.live_text) + len(content) <= limit:
+                text = self.live_text + content
+                started = time.monotonic()
+                await self.client.chat_update(
+                    channel=self.channel,
+                    ts=self.live_ts,
+                    text=f"```\n{text}\n```"
+                )
+                self._observe("chat.update", time.monotonic() - started)
+                self.live_text = text
+                return
+            for part in chunk(content, limit):
+                started = time.monotonic()
+                result = await self.client.chat_postMessage(
+                    channel=self.channel,
+                    thread_ts=self.thread_ts,
+                    text=f"```\n{part}\n```"
+                )
+                self._observe("chat.postMessage", time.monotonic() - started)
+                self.live_ts = result.get("ts")
+                self.live_text = part
+        except Exception as e:
+            logging.exception("Failed to update live message: %s", e)
+            # 編集できなかったメッセージは諦め、次回は新しいメッセージに書く
+            self.live_ts = None
+
+    def _observe(self, method: str, latency: float):
+        """投稿にかかった時間とレート制限の残り容量をフラッシュポリシーに伝える"""
+        headroom = 1.0
+        rate_limiter = getattr(self.client, "rate_limiter", None)
+        if rate_limiter is not None:
+            headroom = rate_limiter.bucket(method, self.channel).headroom()
+        self.policy.observe(latency, headroom)
+
+    async def flush(self):
+        """バッファの内容をフラッシュ（途中経過 → stderr → 最終出力の順）"""
+        stdout_payload = "".join(self.output_buffer)
+        stderr_payload = "".join(self.stderr_buffer)
+        final_parts = list(self.final_buffer)
+        self.output_buffer.clear()
+        self.stderr_buffer.clear()
+        self.final_buffer.clear()
+        self.buffered_len = 0
+        self.policy.on_flush(time.time())
+        if not (stdout_payload or stderr_payload or final_parts):
+            return
+        span = tracing.start_span("output.flush", parent=self.trace_parent,
+                                  output_stdout_chars=len(stdout_payload), output_stderr_chars=len(stderr_payload),
+                                  output_final=bool(final_parts))
+        with span:
+            await self._post_payloads(stdout_payload, stderr_payload, final_parts)
+
+    async def _post_payloads(self, stdout_payload: str, stderr_payload: str, final_parts: list):
+        """フラッシュで取り出した内容を投稿（途中経過 → stderr → 最終出力の順）"""
+        if stdout_payload and self.omitted:
+            stdout_payload = f"…（Slackへの送信が追いつかないため{self.omitted}文字省略）\n{stdout_payload}"
+            self.omitted = 0
+
+        if stdout_payload:
+            if self.update_in_place:
+                await self.post_live(stdout_payload)
+            else:
+                await self.post_content(stdout_payload, wrap_code=True)
+        if stderr_payload:
+            await self.post_content(f"[STDERR]\n{stderr_payload}")
+        for part in final_parts:
+            if self.enable_streaming:
+                await self.post_content(FINAL_SEPARATOR)
+            await self.post_content(part, wrap_code=False)
+
+    def append_stdout(self, line: str):
+        """標準出力をバッファに追加（イベントループ上で同期的に呼ばれる）"""
+        # 最終出力は次のフラッシュで区切り線とともに投稿
+        if self.message_stopped[0]:
+            self.final_buffer.append(line)
+            self._wakeup.set()
+            return
+
+        # ストリーミング無効時は中間出力を無視
+        if not self.enable_streaming:
+            return
+
+        self.output_buffer.append(line)
+        self.buffered_len += len(line)
+        # 投稿が追いつかずに溜まりすぎたら古い途中経過から間引く
+        while self.buffered_len > SENDER_MAX_PENDING_CHARS and len(self.output_buffer) > 1:
+            dropped = self.output_buffer.pop(0)
+            self.buffered_len -= len(dropped)
+            self.omitted += len(dropped)
+        self._schedule(line)
+
+    def append_stderr(self, line: str):
+        """標準エラーをバッファに追加"""
+        self.stderr_buffer.append(line)
+        self._schedule(line)
+
+    def _schedule(self, line: str):
+        """ポリシーに追加を伝え、期限が早まったらフラッシャーを起こす"""
+        previous = self.policy.deadline
+        deadline = self.policy.on_append(line, self.buffered_len, time.time())
+        if previous is None or deadline < previous:
+            self._wakeup.set()
+
+    def start_auto_flusher(self):
+        """自動フラッシュタスクを開始"""
+        self._flusher_task = asyncio.create_task(self._auto_flusher())
+        return self._flusher_task
+
+    async def stop_auto_flusher(self):
+        """自動フラッシュタスクを停止（投稿中の内容は送り切る）"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._flusher_task:
+            await self._flusher_task
+
+    def clear(self):
+        """バッファをクリア"""
+        self.output_buffer.clear()
+        self.stderr_buffer.clear()
+        self.final_buffer.clear()
+        self.buffered_len = 0
+        self.omitted = 0
+
+    async def _auto_flusher(self):
+        """フラッシャータスク本体（次の期限まで起床イベントを待つ）"""
+        while not self._stopping:
+            now = time.time()
+            wake_times = []
+            if self.final_buffer:
+                wake_times.append(now)
+            elif (self.output_buffer or self.stderr_buffer) and self.policy.deadline is not None:
+                wake_times.append(self.policy.deadline)
+            # ストリーミング無効時はPROGRESS_INTERVAL秒ごとに進捗メッセージを送信
+            if not self.enable_streaming:
+                wake_times.append(self.last_progress_time + PROGRESS_INTERVAL)
+            wake_at = min(wake_times) if wake_times else None
+            if wake_at is None or wake_at > now:
+                try:
+                    await asyncio.wait_for(
+                        self._wakeup.wait(),
+                        timeout=None if wake_at is None else wake_at - now,
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            if not self.enable_streaming and now - self.last_progress_time >= PROGRESS_INTERVAL:
+                elapsed_seconds = int(now - self.start_time)
+                elapsed_minutes = elapsed_seconds // 60
+                elapsed_secs = elapsed_seconds % 60
+                elapsed_str = f"{elapsed_minutes}分{elapsed_secs}秒" if elapsed_minutes > 0 else f"{elapsed_secs}秒"
+                try:
+                    await self.client.chat_postMessage(
+                        channel=self.channel,
+                        thread_ts=self.thread_ts,
+                        text=f"実行中...（経過時間: {elapsed_str}）"
+                    )
+                except Exception as e:
+                    logging.error("Failed to post progress message: %s", e)
+                self.last_progress_time = now
+
+            if self.final_buffer or (
+                    (self.output_buffer or self.stderr_buffer)
+                    and self.policy.deadline is not None and self.policy.deadline <= now):
+                await self.flush()
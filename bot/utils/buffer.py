@@ -1,18 +1,23 @@
 """
 バッファ管理モジュール
-出力バッファの管理とフラッシュ処理
+出力バッファの管理とフラッシュ処理（Slackへの投稿は SlackSender の送信スレッドが行う）
 """
 import time
 import logging
 import threading
 
-from ..config import FLUSH_INTERVAL, PROGRESS_INTERVAL
+from ..config import FLUSH_INTERVAL, PROGRESS_INTERVAL, STREAM_MODE, STREAM_UPDATES_PER_SEC, FLUSH_POLICY
+from .flush_policy import create_flush_policy
+from .sender import SlackSender
+from . import tracing
+
+FINAL_SEPARATOR = "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n**最終出力**\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━"
 
 
 class OutputBuffer:
     """出力バッファを管理するクラス"""
 
-    def __init__(self, client, channel, thread_ts, enable_streaming, start_time):
+    def __init__(self, client, channel, thread_ts, enable_streaming, start_time, history_store=None):
         """
         Args:
             client: Slack WebClient
@@ -20,22 +25,43 @@ class OutputBuffer:
             thread_ts: スレッドID
             enable_streaming: ストリーミング有効フラグ
             start_time: 実行開始時刻
+            history_store: 会話履歴キャッシュ（投稿したメッセージを記録）
         """
         self.client = client
         self.channel = channel
         self.thread_ts = thread_ts
         self.enable_streaming = enable_streaming
         self.start_time = start_time
+        self.history_store = history_store
 
         self.output_buffer = []
         self.stderr_buffer = []
         self.buffer_lock = threading.RLock()
+        self.flush_cond = threading.Condition(self.buffer_lock)
         self.buffered_len = [0]
-        self.last_post_time = [0]
         self.last_progress_time = [time.time()]
         self.stop_flusher = [False]
         self.message_stopped = [False]
 
+        # updateモード: 途中経過を1つのメッセージに追記し chat.update で編集する
+        self.update_in_place = STREAM_MODE == "update"
+        self.flush_interval = 1.0 / STREAM_UPDATES_PER_SEC if self.update_in_place else FLUSH_INTERVAL
+        self.live_lock = threading.Lock()
+        self.live_ts = None
+        self.live_text = ""
+
+        # いつフラッシュするかはポリシーが決める（updateモードでは編集間隔を下限にする）
+        self.policy = create_flush_policy(
+            FLUSH_POLICY, self.flush_interval,
+            min_gap=self.flush_interval if self.update_in_place else 0.0,
+        )
+
+        # フラッシュ・投稿のスパンは、作成時点のスパン（ジョブ）の子として記録する
+        self.trace_parent = tracing.current_span()
+
+        # 投稿は送信スレッドに任せ、stdoutを読むスレッドはキューに積むだけにする
+        self.sender = SlackSender(self._send, name=f"slack-sender-{thread_ts}")
+
     def post_content(self, content: str, wrap_code: bool = False, post_func=None):
         """
         コンテンツをSlackに投稿
@@ -53,27 +79,96 @@ class OutputBuffer:
         if wrap_code and content.strip():
             content = f"```\n{content}\n```"
         for part in chunk(content, MAX_LEN):
-            time.sleep(0.2)  # rate limit 緩和
             try:
                 logging.info("Posting to Slack: %s", part[:100])
                 if post_func:
                     post_func(part)
                 else:
+                    started = time.monotonic()
                     result = self.client.chat_postMessage(
                         channel=self.channel,
                         thread_ts=self.thread_ts,
                         text=part
                     )
+                    self._observe("chat.postMessage", time.monotonic() - started)
                     logging.info("Posted successfully: %s", result.get("ok"))
+                    if self.history_store is not None and result.get("message"):
+                        self.history_store.record_message(self.channel, self.thread_ts, result["message"])
             except Exception as e:
                 logging.exception("Failed to post to Slack: %s", e)
+        # 別メッセージを挟んだら、以降の途中経過は新しいメッセージに書く
+        self.live_ts = None
+
+    def post_live(self, content: str):
+        """
+        途中経過を編集中のメッセージに追記（updateモード）
+        MAX_LEN を超える場合は新しいメッセージに切り替える
+
+        Args:
+            content: 追記する内容
+        """
+        from ..utils.text import sanitize, chunk
+        from ..config import MAX_LEN
+
+        content = sanitize(content)
+        # コードブロックの ``` と改行ぶんを差し引いた長さで判定
+        limit = MAX_LEN - 8
+        with self.live_lock:
+            try:
+                if self.live_ts and len(self.live_text) + len(content) <= limit:
+                    text = self.live_text + content
+                    started = time.monotonic()
+                    self.client.chat_update(
+                        channel=self.channel,
+                        ts=self.live_ts,
+                        text=f"```\n{text}\n```"
+                    )
+                    self._observe("chat.update", time.monotonic() - started)
+                    self.live_text = text
+                    return
+                for part in chunk(content, limit):
+                    started = time.monotonic()
+                    result = self.client.chat_postMessage(
+                        channel=self.channel,
+                        thread_ts=self.thread_ts,
+                        text=f"```\n{part}\n```"
+                    )
+                    self._observe("chat.postMessage", time.monotonic() - started)
+                    self.live_ts = result.get("ts")
+                    self.live_text = part
+            except Exception as e:
+                logging.exception("Failed to update live message: %s", e)
+                # 編集できなかったメッセージは諦め、次回は新しいメッセージに書く
+                self.live_ts = None
+
+    def _observe(self, method: str, latency: float):
+        """投稿にかかった時間とレート制限の残り容量をフラッシュポリシーに伝える"""
+        headroom = 1.0
+        rate_limiter = getattr(self.client, "rate_limiter", None)
+        if rate_limiter is not None:
+            headroom = rate_limiter.bucket(method, self.channel).headroom()
+        with self.buffer_lock:
+            self.policy.observe(latency, headroom)
+
+    def _send(self, kind: str, content: str):
+        """送信スレッドから呼ばれ、種類に応じてSlackへ投稿"""
+        with tracing.start_span("slack.post", parent=self.trace_parent, slack_kind=kind, slack_chars=len(content)):
+            if kind == "output":
+                if self.update_in_place:
+                    self.post_live(content)
+                else:
+                    self.post_content(content, wrap_code=True)
+            elif kind == "stderr":
+                self.post_content(f"[STDERR]\n{content}")
+            else:
+                self.post_content(content, wrap_code=False)
 
     def flush(self):
-        """バッファの内容をフラッシュ"""
+        """バッファの内容を送信キューに移す（ネットワーク呼び出しはしない）"""
         stdout_payload = ""
         stderr_payload = ""
-        is_final_output = False
 
+        started = time.time()
         with self.buffer_lock:
             if self.output_buffer:
                 stdout_payload = "".join(self.output_buffer)
@@ -82,18 +177,22 @@ class OutputBuffer:
                 stderr_payload = "".join(self.stderr_buffer)
                 self.stderr_buffer.clear()
             self.buffered_len[0] = 0
-            is_final_output = self.message_stopped[0]
+            self.policy.on_flush(time.time())
+
+        logging.info("flush: message_stopped=%s", self.message_stopped[0])
 
-        logging.info("flush: is_final_output=%s, message_stopped=%s", is_final_output, self.message_stopped[0])
+        if not (stdout_payload or stderr_payload):
+            return
 
-        if stdout_payload:
-            self.post_content(stdout_payload, wrap_code=not is_final_output)
-        if stderr_payload:
-            self.post_content(f"[STDERR]\n{stderr_payload}")
+        # バッファに残るのは途中経過のみ（最終出力は append_stdout で直接キューに積む）
+        with tracing.start_span("output.flush", parent=self.trace_parent, start_time=started,
+                                output_stdout_chars=len(stdout_payload), output_stderr_chars=len(stderr_payload)):
+            self.sender.submit("output", stdout_payload, droppable=True)
+            self.sender.submit("stderr", stderr_payload)
 
     def append_stdout(self, line: str):
         """標準出力をバッファに追加"""
-        logging.info("append_stdout called with: %s", line[:100])
+        logging.debug("append_stdout called with: %.100s", line)
 
         # 最終出力の場合
         if self.message_stopped[0]:
@@ -101,9 +200,9 @@ class OutputBuffer:
             if self.enable_streaming:
                 self.flush()
                 # 区切り線を投稿
-                self.post_content("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n**最終出力**\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
+                self.sender.submit("separator", FINAL_SEPARATOR)
             # 最終出力を```なしで投稿
-            self.post_content(line, wrap_code=False)
+            self.sender.submit("final", line)
             return
 
         # ストリーミング無効時は中間出力を無視
@@ -115,20 +214,13 @@ class OutputBuffer:
         with self.buffer_lock:
             self.output_buffer.append(line)
             self.buffered_len[0] += len(line)
-            # 初回は last_post_time を設定
-            if self.last_post_time[0] == 0:
-                self.last_post_time[0] = now
-            logging.info("Buffer size: %d, time since last post: %.2f",
-                        self.buffered_len[0], now - self.last_post_time[0])
-
-            # ツール実行メッセージ（⏺で始まる）は即座にフラッシュ
-            if "⏺" in line:
-                flush = True
-                self.last_post_time[0] = now
-            # FLUSH_INTERVAL秒ごと、または3900文字以上でフラッシュ
-            elif (now - self.last_post_time[0] >= FLUSH_INTERVAL) or (self.buffered_len[0] >= 3900):
+            deadline = self.policy.on_append(line, self.buffered_len[0], now)
+            logging.debug("Buffer size: %d, flush in: %.2f", self.buffered_len[0], deadline - now)
+            # 期限切れならこの場でフラッシュ、そうでなければフラッシャーに期限を知らせる
+            if deadline <= now:
                 flush = True
-                self.last_post_time[0] = now
+            else:
+                self.flush_cond.notify()
 
         if flush:
             logging.info("Flushing buffer...")
@@ -140,66 +232,75 @@ class OutputBuffer:
         now = time.time()
         with self.buffer_lock:
             self.stderr_buffer.append(line)
-            # stderr はFLUSH_INTERVALで優先フラッシュ
-            if (now - self.last_post_time[0] >= FLUSH_INTERVAL):
+            deadline = self.policy.on_append(line, self.buffered_len[0], now)
+            if deadline <= now:
                 flush = True
-                self.last_post_time[0] = now
+            else:
+                self.flush_cond.notify()
         if flush:
             self.flush()
 
     def start_auto_flusher(self):
-        """自動フラッシュスレッドを開始"""
+        """自動フラッシュスレッドを開始（次の期限まで条件変数で待機）"""
         def auto_flusher():
-            while not self.stop_flusher[0]:
-                time.sleep(0.5)
-                if self.stop_flusher[0]:
-                    break
-
-                now = time.time()
-                should_flush = False
-
-                # ストリーミング無効時はPROGRESS_INTERVAL秒ごとに進捗メッセージを送信
-                if not self.enable_streaming:
-                    if now - self.last_progress_time[0] >= PROGRESS_INTERVAL:
-                        elapsed_seconds = int(now - self.start_time)
-                        elapsed_minutes = elapsed_seconds // 60
-                        elapsed_secs = elapsed_seconds % 60
-                        elapsed_str = f"{elapsed_minutes}分{elapsed_secs}秒" if elapsed_minutes > 0 else f"{elapsed_secs}秒"
-                        try:
-                            self.client.chat_postMessage(
-                                channel=self.channel,
-                                thread_ts=self.thread_ts,
-                                text=f"実行中...（経過時間: {elapsed_str}）"
-                            )
-                            self.last_progress_time[0] = now
-                        except Exception as e:
-                            logging.error("Failed to post progress message: %s", e)
-
-                # ストリーミング有効時のみバッファをチェック
-                if self.enable_streaming:
-                    with self.buffer_lock:
-                        # データがあり、かつFLUSH_INTERVAL以上経過している場合
-                        if (self.output_buffer or self.stderr_buffer) and self.last_post_time[0] > 0:
-                            if now - self.last_post_time[0] >= FLUSH_INTERVAL:
-                                should_flush = True
-                                self.last_post_time[0] = now
-                    if should_flush:
-                        logging.info("Auto-flushing buffer...")
-                        self.flush()
+            while True:
+                with self.flush_cond:
+                    if self.stop_flusher[0]:
+                        break
+                    now = time.time()
+                    wake_times = []
+                    if (self.output_buffer or self.stderr_buffer) and self.policy.deadline is not None:
+                        wake_times.append(self.policy.deadline)
+                    # ストリーミング無効時はPROGRESS_INTERVAL秒ごとに進捗メッセージを送信
+                    if not self.enable_streaming:
+                        wake_times.append(self.last_progress_time[0] + PROGRESS_INTERVAL)
+                    wake_at = min(wake_times) if wake_times else None
+                    if wake_at is None or wake_at > now:
+                        self.flush_cond.wait(None if wake_at is None else wake_at - now)
+                        continue
+                    should_flush = (self.output_buffer or self.stderr_buffer) and self.policy.deadline <= now
+
+                if not self.enable_streaming and now - self.last_progress_time[0] >= PROGRESS_INTERVAL:
+                    elapsed_seconds = int(now - self.start_time)
+                    elapsed_minutes = elapsed_seconds // 60
+                    elapsed_secs = elapsed_seconds % 60
+                    elapsed_str = f"{elapsed_minutes}分{elapsed_secs}秒" if elapsed_minutes > 0 else f"{elapsed_secs}秒"
+                    self.sender.submit("progress", f"実行中...（経過時間: {elapsed_str}）")
+                    self.last_progress_time[0] = now
+
+                if should_flush:
+                    logging.info("Auto-flushing buffer...")
+                    self.flush()
 
         self.flusher_thread = threading.Thread(target=auto_flusher, daemon=True)
         self.flusher_thread.start()
         return self.flusher_thread
 
     def stop_auto_flusher(self):
-        """自動フラッシュスレッドを停止"""
-        self.stop_flusher[0] = True
+        """自動フラッシュスレッドを停止（終了を待ち、以降は送信キューに追加されないようにする）"""
+        with self.flush_cond:
+            self.stop_flusher[0] = True
+            self.flush_cond.notify_all()
         if hasattr(self, 'flusher_thread'):
-            self.flusher_thread.join(timeout=1)
+            # フラッシュは送信キューに積むだけなので、ここで待ちきれないのは異常
+            self.flusher_thread.join(timeout=5)
+            if self.flusher_thread.is_alive():
+                logging.warning("auto flusher did not stop within 5s")
 
     def clear(self):
-        """バッファをクリア"""
+        """バッファと送信待ちの途中経過をクリア"""
         with self.buffer_lock:
             self.output_buffer.clear()
             self.stderr_buffer.clear()
             self.buffered_len[0] = 0
+        self.sender.discard()
+
+    def close(self, timeout: float | None = None):
+        """
+        残りのバッファを送信キューに移し、送信スレッドが送り切るまで待つ
+
+        Args:
+            timeout: 待機する最大秒数（Noneなら無制限）
+        """
+        self.flush()
+        self.sender.close(timeout)
@@ -0,0 +1,122 @@
+"""
+重複イベント除外モジュール
+Slackは応答の遅れや再接続で同じイベントを再送することがあるため、処理済みのイベントを一定時間覚えておき、
+1つのメンションにつきClaude CLIの実行が1回になるようにする
+"""
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from . import metrics
+
+
+def event_keys(body: dict) -> list:
+    """
+    イベントを識別するキーの一覧（どれか1つでも処理済みなら重複とみなす）
+
+    Args:
+        body: Slackのイベントペイロード全体
+
+    Returns:
+        ["event:<event_id>", "msg:<client_msg_id>", "ts:<channel>:<ts>"] のうち取得できたもの
+    """
+    event = body.get("event", {})
+    keys = []
+    if body.get("event_id"):
+        keys.append(f"event:{body['event_id']}")
+    if event.get("client_msg_id"):
+        keys.append(f"msg:{event['client_msg_id']}")
+    if event.get("channel") and event.get("ts"):
+        keys.append(f"ts:{event['channel']}:{event['ts']}")
+    return keys
+
+
+class EventDeduplicator:
+    """処理済みイベントのキーを有効期限付きで保持するクラス"""
+
+    def __init__(self, ttl: float = 3600.0, path: str | None = None, max_entries: int = 10000):
+        """
+        Args:
+            ttl: 処理済みとして覚えておく秒数
+            path: 永続化するSQLiteファイルのパス（Noneならメモリ上のみ。複数のボットプロセスで同じファイルを使えば共有される）
+            max_entries: メモリ上に保持するキーの上限（超えた分は古い順に削除）
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._seen = OrderedDict()  # key -> 記録した時刻
+        self._conn = None
+        self._last_purge = 0.0
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS seen_events (key TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+
+    def first_seen(self, body: dict) -> bool:
+        """
+        イベントを処理済みとして記録し、初めて見たものかを返す（確認と記録は不可分）
+
+        Args:
+            body: Slackのイベントペイロード全体
+
+        Returns:
+            初めてならTrue、再送された重複ならFalse
+        """
+        keys = event_keys(body)
+        if not keys:
+            return True
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            duplicate = any(key in self._seen for key in keys)
+            if not duplicate and self._conn is not None:
+                duplicate = self._claim_persistent(keys, now)
+            for key in keys:
+                self._seen[key] = now
+                self._seen.move_to_end(key)
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+        if duplicate:
+            logging.info("Skipping duplicate event: %s", keys[0])
+            metrics.EVENTS_DUPLICATE.inc()
+        return not duplicate
+
+    def _claim_persistent(self, keys: list, now: float) -> bool:
+        """SQLiteに記録（他のプロセスや再起動前に記録済みのキーがあれば重複）"""
+        try:
+            # 確認と記録の間に他のプロセスが同じイベントを記録しないよう、書き込みロックを取ってから確認する
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cur = self._conn.execute(
+                    f"SELECT 1 FROM seen_events WHERE key IN ({','.join('?' * len(keys))}) AND seen_at > ?",
+                    (*keys, now - self.ttl),
+                )
+                if cur.fetchone() is not None:
+                    self._conn.execute("ROLLBACK")
+                    return True
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO seen_events (key, seen_at) VALUES (?, ?)", [(key, now) for key in keys]
+                )
+                # 期限切れの記録はときどきまとめて削除
+                if now - self._last_purge > 60:
+                    self._conn.execute("DELETE FROM seen_events WHERE seen_at <= ?", (now - self.ttl,))
+                    self._last_purge = now
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            # 記録に失敗しても依頼は処理する（メモリ上の記録で同じプロセス内の重複は防げる）
+            logging.warning("Failed to record event in dedupe store: %s", e)
+        return False
+
+    def _expire(self, now: float):
+        """有効期限の切れたキーをメモリから削除"""
+        while self._seen:
+            key, seen_at = next(iter(self._seen.items()))
+            if now - seen_at <= self.ttl:
+                break
+            self._seen.popitem(last=False)
@@ -0,0 +1,129 @@
+"""
+フラッシュポリシーモジュール
+出力バッファをいつSlackへ送るかを決める（OutputBufferから差し替え可能）
+"""
+from abc import ABC, abstractmethod
+
+# バッファがこの文字数を超えたら待たずにフラッシュ
+MAX_BUFFERED_CHARS = 3900
+
+# AdaptiveFlushPolicy の調整パラメータ
+TOOL_BATCH_WINDOW = 0.3  # 連続するツール開始行をまとめる待ち時間（秒）
+LATENCY_FACTOR = 4.0  # 投稿レイテンシの何倍をフラッシュ間隔の下限にするか
+LATENCY_SMOOTHING = 0.3  # レイテンシ移動平均の重み
+MAX_INTERVAL = 10.0  # フラッシュ間隔の上限（秒）
+
+
+class FlushPolicy(ABC):
+    """フラッシュポリシーの基底クラス"""
+
+    def __init__(self, interval: float, min_gap: float = 0.0):
+        """
+        Args:
+            interval: 通常のフラッシュ間隔（秒）
+            min_gap: フラッシュ同士の最小間隔（秒）。即時フラッシュもこの間隔で間引く
+        """
+        self.interval = interval
+        self.min_gap = min_gap
+        self.last_flush = 0.0
+        self.deadline = None
+
+    def on_append(self, line: str, buffered_len: int, now: float) -> float:
+        """
+        バッファへの追加を通知し、次にフラッシュすべき時刻を返す
+
+        Args:
+            line: 追加された文字列
+            buffered_len: 追加後のバッファ文字数
+            now: 現在時刻
+
+        Returns:
+            フラッシュ期限（この時刻以前ならすぐにフラッシュする）
+        """
+        if self.last_flush == 0:
+            self.last_flush = now
+        deadline = max(self._next_deadline(line, buffered_len, now), self.last_flush + self.min_gap)
+        if self.deadline is None or deadline < self.deadline:
+            self.deadline = deadline
+        return self.deadline
+
+    def on_flush(self, now: float):
+        """フラッシュしたことを通知"""
+        self.last_flush = now
+        self.deadline = None
+
+    def observe(self, latency: float, headroom: float = 1.0):
+        """
+        Slackへの投稿結果を通知
+
+        Args:
+            latency: API呼び出しにかかった秒数（レート制限待ちを含む）
+            headroom: レートリミッターの残り容量（0.0〜1.0）
+        """
+
+    @abstractmethod
+    def _next_deadline(self, line: str, buffered_len: int, now: float) -> float:
+        """追加された行に対するフラッシュ期限（サブクラスで実装）"""
+        pass
+
+
+class FixedFlushPolicy(FlushPolicy):
+    """固定ルール: ツール開始行か一定サイズで即時、それ以外は一定間隔でフラッシュ"""
+
+    def _next_deadline(self, line, buffered_len, now):
+        if "⏺" in line or buffered_len >= MAX_BUFFERED_CHARS:
+            return now
+        return self.last_flush + self.interval
+
+
+class AdaptiveFlushPolicy(FlushPolicy):
+    """
+    Slackの応答速度とレート制限の余裕に合わせて間隔を伸縮するポリシー
+    連続するツール開始行は短い待ち時間でまとめて1回の投稿にする
+    """
+
+    def __init__(self, interval: float, min_gap: float = 0.0):
+        super().__init__(interval, min_gap)
+        self.latency = 0.0
+        self.current_interval = interval
+
+    def observe(self, latency, headroom=1.0):
+        self.latency += (latency - self.latency) * LATENCY_SMOOTHING
+        target = max(self.interval, self.latency * LATENCY_FACTOR)
+        # 残り容量が半分を切ったら間隔を伸ばす（容量ゼロで3倍）
+        if headroom < 0.5:
+            target *= 1.0 + (0.5 - max(headroom, 0.0)) * 4.0
+        self.current_interval = min(MAX_INTERVAL, target)
+
+    def _next_deadline(self, line, buffered_len, now):
+        if buffered_len >= MAX_BUFFERED_CHARS:
+            return now
+        regular = self.last_flush + self.current_interval
+        if "⏺" in line:
+            # 既に期限が近ければそれに相乗りし、後続のツール開始行を待つ
+            return min(regular, now + TOOL_BATCH_WINDOW)
+        return regular
+
+
+FLUSH_POLICIES = {
+    "fixed": FixedFlushPolicy,
+    "adaptive": AdaptiveFlushPolicy,
+}
+
+
+def create_flush_policy(name: str, interval: float, min_gap: float = 0.0) -> FlushPolicy:
+    """
+    名前からフラッシュポリシーを作成
+
+    Args:
+        name: ポリシー名（"fixed" または "adaptive"）
+        interval: 通常のフラッシュ間隔（秒）
+        min_gap: フラッシュ同士の最小間隔（秒）
+
+    Returns:
+        FlushPolicy
+    """
+    try:
+        return FLUSH_POLICIES[name](interval, min_gap)
+    except KeyError:
+        raise ValueError(f"Unsupported flush policy: {name}")
@@ -3,12 +3,14 @@
 Slackスレッドから会話履歴を取得・フォーマット
 """
 import re
+import time
 import logging
 
 from ..config import MAX_HISTORY_MESSAGES
+from . import metrics
 
 
-def get_thread_history(client, channel, thread_ts, bot_user_id):
+def get_thread_history(client, channel, thread_ts, bot_user_id, store=None):
     """
     Slackスレッドから会話履歴を取得
 
@@ -17,20 +19,26 @@ def get_thread_history(client, channel, thread_ts, bot_user_id):
         channel: チャンネルID
         thread_ts: スレッドID
         bot_user_id: ボットのユーザーID
+        store: 会話履歴キャッシュ（指定時は前回同期以降の差分のみSlackから取得）
 
     Returns:
         list: [(role, content), ...] のタプルリスト
               role: 'user' または 'assistant'
     """
     try:
-        # スレッドの全メッセージを取得
-        response = client.conversations_replies(
-            channel=channel,
-            ts=thread_ts,
-            limit=100  # 十分な数を取得
-        )
-
-        messages = response.get("messages", [])
+        started = time.monotonic()
+        if store is not None:
+            messages = store.sync(client, channel, thread_ts)
+        else:
+            # スレッドの全メッセージを取得
+            response = client.conversations_replies(
+                channel=channel,
+                ts=thread_ts,
+                limit=100  # 十分な数を取得
+            )
+            messages = response.get("messages", [])
+        metrics.HISTORY_FETCH.labels("cache" if store is not None else "api").observe(time.monotonic() - started)
+
         if not messages:
             return []
 
@@ -152,3 +160,26 @@ def format_history_for_prompt(history):
     formatted_lines.append("")
 
     return "\n".join(formatted_lines)
+
+
+def format_followups_for_prompt(prompts):
+    """
+    待機中にまとめられた同じスレッドの依頼を1つのプロンプトにする
+
+    Args:
+        prompts: 依頼文字列のリスト（古い順）
+
+    Returns:
+        str: まとめたプロンプト（1件ならそのまま）
+    """
+    if len(prompts) == 1:
+        return prompts[0]
+
+    formatted_lines = ["以下は同じスレッドで続けて送られた依頼です。順番にすべて対応してください。"]
+    formatted_lines.append("")
+
+    for i, prompt in enumerate(prompts, start=1):
+        formatted_lines.append(f"{i}. {prompt}")
+        formatted_lines.append("")
+
+    return "\n".join(formatted_lines).rstrip()
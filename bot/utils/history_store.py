@@ -0,0 +1,173 @@
+"""
+会話履歴キャッシュモジュール
+スレッドのメッセージをSQLiteに保存し、Slackからは前回同期以降の差分だけを取得する
+"""
+import time
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+
+# conversations.replies の1ページあたりの取得件数
+PAGE_LIMIT = 200
+
+
+class HistoryStore:
+    """スレッド単位の会話履歴を保持する永続キャッシュ"""
+
+    def __init__(self, path: str, max_threads: int = 500):
+        """
+        Args:
+            path: SQLiteファイルのパス
+            max_threads: 保持するスレッド数の上限（超えた分は最終アクセスが古い順に削除）
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_threads = max_threads
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                channel TEXT NOT NULL,
+                thread_ts TEXT NOT NULL,
+                ts TEXT NOT NULL,
+                user TEXT,
+                bot_id TEXT,
+                text TEXT,
+                PRIMARY KEY (channel, ts)
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_thread ON messages (channel, thread_ts, ts);
+            CREATE TABLE IF NOT EXISTS threads (
+                channel TEXT NOT NULL,
+                thread_ts TEXT NOT NULL,
+                synced_ts TEXT,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (channel, thread_ts)
+            );
+            """
+        )
+        self._conn.commit()
+
+    def record_message(self, channel: str, thread_ts: str, msg: dict, synced: bool = False):
+        """
+        イベントや自身の投稿から得たメッセージを保存
+
+        Args:
+            channel: チャンネルID
+            thread_ts: スレッドID
+            msg: Slackのメッセージ辞書（ts, user, bot_id, text）
+            synced: このメッセージまでスレッド全体を把握済みとして扱うか
+                   （スレッドを開始した最初のメンションなど）
+        """
+        ts = msg.get("ts")
+        if not ts:
+            return
+        with self._lock:
+            self._upsert(channel, thread_ts, [msg])
+            if synced:
+                self._set_synced(channel, thread_ts, ts)
+            self._conn.commit()
+
+    def sync(self, client, channel: str, thread_ts: str) -> list:
+        """
+        Slackと差分同期し、スレッドの全メッセージを返す
+
+        Args:
+            client: Slack WebClient
+            channel: チャンネルID
+            thread_ts: スレッドID
+
+        Returns:
+            list: ts昇順のメッセージ辞書リスト
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT synced_ts FROM threads WHERE channel = ? AND thread_ts = ?",
+                (channel, thread_ts),
+            ).fetchone()
+        synced_ts = row[0] if row else None
+
+        # 前回同期したts以降だけを取得（初回はスレッド全体）
+        fetched = []
+        cursor = None
+        while True:
+            kwargs = {"channel": channel, "ts": thread_ts, "limit": PAGE_LIMIT}
+            if synced_ts:
+                kwargs["oldest"] = synced_ts
+                kwargs["inclusive"] = False
+            if cursor:
+                kwargs["cursor"] = cursor
+            response = client.conversations_replies(**kwargs)
+            fetched.extend(response.get("messages", []))
+            cursor = (response.get("response_metadata") or {}).get("next_cursor")
+            if not cursor:
+                break
+        logging.info("History sync: channel=%s thread=%s since=%s fetched=%d",
+                     channel, thread_ts, synced_ts, len(fetched))
+
+        with self._lock:
+            self._upsert(channel, thread_ts, fetched)
+            latest = max((m["ts"] for m in fetched if m.get("ts")), key=float, default=synced_ts)
+            if latest:
+                self._set_synced(channel, thread_ts, latest)
+            self._conn.commit()
+            return self._messages(channel, thread_ts)
+
+    def messages(self, channel: str, thread_ts: str) -> list:
+        """
+        保存済みのメッセージをSlackに問い合わせずに返す
+
+        Returns:
+            list: ts昇順のメッセージ辞書リスト
+        """
+        with self._lock:
+            return self._messages(channel, thread_ts)
+
+    def _messages(self, channel, thread_ts):
+        rows = self._conn.execute(
+            "SELECT ts, user, bot_id, text FROM messages"
+            " WHERE channel = ? AND thread_ts = ? ORDER BY CAST(ts AS REAL)",
+            (channel, thread_ts),
+        ).fetchall()
+        self._touch(channel, thread_ts)
+        self._conn.commit()
+        return [
+            {"ts": ts, "user": user, "bot_id": bot_id, "text": text or ""}
+            for ts, user, bot_id, text in rows
+        ]
+
+    def _upsert(self, channel, thread_ts, messages):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO messages (channel, thread_ts, ts, user, bot_id, text)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (channel, thread_ts, m["ts"], m.get("user"), m.get("bot_id"), m.get("text", ""))
+                for m in messages if m.get("ts")
+            ],
+        )
+        self._touch(channel, thread_ts)
+
+    def _set_synced(self, channel, thread_ts, ts):
+        self._conn.execute(
+            "UPDATE threads SET synced_ts = ? WHERE channel = ? AND thread_ts = ?"
+            " AND (synced_ts IS NULL OR CAST(synced_ts AS REAL) < CAST(? AS REAL))",
+            (ts, channel, thread_ts, ts),
+        )
+
+    def _touch(self, channel, thread_ts):
+        """最終アクセス時刻を更新し、上限を超えたスレッドを古い順に削除（LRU）"""
+        self._conn.execute(
+            "INSERT INTO threads (channel, thread_ts, last_access) VALUES (?, ?, ?)"
+            " ON CONFLICT (channel, thread_ts) DO UPDATE SET last_access = excluded.last_access",
+            (channel, thread_ts, time.time()),
+        )
+        cold = self._conn.execute(
+            "SELECT channel, thread_ts FROM threads ORDER BY last_access DESC LIMIT -1 OFFSET ?",
+            (self.max_threads,),
+        ).fetchall()
+        for c, t in cold:
+            self._conn.execute("DELETE FROM messages WHERE channel = ? AND thread_ts = ?", (c, t))
+            self._conn.execute("DELETE FROM threads WHERE channel = ? AND thread_ts = ?", (c, t))
+        if cold:
+            logging.info("History cache evicted %d thread(s)", len(cold))
@@ -0,0 +1,80 @@
+"""
+ボット情報キャッシュモジュール
+auth.test の結果を起動時に取得して使い回し、リクエストごとのAPI呼び出しを省く
+"""
+import time
+import logging
+import threading
+
+from . import tracing
+
+# キャッシュの有効期間（秒）。トークンのローテーションに追従するため定期的に取り直す
+IDENTITY_TTL = 3600.0
+
+
+class BotIdentity:
+    """ボット自身のユーザーID・ボットID・ワークスペース情報を保持するクラス"""
+
+    def __init__(self, client, ttl: float = IDENTITY_TTL):
+        """
+        Args:
+            client: Slack WebClient
+            ttl: キャッシュの有効期間（秒）
+        """
+        self.client = client
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._info = {}
+        self._fetched_at = 0.0
+
+    def warmup(self):
+        """起動時にボット情報を取得してキャッシュする"""
+        info = self._refresh()
+        if info:
+            logging.info("Bot identity: user_id=%s bot_id=%s team=%s (%s)",
+                         info.get("user_id"), info.get("bot_id"),
+                         info.get("team"), info.get("team_id"))
+
+    def invalidate(self):
+        """キャッシュを無効化し、次回アクセス時に取り直す（トークン更新時・認証エラー時）"""
+        with self._lock:
+            self._fetched_at = 0.0
+
+    @property
+    def user_id(self) -> str | None:
+        """ボットのユーザーID"""
+        return self._get().get("user_id")
+
+    @property
+    def bot_id(self) -> str | None:
+        """ボットID"""
+        return self._get().get("bot_id")
+
+    @property
+    def team_id(self) -> str | None:
+        """ワークスペースID"""
+        return self._get().get("team_id")
+
+    def _get(self) -> dict:
+        """有効期限内ならキャッシュを返し、切れていれば取り直す"""
+        with self._lock:
+            if self._info and time.time() - self._fetched_at < self.ttl:
+                return self._info
+        return self._refresh() or self._info
+
+    def _refresh(self) -> dict | None:
+        """auth.test を呼んでキャッシュを更新（失敗時は古い値を使い続ける）"""
+        try:
+            with tracing.start_span("slack.auth_test"):
+                response = self.client.auth_test()
+        except Exception as e:
+            logging.error("auth.test failed, keeping cached identity: %s", e)
+            return None
+        info = {
+            key: response.get(key)
+            for key in ("user_id", "bot_id", "team_id", "team", "url")
+        }
+        with self._lock:
+            self._info = info
+            self._fetched_at = time.time()
+        return info
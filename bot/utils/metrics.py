@@ -0,0 +1,311 @@
+"""
+メトリクスモジュール
+カウンター・ゲージ・ヒストグラムを集計し、Prometheusのテキスト形式でHTTP公開する
+"""
+import bisect
+from abc import ABC, abstractmethod
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ヒストグラムの既定のバケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    """メトリクスの基底クラス（ラベル値ごとに子を持つ）"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def labels(self, *values):
+        """ラベル値に対応する子を取得（なければ作成）"""
+        values = tuple(str(v) for v in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {values}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """ラベル値ごとの子を作成（サブクラスで実装）"""
+        pass
+
+    def _default(self):
+        return self._children[()]
+
+    def collect(self) -> list:
+        """公開用のテキスト行を返す"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            lines.extend(child.samples(self.name, self.labelnames, values))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def samples(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self._value)}"]
+
+
+class Counter(_Metric):
+    """単調増加するカウンター"""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+
+class _GaugeChild:
+    def __init__(self):
+        self._value = 0.0
+        self._func = None
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set_function(self, func):
+        """値を収集時に関数から取得する"""
+        self._func = func
+
+    def samples(self, name, labelnames, values):
+        value = self._value
+        if self._func is not None:
+            try:
+                value = self._func()
+            except Exception as e:
+                logging.warning("Gauge %s callback failed: %s", name, e)
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(value)}"]
+
+
+class Gauge(_Metric):
+    """増減する値（または収集時に関数で求める値）"""
+
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default().dec(amount)
+
+    def set_function(self, func):
+        self._default().set_function(func)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def samples(self, name, labelnames, values):
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self._buckets + (float("inf"),), counts):
+            cumulative += count
+            labels = _format_labels(labelnames + ("le",), values + (_format_value(bound),))
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        labels = _format_labels(labelnames, values)
+        lines.append(f"{name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+        return lines
+
+
+class Histogram(_Metric):
+    """値の分布（バケットごとの件数・合計・件数）"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+
+class Registry:
+    """メトリクスの登録先"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        """メトリクスを登録（同名があれば既存のものを返す）"""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def expose(self) -> str:
+        """Prometheusのテキスト形式で全メトリクスを出力"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+    """カウンターを作成してREGISTRYに登録"""
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+    """ゲージを作成してREGISTRYに登録"""
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+    """ヒストグラムを作成してREGISTRYに登録"""
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# ボット全体で使うメトリクス
+JOBS_SUBMITTED = counter("claude_jobs_submitted_total", "Jobs submitted to the scheduler", ("scheduler",))
+JOBS_REJECTED = counter("claude_jobs_rejected_total", "Jobs rejected because the queue was full", ("scheduler",))
+JOBS_STARTED = counter("claude_jobs_started_total", "Jobs started by a worker", ("scheduler",))
+JOBS_FINISHED = counter("claude_jobs_finished_total", "Jobs finished, by outcome", ("scheduler", "outcome"))
+JOBS_RUNNING = gauge("claude_jobs_running", "Jobs currently running", ("scheduler",))
+JOBS_QUEUED = gauge("claude_jobs_queued", "Jobs waiting in the queue", ("scheduler",))
+JOB_QUEUE_WAIT = histogram("claude_job_queue_wait_seconds", "Time a job spent waiting in the queue", ("scheduler",))
+JOB_DURATION = histogram("claude_job_duration_seconds", "Total job duration from start to final message", ("scheduler",))
+
+CLI_TIME_TO_FIRST_TOKEN = histogram(
+    "claude_cli_time_to_first_token_seconds", "Time from CLI process start to the first stdout event")
+CLI_EXIT = counter("claude_cli_exit_total", "CLI processes exited, by exit code", ("code",))
+CLI_EVENTS = counter("claude_cli_events_total", "stream-json events parsed by EventHandler", ("type",))
+CLI_MAX_RSS = histogram(
+    "claude_cli_max_rss_bytes", "Peak resident memory of a CLI run",
+    buckets=tuple(mb * 1024 * 1024 for mb in (64, 128, 256, 512, 1024, 2048, 4096, 8192)))
+CLI_CPU_SECONDS = histogram("claude_cli_cpu_seconds", "CPU time (user + system) used by a CLI run")
+CLI_TIMEOUTS = counter("claude_cli_timeouts_total", "CLI runs killed for exceeding CLAUDE_TIMEOUT")
+EVENTS_DUPLICATE = counter("slack_events_duplicate_total", "app_mention events skipped as Slack redeliveries")
+ACTIVE_PROCESSES = gauge("claude_active_processes", "Claude CLI processes currently running")
+POOL_ACQUIRE = counter("claude_pool_acquire_total", "Warm process requests, by result (hit/miss)", ("result",))
+POOL_IDLE = gauge("claude_pool_idle_processes", "Warm Claude CLI processes waiting for a prompt")
+RESULT_CACHE = counter(
+    "claude_result_cache_total", "Result cache lookups, by result (hit/shared/miss/timeout)", ("result",)
+)
+
+SLACK_CALLS = counter("slack_api_calls_total", "Slack Web API calls, by method and result", ("method", "status"))
+SLACK_LATENCY = histogram("slack_api_latency_seconds", "Slack Web API call latency (excluding rate-limit waits)",
+                          ("method",))
+SLACK_RATE_LIMIT_WAIT = histogram("slack_rate_limit_wait_seconds", "Time spent waiting for the local rate limiter",
+                                  ("method",))
+HISTORY_FETCH = histogram("slack_history_fetch_seconds", "Thread history fetch latency", ("source",))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.expose().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug("metrics: " + format, *args)
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer | None:
+    """
+    メトリクス公開用のHTTPサーバーをバックグラウンドで起動
+
+    Args:
+        port: 待ち受けポート（0なら起動しない）
+        host: 待ち受けアドレス
+
+    Returns:
+        起動したサーバー、起動しなかった・できなかった場合はNone
+    """
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        # メトリクスが取れなくてもボット自体は動かす
+        logging.error("Failed to start metrics server on %s:%d: %s", host, port, e)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logging.info("Metrics server listening on http://%s:%d/metrics", host, port)
+    return server
+
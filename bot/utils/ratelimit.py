@@ -0,0 +1,282 @@
+"""
+Slack Web APIのレート制限モジュール
+メソッド（chat.postMessageはチャンネル）単位のトークンバケットで呼び出しを調整し、
+429はRetry-Afterに従って、通信エラー・5xxは指数バックオフで再試行する
+"""
+import time
+import random
+import asyncio
+import logging
+import threading
+
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
+
+from . import metrics
+
+# Tier別の上限（1分あたりの呼び出し回数）
+TIER_PER_MINUTE = {1: 1, 2: 20, 3: 50, 4: 100}
+
+# メソッドごとのTier（記載のないメソッドはTier 3として扱う）
+METHOD_TIERS = {
+    "auth.test": 4,
+    "chat.update": 3,
+    "chat.delete": 3,
+    "conversations.replies": 3,
+    "conversations.info": 3,
+    "files.getUploadURLExternal": 4,
+    "files.completeUploadExternal": 4,
+    "files.info": 4,
+    "users.info": 4,
+}
+DEFAULT_TIER = 3
+
+# chat.postMessage はチャンネルごとに1秒1件（短いバーストは許容される）
+POST_MESSAGE_RATE = 1.0
+POST_MESSAGE_BURST = 3
+
+# 再試行設定
+MAX_RETRIES = 3
+BACKOFF_BASE = 1.0  # 秒
+BACKOFF_MAX = 30.0  # 秒
+
+# トークンの失効・ローテーションを示すエラー（キャッシュしたボット情報を取り直す）
+AUTH_ERRORS = {"invalid_auth", "token_revoked", "token_expired", "account_inactive"}
+
+
+class TokenBucket:
+    """トークンバケット（先着順に待ち時間を予約する）"""
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate: 1秒あたりに補充されるトークン数
+            capacity: バケットの容量（許容するバースト数）
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # Retry-After を受けてから呼び出しを止める期限（予約済みの呼び出しも送信前に確認する）
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        トークンを1つ予約
+
+        Returns:
+            呼び出しまでに待つべき秒数
+        """
+        with self._lock:
+            self._refill()
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def headroom(self) -> float:
+        """残り容量の割合（0.0〜1.0、待ち行列があれば0.0）"""
+        with self._lock:
+            self._refill()
+            return max(0.0, self.tokens / self.capacity)
+
+    def pause(self, seconds: float):
+        """Retry-After を受けたとき、指定秒数は呼び出しを通さない"""
+        with self._lock:
+            self._refill()
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            # 拒否された呼び出しの予約分は返却し、その上で指定秒数ぶんの負債を積む
+            self.tokens = min(self.tokens, 0) + 1 - seconds * self.rate
+
+    def paused_for(self) -> float:
+        """
+        一時停止の残り秒数（予約した待ち時間のあとに429を受けていれば、送信前にさらに待つ）
+
+        Returns:
+            待つべき秒数（停止中でなければ0.0）
+        """
+        with self._lock:
+            return max(0.0, self.paused_until - time.monotonic())
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class RateLimiter:
+    """メソッド・チャンネル単位のトークンバケットを管理するクラス"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, method: str, channel: str | None = None) -> TokenBucket:
+        """呼び出しに対応するバケットを取得（なければ作成）"""
+        if method == "chat.postMessage":
+            key = (method, channel)
+            rate, capacity = POST_MESSAGE_RATE, POST_MESSAGE_BURST
+        else:
+            key = (method, None)
+            per_minute = TIER_PER_MINUTE[METHOD_TIERS.get(method, DEFAULT_TIER)]
+            rate, capacity = per_minute / 60.0, max(1, per_minute // 10)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(rate, capacity)
+            return bucket
+
+
+def _channel_of(kwargs: dict) -> str | None:
+    """api_call の引数からチャンネルIDを取り出す"""
+    for name in ("json", "params", "data"):
+        payload = kwargs.get(name)
+        if isinstance(payload, dict) and payload.get("channel"):
+            return payload["channel"]
+    return None
+
+
+def _retry_after(e: SlackApiError) -> float | None:
+    """429 レスポンスなら Retry-After の秒数を返す"""
+    response = e.response
+    if getattr(response, "status_code", None) != 429:
+        return None
+    headers = {k.lower(): v for k, v in (response.headers or {}).items()}
+    value = headers.get("retry-after", 1)
+    if isinstance(value, list):
+        value = value[0]
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 1.0
+
+
+def _is_transient(e: Exception) -> bool:
+    """再試行すべき一時的なエラーかどうか（通信エラー・5xx）"""
+    if isinstance(e, SlackApiError):
+        return getattr(e.response, "status_code", 0) >= 500
+    return isinstance(e, (OSError, asyncio.TimeoutError))
+
+
+def _is_auth_error(e: Exception) -> bool:
+    """トークンが無効になったことを示すエラーかどうか"""
+    if not isinstance(e, SlackApiError):
+        return False
+    return e.response.get("error") in AUTH_ERRORS
+
+
+def _record_call(api_method: str, status: str, started: float):
+    """呼び出し回数と応答時間をメトリクスに記録"""
+    metrics.SLACK_CALLS.labels(api_method, status).inc()
+    metrics.SLACK_LATENCY.labels(api_method).observe(time.monotonic() - started)
+
+
+def _backoff(attempt: int) -> float:
+    """指数バックオフ（ジッター付き）"""
+    return min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+
+class RateLimitedWebClient(WebClient):
+    """すべての Web API 呼び出しにレート制限と再試行をかける WebClient"""
+
+    def __init__(self, *args, rate_limiter: RateLimiter | None = None, max_retries: int = MAX_RETRIES, **kwargs):
+        """
+        Args:
+            rate_limiter: 共有するレートリミッター（省略時は新規作成）
+            max_retries: 再試行の最大回数
+            その他の引数は WebClient と同じ
+        """
+        super().__init__(*args, **kwargs)
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        # 認証エラー（invalid_auth など）を受けたときに呼ぶ関数（BotIdentity.invalidate など）
+        self.on_auth_error = None
+
+    def api_call(self, api_method: str, **kwargs):
+        bucket = self.rate_limiter.bucket(api_method, _channel_of(kwargs))
+        attempt = 0
+        while True:
+            wait = bucket.reserve()
+            if wait > 0:
+                metrics.SLACK_RATE_LIMIT_WAIT.labels(api_method).observe(wait)
+                time.sleep(wait)
+            # 予約後に他の呼び出しが429を受けていれば、Retry-After の期限まで待ってから送る
+            while (paused := bucket.paused_for()) > 0:
+                metrics.SLACK_RATE_LIMIT_WAIT.labels(api_method).observe(paused)
+                time.sleep(paused)
+            started = time.monotonic()
+            try:
+                response = super().api_call(api_method, **kwargs)
+                _record_call(api_method, "ok", started)
+                return response
+            except Exception as e:
+                retry_after = _retry_after(e) if isinstance(e, SlackApiError) else None
+                _record_call(api_method, "ratelimited" if retry_after is not None else "error", started)
+                if _is_auth_error(e) and self.on_auth_error is not None:
+                    logging.warning("Slack auth error on %s (%s), refreshing bot identity", api_method, e.response.get("error"))
+                    self.on_auth_error()
+                if attempt >= self.max_retries:
+                    raise
+                if retry_after is not None:
+                    logging.warning("Slack rate limited: %s, retry after %.1fs", api_method, retry_after)
+                    bucket.pause(retry_after)
+                elif _is_transient(e):
+                    delay = _backoff(attempt)
+                    logging.warning("Slack API error on %s (%s), retrying in %.1fs", api_method, e, delay)
+                    time.sleep(delay)
+                else:
+                    raise
+                attempt += 1
+
+
+class AsyncRateLimitedWebClient(AsyncWebClient):
+    """すべての Web API 呼び出しにレート制限と再試行をかける AsyncWebClient"""
+
+    def __init__(self, *args, rate_limiter: RateLimiter | None = None, max_retries: int = MAX_RETRIES, **kwargs):
+        """
+        Args:
+            rate_limiter: 共有するレートリミッター（省略時は新規作成）
+            max_retries: 再試行の最大回数
+            その他の引数は AsyncWebClient と同じ
+        """
+        super().__init__(*args, **kwargs)
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        # 認証エラー（invalid_auth など）を受けたときに呼ぶ関数（BotIdentity.invalidate など）
+        self.on_auth_error = None
+
+    async def api_call(self, api_method: str, **kwargs):
+        bucket = self.rate_limiter.bucket(api_method, _channel_of(kwargs))
+        attempt = 0
+        while True:
+            wait = bucket.reserve()
+            if wait > 0:
+                metrics.SLACK_RATE_LIMIT_WAIT.labels(api_method).observe(wait)
+                await asyncio.sleep(wait)
+            # 予約後に他の呼び出しが429を受けていれば、Retry-After の期限まで待ってから送る
+            while (paused := bucket.paused_for()) > 0:
+                metrics.SLACK_RATE_LIMIT_WAIT.labels(api_method).observe(paused)
+                await asyncio.sleep(paused)
+            started = time.monotonic()
+            try:
+                response = await super().api_call(api_method, **kwargs)
+                _record_call(api_method, "ok", started)
+                return response
+            except Exception as e:
+                retry_after = _retry_after(e) if isinstance(e, SlackApiError) else None
+                _record_call(api_method, "ratelimited" if retry_after is not None else "error", started)
+                if _is_auth_error(e) and self.on_auth_error is not None:
+                    logging.warning("Slack auth error on %s (%s), refreshing bot identity", api_method, e.response.get("error"))
+                    self.on_auth_error()
+                if attempt >= self.max_retries:
+                    raise
+                if retry_after is not None:
+                    logging.warning("Slack rate limited: %s, retry after %.1fs", api_method, retry_after)
+                    bucket.pause(retry_after)
+                elif _is_transient(e):
+                    delay = _backoff(attempt)
+                    logging.warning("Slack API error on %s (%s), retrying in %.1fs", api_method, e, delay)
+                    await asyncio.sleep(delay)
+                else:
+                    raise
+                attempt += 1
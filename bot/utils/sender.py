@@ -0,0 +1,135 @@
+"""
+Slack送信モジュール
+Claude CLIの出力を読むスレッドからSlackへの投稿を切り離し、専用スレッドで順番に送る
+Slackが遅れている間は、途中経過を結合・古いものから間引いてメモリ使用量を抑える
+"""
+import logging
+import threading
+from collections import deque
+
+from ..config import SENDER_MAX_PENDING_CHARS
+
+
+class SlackSender:
+    """1ジョブぶんの投稿を専用スレッドで順番に送信するクラス"""
+
+    def __init__(self, send, max_pending_chars: int = SENDER_MAX_PENDING_CHARS, name: str = "slack-sender"):
+        """
+        Args:
+            send: 実際に投稿する関数 send(kind, content)
+            max_pending_chars: 送信待ちの途中経過の上限文字数（超えたら古いものから間引く）
+            name: スレッド名
+        """
+        self.send = send
+        self.max_pending_chars = max_pending_chars
+
+        self._queue = deque()  # [kind, content, droppable]
+        self._cond = threading.Condition()
+        self._pending_chars = 0  # 送信待ちの途中経過の文字数
+        self._omitted = 0  # 間引いた文字数（次の途中経過の先頭で知らせる）
+        self._busy = False
+        self._closed = False
+
+        # メトリクス
+        self.sent = 0
+        self.merged = 0
+        self.dropped_chars = 0
+
+        self._thread = threading.Thread(target=self._worker, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, kind: str, content: str, droppable: bool = False):
+        """
+        投稿を送信キューに積む（ネットワーク呼び出しはしない）
+
+        Args:
+            kind: 投稿の種類（送信関数にそのまま渡す）
+            content: 投稿内容
+            droppable: Slackが遅れているとき間引いてよい途中経過か
+        """
+        if not content:
+            return
+        with self._cond:
+            if self._closed:
+                logging.warning("Sender is closed, dropping %s message", kind)
+                return
+            last = self._queue[-1] if self._queue else None
+            # 送信待ちの同じ種類の投稿があれば1件にまとめる
+            if last is not None and last[0] == kind and last[2] == droppable:
+                last[1] += content
+                self.merged += 1
+            else:
+                self._queue.append([kind, content, droppable])
+            if droppable:
+                self._pending_chars += len(content)
+                self._trim()
+            self._cond.notify()
+
+    def discard(self):
+        """送信待ちの途中経過を破棄（停止時）"""
+        with self._cond:
+            self._queue = deque(item for item in self._queue if not item[2])
+            self._pending_chars = 0
+            self._omitted = 0
+
+    def close(self, timeout: float | None = None):
+        """
+        送信待ちの投稿をすべて送り切ってからスレッドを終了
+
+        Args:
+            timeout: 待機する最大秒数（Noneなら無制限）
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logging.warning("Sender did not drain within %.1fs", timeout)
+
+    def pending(self) -> int:
+        """送信待ちの投稿数（送信中を含む）"""
+        with self._cond:
+            return len(self._queue) + (1 if self._busy else 0)
+
+    def _trim(self):
+        """送信待ちの途中経過が上限を超えたら古いものから間引く（ロック取得済みで呼ぶ）"""
+        for item in self._queue:
+            if self._pending_chars <= self.max_pending_chars:
+                break
+            if not item[2]:
+                continue
+            excess = self._pending_chars - self.max_pending_chars
+            cut = min(excess, len(item[1]))
+            # 行の途中で切らないよう、次の改行までまとめて落とす
+            newline = item[1].find("\n", cut - 1)
+            if newline != -1:
+                cut = newline + 1
+            item[1] = item[1][cut:]
+            self._pending_chars -= cut
+            self._omitted += cut
+            self.dropped_chars += cut
+        self._queue = deque(item for item in self._queue if item[1])
+
+    def _worker(self):
+        """送信スレッド本体"""
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    break
+                kind, content, droppable = self._queue.popleft()
+                if droppable:
+                    self._pending_chars -= len(content)
+                    if self._omitted:
+                        content = f"…（Slackへの送信が追いつかないため{self._omitted}文字省略）\n{content}"
+                        self._omitted = 0
+                self._busy = True
+            try:
+                self.send(kind, content)
+                self.sent += 1
+            except Exception as e:
+                logging.exception("Failed to send %s message: %s", kind, e)
+            finally:
+                with self._cond:
+                    self._busy = False
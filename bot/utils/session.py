@@ -1,7 +1,14 @@
 """
 ユーティリティ関数モジュール
 """
+import re
+import json
 import uuid
+import logging
+import threading
+from pathlib import Path
+
+from ..config import CLAUDE_CONFIG_DIR
 
 
 def thread_ts_to_session_id(thread_ts: str) -> str:
@@ -18,3 +25,71 @@ def thread_ts_to_session_id(thread_ts: str) -> str:
     # thread_tsをハッシュ化してUUIDv5を生成
     namespace = uuid.UUID('6ba7b810-9dad-11d1-80b4-00c04fd430c8')  # DNS namespace UUID
     return str(uuid.uuid5(namespace, thread_ts))
+
+
+def session_exists(session_id: str, cwd: str) -> bool:
+    """
+    Claude CLIにセッションの記録が残っているかを確認
+    CLIは ~/.claude/projects/<作業ディレクトリ>/<session_id>.jsonl に会話を保存する
+
+    Args:
+        session_id: セッションID
+        cwd: Claude CLIを実行する作業ディレクトリ
+
+    Returns:
+        セッションを再開できるならTrue
+    """
+    # CLIは作業ディレクトリの英数字以外を"-"に置き換えてディレクトリ名にする
+    project_dir = re.sub(r"[^a-zA-Z0-9]", "-", str(Path(cwd).resolve()))
+    transcript = Path(CLAUDE_CONFIG_DIR) / "projects" / project_dir / f"{session_id}.jsonl"
+    return transcript.is_file()
+
+
+class SessionMap:
+    """
+    スレッドとセッションIDの対応表
+    プールの起動済みプロセスはスレッドから導出したIDではなく起動時に決めたIDで会話するため、
+    同じスレッドで再開できるよう対応をJSONファイルに保存しておく
+    """
+
+    def __init__(self, path: str | None, max_entries: int = 5000):
+        """
+        Args:
+            path: 保存先のJSONファイル（Noneならメモリ上のみ）
+            max_entries: 保持する対応の上限（超えた分は古い順に削除）
+        """
+        self.path = Path(path) if path else None
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._map = {}
+        if self.path and self.path.is_file():
+            try:
+                self._map = json.loads(self.path.read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                logging.warning("Failed to load session map %s: %s", self.path, e)
+
+    def get(self, thread_ts: str) -> str | None:
+        """スレッドに紐付いたセッションIDを取得"""
+        with self._lock:
+            return self._map.get(thread_ts)
+
+    def set(self, thread_ts: str, session_id: str):
+        """スレッドにセッションIDを紐付けて保存"""
+        with self._lock:
+            self._map.pop(thread_ts, None)
+            self._map[thread_ts] = session_id
+            while len(self._map) > self.max_entries:
+                self._map.pop(next(iter(self._map)))
+            if self.path is None:
+                return
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = self.path.with_suffix(".tmp")
+                tmp.write_text(json.dumps(self._map), encoding="utf-8")
+                tmp.replace(self.path)
+            except OSError as e:
+                logging.warning("Failed to save session map %s: %s", self.path, e)
+
+    def session_id_for(self, thread_ts: str) -> str:
+        """スレッドのセッションID（紐付けがなければスレッドIDから導出）"""
+        return self.get(thread_ts) or thread_ts_to_session_id(thread_ts)
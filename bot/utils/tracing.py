@@ -0,0 +1,235 @@
+"""
+トレーシングモジュール
+1件の依頼を「メンション受信 → 履歴取得 → Claude CLI実行 → Slack投稿」の区間（スパン）に分けて記録する
+TRACE_EXPORTER=file ではOpenTelemetryのスパンと同じ項目をJSONLファイルに書き出し、
+TRACE_EXPORTER=otlp ではOpenTelemetry SDK（別途インストール）経由でコレクターに送る
+"""
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+
+from ..config import TRACE_EXPORTER, TRACE_FILE, TRACE_SERVICE_NAME
+
+# 現在のスパン（with span(...) の中で設定され、子スパンの既定の親になる）
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """1つの処理区間"""
+
+    def __init__(self, tracer, name: str, parent=None, attributes: dict | None = None, start_time: float | None = None):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.attributes = dict(parent.inherited) if parent else {}
+        self.attributes.update(attributes or {})
+        self.events = []
+        self.status = "OK"
+        self.start_time = start_time if start_time is not None else time.time()
+        self.end_time = None
+        self._otel = tracer.start_otel(self) if tracer.otel else None
+
+    @property
+    def inherited(self) -> dict:
+        """子スパンに引き継ぐ属性（スレッド・セッションなど依頼を識別するもの）"""
+        return {k: v for k, v in self.attributes.items() if k.startswith("slack.") or k.startswith("claude.session")}
+
+    def set_attribute(self, key: str, value):
+        """属性を設定"""
+        self.attributes[key] = value
+        if self._otel is not None:
+            self._otel.set_attribute(key, value)
+
+    def add_event(self, name: str, **attributes):
+        """スパン内の出来事を時刻つきで記録（最初のトークン受信など）"""
+        self.events.append({"name": name, "time_unix_nano": int(time.time() * 1e9), "attributes": attributes})
+        if self._otel is not None:
+            self._otel.add_event(name, attributes)
+
+    def record_error(self, error: BaseException | str):
+        """エラーとして記録"""
+        self.status = "ERROR"
+        self.attributes["error.message"] = str(error)
+        if isinstance(error, BaseException):
+            self.attributes["error.type"] = type(error).__name__
+
+    def end(self, end_time: float | None = None):
+        """スパンを終了してエクスポート（2回目以降は何もしない）"""
+        if self.end_time is not None:
+            return
+        self.end_time = end_time if end_time is not None else time.time()
+        self.tracer.export(self)
+
+    def to_dict(self) -> dict:
+        """OpenTelemetryのスパンに対応する辞書"""
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent.span_id if self.parent else None,
+            "start_time_unix_nano": int(self.start_time * 1e9),
+            "end_time_unix_nano": int(self.end_time * 1e9),
+            "duration_ms": round((self.end_time - self.start_time) * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+            "events": self.events,
+            "resource": {"service.name": self.tracer.service_name},
+        }
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        if exc is not None:
+            self.record_error(exc)
+        self.end()
+
+
+class _NoopSpan:
+    """トレーシング無効時のスパン（何もしない）"""
+
+    trace_id = None
+    span_id = None
+    inherited = {}
+
+    def set_attribute(self, key, value):
+        pass
+
+    def add_event(self, name, **attributes):
+        pass
+
+    def record_error(self, error):
+        pass
+
+    def end(self, end_time=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """スパンを作成し、終了したスパンをエクスポートするクラス"""
+
+    def __init__(self, exporter: str = "none", path: str | None = None, service_name: str = "claude-via-slack"):
+        """
+        Args:
+            exporter: none / file / otlp
+            path: fileエクスポーターの書き出し先
+            service_name: スパンに付けるサービス名
+        """
+        self.exporter = exporter
+        self.service_name = service_name
+        self.enabled = exporter in ("file", "otlp")
+        self.otel = None
+        self._file = None
+        self._lock = threading.Lock()
+
+        if exporter == "otlp":
+            self.otel = _create_otel_tracer(service_name)
+            if self.otel is None:
+                logging.warning("OpenTelemetry SDK is not available, writing traces to %s instead", path)
+                self.exporter = "file"
+        if self.exporter == "file" and path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+        elif exporter not in ("none", "file", "otlp"):
+            logging.warning("Unknown TRACE_EXPORTER: %s (tracing disabled)", exporter)
+
+    def start_span(self, name: str, parent=None, start_time: float | None = None, **attributes):
+        """
+        スパンを開始（終了は呼び出し側で end() するか with で囲む）
+
+        Args:
+            name: スパン名
+            parent: 親スパン（省略時は現在のスパン。別スレッドに渡すときは明示する）
+            start_time: 開始時刻（過去の時点から計測する場合）
+            **attributes: 属性（"."を含むキーは slack_thread_ts のように "_" で渡す）
+
+        Returns:
+            Span（無効時は何もしないスパン）
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        if parent is None:
+            parent = _current.get()
+        if parent is NOOP_SPAN:
+            parent = None
+        attrs = {_attribute_key(k): v for k, v in attributes.items() if v is not None}
+        return Span(self, name, parent, attrs, start_time)
+
+    def start_otel(self, span: Span):
+        """OpenTelemetry側の対応するスパンを開始"""
+        from opentelemetry import trace
+
+        context = None
+        if span.parent is not None and getattr(span.parent, "_otel", None) is not None:
+            context = trace.set_span_in_context(span.parent._otel)
+        return self.otel.start_span(
+            span.name, context=context, attributes=span.attributes, start_time=int(span.start_time * 1e9)
+        )
+
+    def export(self, span: Span):
+        """終了したスパンを書き出す"""
+        if span._otel is not None:
+            from opentelemetry.trace import Status, StatusCode
+
+            if span.status == "ERROR":
+                span._otel.set_status(Status(StatusCode.ERROR, span.attributes.get("error.message")))
+            span._otel.end(end_time=int(span.end_time * 1e9))
+            return
+        if self._file is None:
+            return
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+
+def _attribute_key(key: str) -> str:
+    """slack_thread_ts → slack.thread_ts のように最初の "_" を "." にする"""
+    prefix, sep, rest = key.partition("_")
+    return f"{prefix}.{rest}" if sep and prefix in ("slack", "claude", "job", "history", "error", "output") else key
+
+
+def _create_otel_tracer(service_name: str):
+    """OpenTelemetry SDK と OTLPエクスポーターがあればトレーサーを作る（なければNone）"""
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    except ImportError:
+        return None
+    # 送信先は OTEL_EXPORTER_OTLP_ENDPOINT などの標準の環境変数で指定する
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    return trace.get_tracer("claude-via-slack")
+
+
+def current_span():
+    """現在のスパン（なければNone）"""
+    return _current.get()
+
+
+TRACER = Tracer(TRACE_EXPORTER, TRACE_FILE, TRACE_SERVICE_NAME)
+
+
+def start_span(name: str, parent=None, start_time: float | None = None, **attributes):
+    """TRACER.start_span のショートカット"""
+    return TRACER.start_span(name, parent=parent, start_time=start_time, **attributes)